@@ -15,7 +15,7 @@ class LocalContext:
         response = None
         while response is None:
             try:
-                response = downstream_message_bus.get_response(
+                response = downstream_message_bus.get_shared_response(
                     t.context_request_queue(downstream_message_bus.id), request, timeout=10
                 )
             except TimeoutError:
@@ -34,7 +34,7 @@ class LocalContext:
         response = None
         while response is None:
             try:
-                response = downstream_message_bus.get_response(
+                response = downstream_message_bus.get_shared_response(
                     t.context_request_queue(downstream_message_bus.id), request, timeout=10
                 )
             except TimeoutError:
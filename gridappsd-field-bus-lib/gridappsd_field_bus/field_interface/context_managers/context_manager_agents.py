@@ -25,7 +25,7 @@ class SubstationAreaContextManager(SubstationAgent):
         substation_dict: dict[str, Any] | None = None,
         simulation_id: str | None = None,
     ):
-        self.ot_connection = GridAPPSD()
+        self.ot_connection = GridAPPSD(share_connection=True)
         if substation_dict is None:
             request = {"request_type": "get_context", "areaId": downstream_message_bus_def.id}
             substation_dict = None
@@ -64,7 +64,7 @@ class FeederAreaContextManager(FeederAgent):
         feeder_dict: dict[str, Any] | None = None,
         simulation_id: str | None = None,
     ):
-        self.ot_connection = GridAPPSD()
+        self.ot_connection = GridAPPSD(share_connection=True)
         if feeder_dict is None:
             request = {"request_type": "get_context", "areaId": downstream_message_bus_def.id}
             feeder_dict = None
@@ -127,7 +127,7 @@ class SwitchAreaContextManager(SwitchAreaAgent):
         switch_area_dict: dict[str, Any] | None = None,
         simulation_id: str | None = None,
     ):
-        self.ot_connection = GridAPPSD()
+        self.ot_connection = GridAPPSD(share_connection=True)
         if switch_area_dict is None:
             request = {"request_type": "get_context", "areaId": downstream_message_bus_def.id}
             switch_area_dict = self.ot_connection.get_response(REQUEST_FIELD, request, timeout=10)["data"]
@@ -184,7 +184,7 @@ class SecondaryAreaContextManager(SecondaryAreaAgent):
         secondary_area_dict: dict[str, Any] | None = None,
         simulation_id: str | None = None,
     ):
-        self.ot_connection = GridAPPSD()
+        self.ot_connection = GridAPPSD(share_connection=True)
         if secondary_area_dict is None:
             request = {"request_type": "get_context", "areaId": downstream_message_bus_def.id}
             secondary_area_dict = self.ot_connection.get_response(REQUEST_FIELD, request, timeout=10)["data"]
@@ -1,8 +1,12 @@
+import logging
 import stomp
 import json
 import time
 from gridappsd import GridAPPSD
-from gridappsd import topics
+from gridappsd import compression, topics
+from gridappsd.compression import CONTENT_ENCODING_HEADER
+from gridappsd.message import MessageEnvelope
+from gridappsd.payload_encoding import CONTENT_TYPE_HEADER
 
 try:
     from importlib.metadata import version as _pkg_version
@@ -19,6 +23,28 @@ import cimgraph.data_profile.cimhub_ufls as cim
 
 REQUEST_FIELD = ".".join((topics.PROCESS_PREFIX, "request.field"))
 
+_log = logging.getLogger(__name__)
+
+
+def _forwarded(message: MessageEnvelope):
+    """Return the headers and body to send a raw message from the OT bus on with.
+
+    The content-type goes along so binary bodies stay decodable.  The client
+    hands raw bodies over already decompressed, so a body that arrived
+    compressed is compressed again with the algorithm it arrived with.
+    """
+    headers = {}
+    body = message.raw
+    content_type = message.headers.get(CONTENT_TYPE_HEADER)
+    if content_type is not None:
+        headers[CONTENT_TYPE_HEADER] = content_type
+    algorithm = message.headers.get(CONTENT_ENCODING_HEADER)
+    if algorithm is not None:
+        data = body.encode("utf-8") if isinstance(body, str) else body
+        body = compression.compress(algorithm, data)
+        headers[CONTENT_ENCODING_HEADER] = algorithm
+    return headers, body
+
 
 class FieldListener:
     def __init__(self, ot_connection: GridAPPSD, proxy_connection: stomp.Connection):
@@ -33,7 +59,7 @@ class FieldListener:
         else:
             headers, message = args[0], args[1]
         try:
-            print(f"Received message at Proxy. destination: {headers['destination']}, message: {headers}")
+            _log.debug(f"Received message at Proxy. destination: {headers['destination']}, message: {headers}")
 
             if headers["destination"] == topics.field_output_topic():
                 self.ot_connection.send(topics.field_output_topic(), message)
@@ -52,10 +78,10 @@ class FieldListener:
                     self.proxy_connection.send(headers["reply-to"], json.dumps(response))
 
             else:
-                print(f"Unrecognized message received by Proxy: {message}")
+                _log.warning(f"Unrecognized message received by Proxy: {message}")
 
         except Exception as e:
-            print(f"Error processing message: {e}")
+            _log.error(f"Error processing message: {e}")
 
 
 class FieldProxyForwarder:
@@ -80,14 +106,14 @@ class FieldProxyForwarder:
         self.proxy_connection.set_listener("", FieldListener(self.ot_connection, self.proxy_connection))
         self.proxy_connection.connect(self.username, self.password, wait=True)
 
-        print("Connected to Proxy")
+        _log.info("Connected to Proxy")
 
         # Subscribe to messages from field
         self.proxy_connection.subscribe(destination=topics.BASE_FIELD_TOPIC + ".*", id=1, ack="auto")
         self.proxy_connection.subscribe(destination="goss.gridappsd.process.request.*", id=2, ack="auto")
 
         # Subscribe to messages on OT bus
-        self.ot_connection.subscribe(topics.field_input_topic(), self.on_message_from_ot)
+        self.ot_connection.subscribe(topics.field_input_topic(), self.on_message_from_ot, raw=True)
 
         os.environ["CIMG_CIM_PROFILE"] = "cimhub_ufls"
         os.environ["CIMG_URL"] = "http://localhost:8889/bigdata/namespace/kb/sparql"
@@ -104,26 +130,32 @@ class FieldProxyForwarder:
 
         for substation in self.network.graph.get(cim.Substation, {}).values():
             mrid = substation.mRID  # type: ignore[attr-defined]
-            print(f"Subscribing to Substation: /topic/goss.gridappsd.field.{mrid}")
-            self.ot_connection.subscribe("/topic/goss.gridappsd.field." + mrid, self.on_message_from_ot)
+            _log.info(f"Subscribing to Substation: /topic/goss.gridappsd.field.{mrid}")
+            self.ot_connection.subscribe("/topic/goss.gridappsd.field." + mrid, self.on_message_from_ot, raw=True)
 
         # self.ot_connection.subscribe(topics.BASE_FIELD_TOPIC, self.on_message_from_ot)
 
-    def on_message_from_ot(self, headers, message):
-        "Receives messages coming from OT bus (GridAPPS-D) and forwards to Proxy bus"
+    def on_message_from_ot(self, headers, message: MessageEnvelope):
+        """Receives messages coming from OT bus (GridAPPS-D) and forwards to Proxy bus
+
+        Subscribed with raw=True: the body is forwarded exactly as received,
+        with its content-type and content-encoding, and is never decoded.
+        """
         try:
-            print(f"Received message from OT: {message}")
+            _log.debug(f"Received message from OT: {headers['destination']}")
 
             if headers["destination"] == topics.field_input_topic():
-                self.proxy_connection.send(topics.field_input_topic(), json.dumps(message))
+                forward_headers, body = _forwarded(message)
+                self.proxy_connection.send(topics.field_input_topic(), body, headers=forward_headers)
 
             elif "goss.gridappsd.field" in headers["destination"]:
-                self.proxy_connection.send(headers["destination"], json.dumps(message))
+                forward_headers, body = _forwarded(message)
+                self.proxy_connection.send(headers["destination"], body, headers=forward_headers)
             else:
-                print(f"Unrecognized message received by OT: {message}")
+                _log.warning(f"Unrecognized message received by OT: {message.raw}")
 
         except Exception as e:
-            print(f"Error processing message: {e}")
+            _log.error(f"Error processing message: {e}")
 
 
 if __name__ == "__main__":
@@ -13,6 +13,14 @@ class GridAPPSDMessageBus(FieldMessageBus):
         self._password = definition.connection_args["GRIDAPPSD_PASSWORD"]
         self._address = definition.connection_args["GRIDAPPSD_ADDRESS"]
         self._use_auth_token = definition.connection_args.get("GRIDAPPSD_USE_TOKEN_AUTH", False)
+        # Optional mapping of topic to binary payload encoding, e.g.
+        # {"goss.gridappsd.field.>": "application/msgpack"}.
+        encodings: Any = definition.connection_args.get("GRIDAPPSD_PAYLOAD_ENCODINGS") or {}
+        self._payload_encodings: dict[str, str | None] = dict(encodings)
+        # Optional mapping of topic to compression algorithm for large bodies,
+        # e.g. {"goss.gridappsd.field.>": "zlib"}.
+        algorithms: Any = definition.connection_args.get("GRIDAPPSD_COMPRESSION") or {}
+        self._compression: dict[str, str | None] = dict(algorithms)
 
         self.gridappsd_obj = None
 
@@ -29,7 +37,29 @@ class GridAPPSDMessageBus(FieldMessageBus):
         """
         Connect to the concrete message bus that implements this interface.
         """
-        self.gridappsd_obj = GridAPPSD(use_auth_token=self._use_auth_token)
+        # Buses in one process share a single STOMP connection, which
+        # reconnects on its own after a broker restart.
+        self.gridappsd_obj = GridAPPSD(use_auth_token=self._use_auth_token, share_connection=True, auto_reconnect=True)
+        for topic, content_type in self._payload_encodings.items():
+            self.gridappsd_obj.set_payload_encoding(topic, content_type)
+        for topic, algorithm in self._compression.items():
+            self.gridappsd_obj.set_compression(topic, algorithm)
+
+    def set_payload_encoding(self, topic, content_type):
+        """
+        Send messages for topic in a binary encoding such as "application/msgpack", or as JSON when None.
+        """
+        self._payload_encodings[topic] = content_type
+        if self.gridappsd_obj is not None:
+            self.gridappsd_obj.set_payload_encoding(topic, content_type)
+
+    def set_compression(self, topic, algorithm):
+        """
+        Compress large messages for topic with algorithm such as "zlib", or not at all when None.
+        """
+        self._compression[topic] = algorithm
+        if self.gridappsd_obj is not None:
+            self.gridappsd_obj.set_compression(topic, algorithm)
 
     def subscribe(self, topic, callback):
         if self.gridappsd_obj is not None:
@@ -52,6 +82,14 @@ class GridAPPSDMessageBus(FieldMessageBus):
         if self.gridappsd_obj is not None:
             return self.gridappsd_obj.get_response(topic, message, timeout)
 
+    def get_shared_response(self, topic, message, timeout=5):
+        """
+        Sends a message on a specific concrete queue and returns the response,
+        sharing the response of an identical request already in flight
+        """
+        if self.gridappsd_obj is not None:
+            return self.gridappsd_obj.get_shared_response(topic, message, timeout)
+
     def disconnect(self):
         """
         Disconnect from the concrete message bus.
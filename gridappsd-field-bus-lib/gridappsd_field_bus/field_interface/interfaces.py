@@ -176,6 +176,13 @@ class FieldMessageBus:
         Sends a message on a specific queue, waits and returns the response
         """
 
+    def get_shared_response(self, topic, message, timeout):
+        """
+        Like get_response, but concurrent identical requests may share one response.
+        Message buses that cannot coalesce requests send each one.
+        """
+        return self.get_response(topic, message, timeout)
+
     def get_agent_response(self, agent_id, message, timeout):
         """
         Sends a message on a specific agent's request queue, waits and returns the response
@@ -0,0 +1,48 @@
+import zlib
+
+import pytest
+
+from gridappsd import topics
+from gridappsd.message import MessageEnvelope
+
+field_proxy_forwarder = pytest.importorskip("gridappsd_field_bus.field_interface.field_proxy_forwarder")
+
+
+class RecordingConnection:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, destination, body, headers=None):
+        self.sent.append((destination, body, headers))
+
+
+def _forwarder():
+    # Skip __init__, which connects to both buses and the model database.
+    forwarder = field_proxy_forwarder.FieldProxyForwarder.__new__(field_proxy_forwarder.FieldProxyForwarder)
+    forwarder.proxy_connection = RecordingConnection()
+    return forwarder
+
+
+def test_binary_payload_is_forwarded_with_its_content_type():
+    forwarder = _forwarder()
+    body = b"\xa1\x65value\x01\xff\x00"
+    headers = {"destination": topics.field_input_topic(), "content-type": "application/cbor"}
+
+    forwarder.on_message_from_ot(headers, MessageEnvelope(headers, body))
+
+    assert forwarder.proxy_connection.sent == [(topics.field_input_topic(), body, {"content-type": "application/cbor"})]
+
+
+def test_compressed_payload_is_forwarded_compressed():
+    forwarder = _forwarder()
+    destination = "/topic/goss.gridappsd.field._substation_"
+    body = '{"value": 1}'
+    headers = {"destination": destination, "content-encoding": "zlib"}
+
+    # The client decompresses raw bodies before handing them to callbacks.
+    forwarder.on_message_from_ot(headers, MessageEnvelope(headers, body))
+
+    [(sent_to, sent_body, sent_headers)] = forwarder.proxy_connection.sent
+    assert sent_to == destination
+    assert sent_headers == {"content-encoding": "zlib"}
+    assert zlib.decompress(sent_body).decode("utf-8") == body
@@ -0,0 +1,59 @@
+"""Measure CallbackRouter dispatch throughput without a broker.
+
+Messages are fed straight into CallbackRouter.on_message, the way stomp's
+receiver thread delivers them, spread over a number of topics.  The run
+reports how many messages per second reach the subscribed callbacks.
+
+Usage:
+
+    python benchmarks/bench_callback_router.py --messages 50000 --topics 8 --workers 1 4
+"""
+
+import argparse
+import threading
+import time
+
+from gridappsd import json_extension as json
+from gridappsd.goss import CallbackRouter
+
+
+def run(messages, topics, workers, collect_metrics=True):
+    router = CallbackRouter(workers=workers, collect_metrics=collect_metrics)
+    done = threading.Event()
+    received = [0]
+    lock = threading.Lock()
+
+    def on_message(headers, message):
+        with lock:
+            received[0] += 1
+            if received[0] == messages:
+                done.set()
+
+    destinations = ["/topic/goss.gridappsd.bench.{}".format(i) for i in range(topics)]
+    for destination in destinations:
+        router.add_callback(destination, on_message)
+
+    body = json.dumps({"message": {"timestamp": 1, "measurements": {"m1": {"magnitude": 1.0, "angle": 0.0}}}})
+
+    start = time.perf_counter()
+    for i in range(messages):
+        router.on_message({"destination": destinations[i % topics]}, body)
+    done.wait()
+    elapsed = time.perf_counter() - start
+    return messages / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--topics", type=int, default=8)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    opts = parser.parse_args()
+
+    for workers in opts.workers:
+        rate = run(opts.messages, opts.topics, workers)
+        print("workers={:<3} {:>10.0f} msg/s".format(workers, rate))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Measure JSON decode and encode throughput of the message codecs.
+
+The payload mimics a simulation output message for a feeder of the given
+size: three measurements per node, each with a magnitude and angle, and every
+--complex-every'th node's measurements also carry a complex value (0 for none).  The ``legacy`` row is the
+exception-probing object hook json_extension used before the codecs.
+
+Usage:
+
+    python benchmarks/bench_codec.py --nodes 9500 --repeat 5 --complex-every 10
+"""
+
+import argparse
+import dataclasses
+import json as _json
+import random
+import time
+
+from gridappsd import codec
+
+
+@dataclasses.dataclass
+class _JsonComplex:
+    real: float
+    imag: float
+
+
+def _legacy_hook(obj):
+    rv = obj
+    if isinstance(obj, dict):
+        try:
+            instance = _JsonComplex(**obj)
+            rv = complex(instance.real, instance.imag)
+        except (TypeError, KeyError):
+            rv = obj
+    return rv
+
+
+class _LegacyCodec(codec.StdlibCodec):
+    name = "legacy"
+
+    def loads(self, data):
+        return _json.loads(data, object_hook=_legacy_hook)
+
+
+def build_message(nodes, complex_every=10, seed=0):
+    rng = random.Random(seed)
+    measurements = {}
+    for node in range(nodes):
+        for phase in "ABC":
+            mrid = "_{:08X}-{:04X}-{}".format(node, rng.randrange(0xFFFF), phase)
+            measurement = dict(measurement_mrid=mrid, magnitude=rng.uniform(110, 130), angle=rng.uniform(-180, 180))
+            if complex_every and node % complex_every == 0:
+                measurement["value"] = complex(rng.uniform(-1, 1), rng.uniform(-1, 1))
+            measurements[mrid] = measurement
+    return dict(simulation_id="1234567890", message=dict(timestamp=1700000000, measurements=measurements))
+
+
+def run(instance, message, repeat):
+    encoded = instance.dumps(message)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        decoded = instance.loads(encoded)
+    decode = (time.perf_counter() - start) / repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        instance.dumps(decoded)
+    encode = (time.perf_counter() - start) / repeat
+    return len(encoded), decode, encode
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=9500)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--complex-every", type=int, default=10)
+    opts = parser.parse_args()
+
+    message = build_message(opts.nodes, opts.complex_every)
+    codecs = [_LegacyCodec()] + [codec.create_codec(name) for name in codec.available_codecs()]
+    for instance in codecs:
+        size, decode, encode = run(instance, message, opts.repeat)
+        print(
+            "{:<8} {:>6.1f} MB  decode {:>7.1f} ms {:>6.1f} MB/s  encode {:>7.1f} ms".format(
+                instance.name, size / 1e6, decode * 1e3, size / decode / 1e6, encode * 1e3
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Measure the size reduction and CPU cost of compressing large message bodies.
+
+The payload is the simulation output message of benchmarks/bench_codec.py,
+JSON encoded, which like model query responses and field context
+dictionaries is dominated by repeated mRID strings.  --link-mbps estimates
+what each algorithm saves on a constrained link to a remote field proxy.
+
+Usage:
+
+    python benchmarks/bench_compression.py --nodes 9500 --repeat 5 --link-mbps 10
+"""
+
+import argparse
+import time
+
+from bench_codec import build_message
+
+from gridappsd import codec, compression
+
+
+def run(algorithm, data, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        compressed = compression.compress(algorithm, data)
+    compress = (time.perf_counter() - start) / repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        compression.decompress(algorithm, compressed)
+    decompress = (time.perf_counter() - start) / repeat
+    return len(compressed), compress, decompress
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=9500)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--link-mbps", type=float, default=10.0)
+    opts = parser.parse_args()
+
+    data = codec.dumps(build_message(opts.nodes)).encode("utf-8")
+    link = opts.link_mbps * 1e6 / 8
+    print("{:<6} {:>6.2f} MB  transfer {:>7.1f} ms".format("none", len(data) / 1e6, len(data) / link * 1e3))
+    for algorithm in compression.available_algorithms():
+        size, compress, decompress = run(algorithm, data, opts.repeat)
+        total = compress + size / link + decompress
+        print(
+            "{:<6} {:>6.2f} MB  ratio {:>5.1f}  compress {:>6.1f} ms  decompress {:>6.1f} ms  transfer {:>7.1f} ms".format(
+                algorithm, size / 1e6, len(data) / size, compress * 1e3, decompress * 1e3, total * 1e3
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Measure the overhead of collecting message metrics.
+
+Runs the CallbackRouter dispatch benchmark of bench_callback_router.py with
+and without metrics collection, and times the individual recording calls a
+message costs on its way in.
+
+Usage:
+
+    python benchmarks/bench_metrics.py --messages 50000 --topics 8 --rounds 3
+"""
+
+import argparse
+import time
+
+from bench_callback_router import run
+
+from gridappsd.metrics import MessageMetrics
+
+
+def time_recording(calls):
+    metrics = MessageMetrics()
+    body = "x" * 512
+    destinations = ["/topic/goss.gridappsd.bench.{}".format(i) for i in range(8)]
+    start = time.perf_counter()
+    for i in range(calls):
+        destination = destinations[i & 7]
+        metrics.count_received(destination, body)
+        metrics.observe_dispatch(destination, 0.0001, 0.0002, 0.0003)
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--topics", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=3)
+    opts = parser.parse_args()
+
+    per_message = time_recording(opts.messages)
+    print("recording per received message {:>6.2f} µs".format(per_message * 1e6))
+    rates = {}
+    for collect_metrics in (False, True):
+        # Best of several rounds, as thread scheduling makes single runs noisy.
+        rates[collect_metrics] = max(run(opts.messages, opts.topics, 1, collect_metrics) for _ in range(opts.rounds))
+        print("metrics={:<5} {:>10.0f} msg/s".format(str(collect_metrics), rates[collect_metrics]))
+    overhead = 1 / rates[True] - 1 / rates[False]
+    print("overhead per dispatched message {:>6.2f} µs".format(overhead * 1e6))
+
+
+if __name__ == "__main__":
+    main()
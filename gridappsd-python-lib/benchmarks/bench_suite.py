@@ -0,0 +1,327 @@
+"""Measure client throughput, latency and memory against stored baselines.
+
+Every case runs with the synthetic simulation output message of
+benchmarks/bench_codec.py for 13, 123 and 9500 node feeders.  Cases that
+use the message bus run against an in-process
+:class:`~gridappsd.loopback.LoopbackBroker`, so no platform is needed:
+
+``json_decode`` / ``json_encode``
+    json_extension loads and dumps of the message.
+``difference_message``
+    DifferenceBuilder.get_message for one difference per measurement,
+    encoded as JSON the way GOSS.send encodes it.
+``send``
+    GOSS.send of the message to a topic nobody subscribes to.
+``dispatch``
+    GOSS.send to a topic another client subscribes to, until its callback
+    runs.
+``get_response``
+    GOSS.get_response round trips to a broker responder that echoes the
+    message.
+``onmeasurement``
+    Simulation output messages through a Simulation's measurement callback.
+
+Each case reports operations per second, p50 and p99 latency in
+milliseconds and the peak memory traced while running it.  For dispatch and
+onmeasurement, throughput is measured with messages sent back to back and
+latency with one message in flight at a time.
+
+Results are compared with benchmarks/baselines.json and cases whose
+throughput fell by more than --tolerance are flagged.  Baselines depend on
+the machine; refresh them with --save after a deliberate change and commit
+the file along with it.
+
+Usage:
+
+    python benchmarks/bench_suite.py --seconds 1 --sizes 13 123 9500
+    python benchmarks/bench_suite.py --cases dispatch get_response --check
+    python benchmarks/bench_suite.py --save
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+from bench_codec import build_message
+
+from gridappsd import GOSS, GridAPPSD, codec, json_extension
+from gridappsd import topics as t
+from gridappsd.difference_builder import DifferenceBuilder
+from gridappsd.loopback import LoopbackBroker
+from gridappsd.simulation import Simulation
+
+BASELINES = Path(__file__).with_name("baselines.json")
+
+SIZES = (13, 123, 9500)
+
+_USER, _PASSWORD = "system", "manager"
+
+
+class _Receiver(object):
+    """A callback that counts the messages it receives."""
+
+    def __init__(self):
+        self.count = 0
+        self._condition = threading.Condition()
+
+    def __call__(self, *args):
+        with self._condition:
+            self.count += 1
+            self._condition.notify_all()
+
+    def wait_for(self, count, timeout=60.0):
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.count >= count, timeout):
+                raise RuntimeError("Only {} of {} messages arrived".format(self.count, count))
+
+    def settle(self, send):
+        """Send until a message arrives, so the subscription is known to be in place."""
+        deadline = time.monotonic() + 10
+        while self.count == 0:
+            if time.monotonic() > deadline:
+                raise RuntimeError("The subscription never received a message")
+            send()
+            time.sleep(0.05)
+        # Let stragglers of the handshake arrive before counting starts.
+        time.sleep(0.2)
+
+
+def _delivered(send, receiver):
+    """Return an operation that sends one message and waits for it to arrive."""
+
+    def operation():
+        expected = receiver.count + 1
+        send()
+        receiver.wait_for(expected)
+
+    return operation
+
+
+def _flood(send, receiver):
+    """Return a function sending back to back for some seconds, returning the messages per second delivered."""
+
+    def flood(seconds):
+        expected = receiver.count
+        start = time.perf_counter()
+        deadline = start + seconds
+        sent = 0
+        while sent < 5 or time.perf_counter() < deadline:
+            send()
+            sent += 1
+        receiver.wait_for(expected + sent)
+        return sent / (time.perf_counter() - start)
+
+    return flood
+
+
+class _Bus(object):
+    """A loopback broker with a sending and a receiving client."""
+
+    def __init__(self):
+        self.broker = LoopbackBroker().start()
+        # Environment variables take precedence over constructor arguments.
+        os.environ.update(self.broker.environment())
+        self.sender = self.client()
+        self.receiver = self.client()
+
+    def client(self, client_class=GOSS):
+        return client_class(
+            username=_USER, password=_PASSWORD, stomp_address=self.broker.host, stomp_port=self.broker.port
+        )
+
+    def close(self):
+        self.sender.disconnect()
+        self.receiver.disconnect()
+        self.broker.stop()
+
+
+@contextlib.contextmanager
+def json_decode(bus, message):
+    text = json_extension.dumps(message)
+    yield lambda: json_extension.loads(text), None
+
+
+@contextlib.contextmanager
+def json_encode(bus, message):
+    yield lambda: json_extension.dumps(message), None
+
+
+@contextlib.contextmanager
+def difference_message(bus, message):
+    builder = DifferenceBuilder("1234567890")
+    for mrid, measurement in message["message"]["measurements"].items():
+        builder.add_difference(mrid, "PowerElectronicsConnection.p", measurement["magnitude"], measurement["angle"])
+    yield lambda: codec.dumps(builder.get_message(epoch=0)), None
+
+
+@contextlib.contextmanager
+def send(bus, message):
+    yield lambda: bus.sender.send("/topic/goss.gridappsd.bench.send", message), None
+
+
+@contextlib.contextmanager
+def dispatch(bus, message):
+    topic = "/topic/goss.gridappsd.bench.dispatch"
+    receiver = _Receiver()
+    subscription = bus.receiver.subscribe(topic, receiver)
+
+    def send_one():
+        bus.sender.send(topic, message)
+
+    try:
+        receiver.settle(send_one)
+        yield _delivered(send_one, receiver), _flood(send_one, receiver)
+    finally:
+        bus.receiver.unsubscribe(subscription)
+
+
+@contextlib.contextmanager
+def get_response(bus, message):
+    topic = "goss.gridappsd.bench.echo"
+    bus.broker.add_responder(topic, lambda headers, request: request)
+    try:
+        yield lambda: bus.sender.get_response(topic, message, timeout=60), None
+    finally:
+        bus.broker.remove_responder(topic)
+
+
+@contextlib.contextmanager
+def onmeasurement(bus, message):
+    bus.broker.add_responder(t.REQUEST_SIMULATION, lambda headers, request: {"simulationId": "1234567890"})
+    gapps = bus.client(GridAPPSD)
+    receiver = _Receiver()
+    simulation = Simulation(gapps, {"simulation_config": {"duration": 60}})
+    simulation.add_onmeasurement_callback(receiver)
+    simulation.start_simulation()
+    topic = t.simulation_output_topic(simulation.simulation_id)
+
+    def send_one():
+        bus.sender.send(topic, message)
+
+    try:
+        receiver.settle(send_one)
+        yield _delivered(send_one, receiver), _flood(send_one, receiver)
+    finally:
+        gapps.disconnect()
+        bus.broker.remove_responder(t.REQUEST_SIMULATION)
+
+
+CASES = {
+    case.__name__: case
+    for case in (json_decode, json_encode, difference_message, send, dispatch, get_response, onmeasurement)
+}
+
+# Cases that need a broker.
+_BUS_CASES = ("send", "dispatch", "get_response", "onmeasurement")
+
+
+def _time_calls(operation, seconds, min_calls=5):
+    """Call operation repeatedly for about seconds; return the duration of each call."""
+    durations = []
+    deadline = time.perf_counter() + seconds
+    while len(durations) < min_calls or time.perf_counter() < deadline:
+        start = time.perf_counter()
+        operation()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def _peak_memory(operation, calls=3):
+    """Return the peak bytes allocated by the Python heap while calling operation a few times."""
+    tracemalloc.start()
+    try:
+        for _ in range(calls):
+            operation()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_case(name, bus, message, seconds):
+    with CASES[name](bus, message) as (operation, flood):
+        operation()
+        peak = _peak_memory(operation)
+        durations = sorted(_time_calls(operation, seconds))
+        rate = flood(seconds) if flood is not None else len(durations) / sum(durations)
+    return dict(
+        ops_per_s=round(rate, 1),
+        p50_ms=round(durations[len(durations) // 2] * 1e3, 4),
+        p99_ms=round(durations[min(len(durations) - 1, int(len(durations) * 0.99))] * 1e3, 4),
+        peak_kb=round(peak / 1024),
+    )
+
+
+def _load_baselines():
+    if not BASELINES.exists():
+        return {}
+    return json.loads(BASELINES.read_text())
+
+
+def _compare(result, baseline, tolerance):
+    """Return the throughput change from baseline as text and whether it is a regression."""
+    if not baseline:
+        return "", False
+    change = result["ops_per_s"] / baseline["ops_per_s"] - 1
+    regressed = change < -tolerance
+    return "{:+6.0%}{}".format(change, "  REGRESSION" if regressed else ""), regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--seconds", type=float, default=1.0, help="time spent measuring each case")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="throughput loss flagged as a regression")
+    parser.add_argument("--save", action="store_true", help="store the results as the new baselines")
+    parser.add_argument("--check", action="store_true", help="exit with status 1 if any case regressed")
+    opts = parser.parse_args()
+
+    stored = _load_baselines()
+    baselines = stored.get("results", {})
+    print("python {} on {}, codec {}".format(platform.python_version(), platform.machine(), codec.get_codec().name))
+    print(
+        "{:<20} {:>5} {:>11} {:>10} {:>10} {:>9}  {}".format(
+            "case", "nodes", "ops/s", "p50 ms", "p99 ms", "peak KB", "vs baseline"
+        )
+    )
+
+    bus = _Bus() if set(opts.cases) & set(_BUS_CASES) else None
+    results = {}
+    regressions = 0
+    try:
+        for size in opts.sizes:
+            message = build_message(size)
+            for name in opts.cases:
+                key = "{}/{}".format(name, size)
+                result = results[key] = run_case(name, bus, message, opts.seconds)
+                change, regressed = _compare(result, baselines.get(key), opts.tolerance)
+                regressions += regressed
+                print(
+                    "{:<20} {:>5} {:>11.1f} {:>10.3f} {:>10.3f} {:>9}  {}".format(
+                        name, size, result["ops_per_s"], result["p50_ms"], result["p99_ms"], result["peak_kb"], change
+                    )
+                )
+    finally:
+        if bus is not None:
+            bus.close()
+
+    if opts.save:
+        baselines.update(results)
+        stored = dict(python=platform.python_version(), machine=platform.machine(), results=baselines)
+        BASELINES.write_text(json.dumps(stored, indent=2, sort_keys=True) + "\n")
+        print("Saved baselines to {}".format(BASELINES))
+    if regressions:
+        print("{} case(s) more than {:.0%} slower than their baseline".format(regressions, opts.tolerance))
+        if opts.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -52,6 +52,7 @@ StrPath = typing.Union[str, pathlib.Path]
 from gridappsd.goss import GOSS as GOSS
 from gridappsd.utils import ProcessStatusEnum as ProcessStatusEnum
 from gridappsd.gridappsd import GridAPPSD as GridAPPSD
+from gridappsd.aio import AsyncGridAPPSD as AsyncGridAPPSD
 from gridappsd.difference_builder import DifferenceBuilder as DifferenceBuilder
 from gridappsd.app_registration import ApplicationController as ApplicationController
 from gridappsd import json_extension as json
@@ -0,0 +1,617 @@
+"""Asyncio client for GridAPPS-D.
+
+:class:`AsyncGridAPPSD` speaks STOMP 1.2 directly over an asyncio stream, so
+a single event loop can keep thousands of requests and subscriptions in
+flight without a thread per connection.  It shares the topic helpers in
+:mod:`gridappsd.topics`, the complex-aware JSON codec in
+:mod:`gridappsd.json_extension`, the token handshake and the request builders
+of :class:`~gridappsd.GridAPPSD`.
+
+Example:
+
+    async with AsyncGridAPPSD() as gapps:
+        models = await gapps.query_model_info()
+
+        async for headers, message in gapps.subscribe(t.simulation_output_topic(sim_id)):
+            ...
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import os
+import uuid
+from typing import Any, Callable
+
+from gridappsd import json_extension as json
+from gridappsd import compression, utils
+from gridappsd.goss import (
+    GRIDAPPSD_ENV_ENUM,
+    TOKEN_TOPIC,
+    TimeoutError,
+    _REPLY_QUEUE_PREFIX,
+    _connection_settings,
+    _decode_response,
+    _encode_payload,
+    _token_request,
+)
+from gridappsd.gridappsd import _QueryMixin
+from gridappsd.message import MessageEnvelope
+from gridappsd.compression import ACCEPT_ENCODING_HEADER, CompressionPolicy
+from gridappsd.payload_encoding import CONTENT_TYPE_HEADER, EncodingPolicy, text_body
+from gridappsd.stomp_frame import Frame, FrameParser, encode_frame
+from gridappsd.query_cache import default_query_cache
+from gridappsd.single_flight import request_key
+from gridappsd.token_cache import token_cache, token_key
+
+_log = logging.getLogger(__name__)
+
+_CLOSED = object()
+
+
+class StompError(Exception):
+    """Raised when the broker answers with an ERROR frame."""
+
+    def __init__(self, headers, body):
+        super().__init__(headers.get("message", "STOMP ERROR frame received"))
+        self.headers = headers
+        self.body = body
+
+
+class _AsyncStompConnection(object):
+    """One STOMP 1.2 session over an asyncio stream.
+
+    MESSAGE frames are handed to the handler registered for their
+    subscription id; handlers run on the event loop and must not block.
+    """
+
+    def __init__(self, host: str, port: int | str, heartbeat: int = 10000):
+        self._host = host
+        self._port = int(port)
+        self._heartbeat = heartbeat
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._read_task: asyncio.Task | None = None
+        self._heartbeat_task: asyncio.Task | None = None
+        self._connected: asyncio.Future | None = None
+        self._receipts: dict[str, asyncio.Future] = {}
+        self._handlers: dict[str, Callable[[dict[str, str], Any], None]] = {}
+        self._ids = itertools.count(1)
+        self._on_lost: list[Callable[[Exception | None], None]] = []
+        self.is_connected = False
+
+    async def connect(self, login: str, passcode: str):
+        loop = asyncio.get_running_loop()
+        self._reader, self._writer = await asyncio.open_connection(self._host, self._port)
+        self._connected = loop.create_future()
+        self._read_task = loop.create_task(self._read_loop())
+        await self._write(
+            Frame(
+                "CONNECT",
+                {
+                    "accept-version": "1.2",
+                    "host": self._host,
+                    "login": login,
+                    "passcode": passcode,
+                    "heart-beat": "{0},{0}".format(self._heartbeat),
+                },
+            )
+        )
+        headers = await self._connected
+        self.is_connected = True
+
+        # Send heart-beats at the rate both sides agreed on.
+        server_wants = int(headers.get("heart-beat", "0,0").split(",")[1])
+        if self._heartbeat and server_wants:
+            interval = max(self._heartbeat, server_wants) / 1000.0
+            self._heartbeat_task = loop.create_task(self._heartbeat_loop(interval))
+        return headers
+
+    def on_connection_lost(self, callback: Callable[[Exception | None], None]):
+        self._on_lost.append(callback)
+
+    async def _write(self, frame: Frame):
+        if self._writer is None:
+            raise ConnectionError("Not connected")
+        self._writer.write(encode_frame(frame))
+        await self._writer.drain()
+
+    async def _heartbeat_loop(self, interval: float):
+        while self.is_connected and self._writer is not None:
+            await asyncio.sleep(interval)
+            self._writer.write(b"\n")
+
+    async def _read_loop(self):
+        parser = FrameParser()
+        error: Exception | None = None
+        try:
+            while True:
+                data = await self._reader.read(65536)
+                if not data:
+                    break
+                for frame in parser.feed(data):
+                    self._handle_frame(frame)
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            error = e
+        finally:
+            self._lost(error)
+
+    def _handle_frame(self, frame: Frame):
+        if frame.command == "MESSAGE":
+            handler = self._handlers.get(frame.headers.get("subscription", ""))
+            if handler is None:
+                _log.error("INVALID DESTINATION {}".format(frame.headers.get("destination")))
+                return
+            try:
+                body = compression.decompress_body(frame.headers, frame.body)
+                handler(frame.headers, text_body(frame.headers, body))
+            except Exception:
+                _log.exception("Handler failed for {}".format(frame.headers.get("destination")))
+        elif frame.command == "CONNECTED":
+            if self._connected is not None and not self._connected.done():
+                self._connected.set_result(frame.headers)
+        elif frame.command == "RECEIPT":
+            future = self._receipts.pop(frame.headers.get("receipt-id", ""), None)
+            if future is not None and not future.done():
+                future.set_result(frame.headers)
+        elif frame.command == "ERROR":
+            error = StompError(frame.headers, text_body(frame.headers, frame.body))
+            _log.error("ERR: {}".format(frame.headers))
+            if self._connected is not None and not self._connected.done():
+                self._connected.set_exception(error)
+
+    def _lost(self, error: Exception | None):
+        was_connected = self.is_connected
+        self.is_connected = False
+        if self._connected is not None and not self._connected.done():
+            self._connected.set_exception(error or ConnectionError("Connection closed by broker"))
+        for future in self._receipts.values():
+            if not future.done():
+                future.set_exception(error or ConnectionError("Connection closed"))
+        self._receipts.clear()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+        if was_connected:
+            for callback in self._on_lost:
+                callback(error)
+
+    async def send(self, destination: str, body: str | bytes, headers: dict[str, Any] | None = None):
+        frame_headers = {k: str(v) for k, v in (headers or {}).items()}
+        frame_headers["destination"] = destination
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        await self._write(Frame("SEND", frame_headers, body or b""))
+
+    async def subscribe(self, destination: str, handler: Callable[[dict[str, str], Any], None]) -> str:
+        subscription_id = str(next(self._ids))
+        self._handlers[subscription_id] = handler
+        await self._write(Frame("SUBSCRIBE", {"destination": destination, "id": subscription_id, "ack": "auto"}))
+        return subscription_id
+
+    async def unsubscribe(self, subscription_id: str):
+        self._handlers.pop(subscription_id, None)
+        if self.is_connected:
+            await self._write(Frame("UNSUBSCRIBE", {"id": subscription_id}))
+
+    async def disconnect(self, timeout: float = 1.0):
+        if self.is_connected:
+            receipt = uuid.uuid4().hex
+            future = asyncio.get_running_loop().create_future()
+            self._receipts[receipt] = future
+            try:
+                await self._write(Frame("DISCONNECT", {"receipt": receipt}))
+                await asyncio.wait_for(future, timeout)
+            except (asyncio.TimeoutError, ConnectionError):
+                pass
+        self.is_connected = False
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except ConnectionError:
+                pass
+        if self._read_task is not None:
+            await asyncio.gather(self._read_task, return_exceptions=True)
+
+
+class Subscription(object):
+    """An async iterator over the messages of one topic.
+
+    Created by :meth:`AsyncGridAPPSD.subscribe`.  The SUBSCRIBE frame is sent
+    when iteration starts (or on ``await sub.start()``); each item is a
+    ``(headers, message)`` tuple with the message decoded like the threaded
+    client's callbacks receive it.
+
+    :param maxsize: number of undelivered messages buffered, 0 for unbounded.
+    """
+
+    def __init__(self, client: AsyncGridAPPSD, topic: str, maxsize: int = 0):
+        self._client = client
+        self.topic = topic
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self._subscription_id: str | None = None
+        self._closed = False
+
+    async def start(self):
+        if self._subscription_id is None and not self._closed:
+            conn = await self._client._connection()
+            self._subscription_id = await conn.subscribe(self.topic, self._on_message)
+            self._client._subscriptions.add(self)
+        return self
+
+    def _on_message(self, headers, body):
+        envelope = MessageEnvelope(headers, body)
+        try:
+            self._queue.put_nowait((headers, envelope.body))
+        except asyncio.QueueFull:
+            _log.warning("Subscription buffer full, dropping message for {}".format(self.topic))
+
+    def _end(self):
+        self._closed = True
+        if not self._queue.full():
+            # Wakes a reader waiting for the next message; none waits on a
+            # full buffer, and __anext__ ends once that is drained.
+            self._queue.put_nowait(_CLOSED)
+
+    async def close(self):
+        if self._closed:
+            return
+        if self._subscription_id is not None and self._client._conn is not None:
+            await self._client._conn.unsubscribe(self._subscription_id)
+        self._client._subscriptions.discard(self)
+        self._end()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await self.start()
+        if self._closed and self._queue.empty():
+            raise StopAsyncIteration
+        item = await self._queue.get()
+        if item is _CLOSED:
+            raise StopAsyncIteration
+        return item
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+class AsyncGridAPPSD(_QueryMixin):
+    """Asyncio counterpart of :class:`~gridappsd.GridAPPSD`.
+
+    Connection settings follow the threaded client, including the
+    GRIDAPPSD_USER, GRIDAPPSD_PASSWORD, GRIDAPPSD_ADDRESS and GRIDAPPSD_PORT
+    environment variables.  The connection is opened by :meth:`connect`,
+    ``async with``, or lazily by the first request.  All ``query_*`` methods
+    and :meth:`get_platform_status` are awaitable.
+
+    :param username: platform user name.
+    :param password: platform password.
+    :param address: (host, port) tuple, defaults to
+        :func:`gridappsd.utils.get_gridappsd_address`.
+    :param use_auth_token: authenticate with a token from the GOSS token
+        service instead of sending the password with every connection.
+    :param token_timeout: seconds to wait for the token service.
+    :param compression_threshold: bodies at least this many bytes long are
+        compressed on topics chosen with :meth:`set_compression`.
+    :param shared_reply_queue: receive all replies on one temporary queue
+        and match them by correlation-id instead of subscribing a reply
+        queue per request; only for responders that echo correlation-id.
+    :param query_cache: :class:`~gridappsd.query_cache.QueryCache` answering
+        repeated model queries, defaults to one in the GRIDAPPSD_QUERY_CACHE
+        directory when that is set.
+    """
+
+    def __init__(
+        self,
+        username=None,
+        password=None,
+        address=None,
+        use_auth_token=True,
+        token_timeout=10,
+        simulation_id=None,
+        compression_threshold=compression.DEFAULT_THRESHOLD,
+        shared_reply_queue=False,
+        query_cache=None,
+    ):
+        if address is None:
+            address = utils.get_gridappsd_address()
+        self.__user__, self.__pass__, self.stomp_address, self.stomp_port = _connection_settings(
+            username, password, address[0], address[1]
+        )
+        self.use_auth_token = use_auth_token
+        self.token_timeout = token_timeout
+        self._heartbeat = int(os.environ.get(GRIDAPPSD_ENV_ENUM.GRIDAPPSD_HEARTBEAT.value, 10000))
+        self._simulation_id = simulation_id or utils.get_gridappsd_simulation_id()
+        self._conn: _AsyncStompConnection | None = None
+        self._connect_lock: asyncio.Lock | None = None
+        self._token: str | None = None
+        self._reply_queue: str | None = None
+        self._pending_responses: dict[str, tuple[asyncio.Future, Any]] = {}
+        self._shared_requests: dict[str, asyncio.Future] = {}
+        self._subscriptions: set[Subscription] = set()
+        self._payload_encodings = EncodingPolicy()
+        self._compression = CompressionPolicy()
+        self.compression_threshold = compression_threshold
+        self.shared_reply_queue = shared_reply_queue
+        self.result_format = None
+        self.query_cache = query_cache if query_cache is not None else default_query_cache()
+
+    @property
+    def connected(self):
+        return self._conn is not None and self._conn.is_connected
+
+    def get_simulation_id(self):
+        return self._simulation_id
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.disconnect()
+
+    async def connect(self):
+        await self._connection()
+
+    async def _connection(self) -> _AsyncStompConnection:
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if not self.connected:
+                for attempt in range(2):
+                    if self.use_auth_token and not self._token:
+                        self._token = token_cache.get(self._token_key())
+                        if self._token is None:
+                            self._token = await self._fetch_token()
+                            token_cache.put(self._token_key(), self._token)
+                    conn = _AsyncStompConnection(self.stomp_address, self.stomp_port, self._heartbeat)
+                    try:
+                        if self.use_auth_token and self._token:
+                            await conn.connect(self._token, "")
+                        else:
+                            await conn.connect(self.__user__, self.__pass__)
+                        break
+                    except StompError:
+                        await conn.disconnect()
+                        if attempt or not (self.use_auth_token and self._token):
+                            raise
+                    # The cached token may have expired on the server; fetch a new one.
+                    _log.debug("Connecting with cached token failed, requesting a new token")
+                    token_cache.invalidate(self._token_key())
+                    self._token = None
+                conn.on_connection_lost(self._on_connection_lost)
+                self._conn = conn
+                # Temporary queues die with the connection that created them.
+                self._reply_queue = None
+            assert self._conn is not None
+            return self._conn
+
+    def _token_key(self):
+        return token_key(self.stomp_address, self.stomp_port, self.__user__, self.__pass__)
+
+    async def _fetch_token(self) -> str:
+        """Request an auth token from the GOSS token service over a temporary connection."""
+        reply_dest, body = _token_request(self.__user__, self.__pass__)
+        conn = _AsyncStompConnection(self.stomp_address, self.stomp_port, self._heartbeat)
+        await conn.connect(self.__user__, self.__pass__)
+        try:
+            token: asyncio.Future = asyncio.get_running_loop().create_future()
+
+            def on_token(headers, message):
+                if not token.done():
+                    token.set_result(message)
+
+            await conn.subscribe("/queue/" + reply_dest, on_token)
+            await conn.send(TOKEN_TOPIC, body, {"reply-to": reply_dest})
+            try:
+                return str(await asyncio.wait_for(token, self.token_timeout))
+            except asyncio.TimeoutError:
+                raise TimeoutError("Token request not responded to in a timely manner!")
+        finally:
+            await conn.disconnect()
+
+    def _on_connection_lost(self, error):
+        _log.warning("Connection to {}:{} lost: {}".format(self.stomp_address, self.stomp_port, error))
+        for future, _ in self._pending_responses.values():
+            if not future.done():
+                future.set_exception(ConnectionError("Connection lost while waiting for a response"))
+        for subscription in list(self._subscriptions):
+            subscription._end()
+        self._subscriptions.clear()
+
+    async def disconnect(self):
+        for subscription in list(self._subscriptions):
+            await subscription.close()
+        if self._conn is not None:
+            await self._conn.disconnect()
+        self._conn = None
+
+    def _headers(self) -> dict[str, Any]:
+        return {"GOSS_HAS_SUBJECT": True, "GOSS_SUBJECT": self._token}
+
+    def set_payload_encoding(self, topic, content_type):
+        """Send dict and list bodies for topic in a binary encoding, see :meth:`gridappsd.goss.GOSS.set_payload_encoding`."""
+        self._payload_encodings.set(topic, content_type)
+
+    def set_compression(self, topic, algorithm):
+        """Compress large bodies sent to topic, see :meth:`gridappsd.goss.GOSS.set_compression`."""
+        self._compression.set(topic, algorithm)
+
+    def _encode(self, topic, message, headers):
+        message, content_type = _encode_payload(message, self._payload_encodings.content_type_for(topic))
+        if content_type is not None:
+            headers[CONTENT_TYPE_HEADER] = content_type
+        return compression.compress_body(message, headers, self._compression.get(topic), self.compression_threshold)
+
+    async def send(self, topic, message):
+        conn = await self._connection()
+        headers = self._headers()
+        message = self._encode(topic, message, headers)
+        _log.debug("Sending topic: {} body: {}".format(topic, message))
+        await conn.send(topic, message, headers)
+
+    def subscribe(self, topic, maxsize=0) -> Subscription:
+        """Return a :class:`Subscription` that yields ``(headers, message)`` for topic.
+
+        Use ``async for headers, message in gapps.subscribe(topic)``; the
+        subscription ends when closed or when the connection is lost.
+        """
+        if not topic:
+            raise AttributeError("Invalid topic specified in subscription")
+        return Subscription(self, topic, maxsize)
+
+    async def _get_reply_queue(self, conn: _AsyncStompConnection) -> str:
+        if self._reply_queue is None:
+            reply_queue = _REPLY_QUEUE_PREFIX + uuid.uuid4().hex
+            await conn.subscribe(reply_queue, self._on_reply)
+            self._reply_queue = reply_queue
+        return self._reply_queue
+
+    def _on_reply(self, headers, message):
+        correlation_id = headers.get("correlation-id")
+        pending = self._pending_responses.get(correlation_id)
+        if pending is None:
+            _log.warning(
+                "Discarding unmatched reply on {} (correlation-id: {})".format(
+                    headers.get("destination"), correlation_id
+                )
+            )
+            return
+        self._complete(pending, headers, message)
+
+    @staticmethod
+    def _complete(pending, headers, message):
+        future, result_format = pending
+        if not future.done():
+            future.set_result(_decode_response(result_format, headers, MessageEnvelope(headers, message).body))
+
+    async def get_response(self, topic, message, timeout=5):
+        """Send message to topic and return the reply.
+
+        Each request gets its own temporary reply queue, or with
+        shared_reply_queue=True all replies arrive on one queue and are
+        matched by correlation-id, like :meth:`gridappsd.goss.GOSS.get_response`.
+
+        :raises TimeoutError: if no reply is received within timeout seconds.
+        """
+        return await self._request(topic, message, timeout, self.shared_reply_queue)
+
+    async def _request(self, topic, message, timeout, shared_reply_queue=False):
+        """Send a request and await its reply, on a reply queue of its own unless shared_reply_queue."""
+        if isinstance(message, str):
+            message = json.loads(message)
+
+        if "resultFormat" in message:
+            self.result_format = message["resultFormat"]
+
+        conn = await self._connection()
+        correlation_id = uuid.uuid4().hex
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        pending = (future, self.result_format)
+        # Every request in flight is listed, so a lost connection fails them
+        # at once; only the shared reply queue looks replies up here.
+        self._pending_responses[correlation_id] = pending
+        subscription_id = None
+        try:
+            if shared_reply_queue:
+                reply_to = await self._get_reply_queue(conn)
+            else:
+                reply_to = _REPLY_QUEUE_PREFIX + correlation_id
+                subscription_id = await conn.subscribe(
+                    reply_to, lambda headers, message: self._complete(pending, headers, message)
+                )
+            headers = self._headers()
+            headers.update(
+                {
+                    "reply-to": reply_to,
+                    "correlation-id": correlation_id,
+                    ACCEPT_ENCODING_HEADER: compression.accept_encoding(),
+                }
+            )
+            await conn.send(topic, self._encode(topic, message, headers), headers)
+            try:
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError("Request not responded to in a timely manner!")
+        finally:
+            self._pending_responses.pop(correlation_id, None)
+            if subscription_id is not None:
+                try:
+                    await conn.unsubscribe(subscription_id)
+                except ConnectionError:
+                    pass
+
+    async def get_shared_response(self, topic, message, timeout=5):
+        """Like :meth:`get_response`, but identical requests in flight on this client share one round trip.
+
+        See :meth:`gridappsd.goss.GOSS.get_shared_response`.
+        """
+        key = request_key(topic, message)
+        task = self._shared_requests.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.get_response(topic, message, timeout))
+            self._shared_requests[key] = task
+            task.add_done_callback(lambda _: self._shared_requests.pop(key, None))
+        try:
+            # A caller that gives up must not cancel the request for the others.
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError("Request not responded to in a timely manner!")
+
+    async def get_responses(self, requests, timeout=5, max_in_flight=64, return_exceptions=False):
+        """Send many requests concurrently and return their replies in order.
+
+        Each request waits on its own reply queue, see
+        :meth:`gridappsd.goss.GOSS.get_responses`.
+        """
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        semaphore = asyncio.Semaphore(max_in_flight)
+
+        async def request(topic, message):
+            async with semaphore:
+                return await self._request(topic, message, timeout)
+
+        tasks = [asyncio.ensure_future(request(topic, message)) for topic, message in requests]
+        try:
+            return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+        finally:
+            # Withdraw the requests still in flight when one failed.
+            for task in tasks:
+                task.cancel()
+
+    async def iter_responses(self, requests, timeout=5, max_in_flight=64):
+        """Yield (index, reply) tuples as the replies to many requests arrive.
+
+        See :meth:`gridappsd.goss.GOSS.iter_responses`; a failed request
+        yields its exception as the reply.
+        """
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        semaphore = asyncio.Semaphore(max_in_flight)
+
+        async def request(index, topic, message):
+            async with semaphore:
+                try:
+                    return index, await self._request(topic, message, timeout)
+                except Exception as e:
+                    return index, e
+
+        tasks = [
+            asyncio.ensure_future(request(index, topic, message)) for index, (topic, message) in enumerate(requests)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,206 @@
+"""JSON codecs for the message path.
+
+Every message body sent or received by :mod:`gridappsd.goss` (and the
+:class:`~gridappsd.message.MessageEnvelope` bodies handed to callbacks) is
+encoded and decoded through the active codec.  All codecs keep the
+round-tripping of complex numbers as ``{"real": ..., "imag": ...}`` objects
+that :mod:`gridappsd.json_extension` defines.
+
+Available codecs:
+
+``stdlib``
+    :mod:`gridappsd.json_extension` on top of the standard library json
+    module.  The default; always available.
+``orjson``
+    Uses the orjson package when it is installed.
+``msgspec``
+    Uses the msgspec package when it is installed.
+
+Choose one with :func:`set_codec` or the GRIDAPPSD_JSON_CODEC environment
+variable, where ``auto`` picks the fastest one installed.  Output of the
+binary backends is compact (no spaces after separators) and writes NaN and
+infinity as null, unlike the stdlib codec.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import logging
+import os
+from typing import Any
+
+from gridappsd import json_extension
+
+_log = logging.getLogger(__name__)
+
+JSON_CODEC_ENV = "GRIDAPPSD_JSON_CODEC"
+
+
+def restore_complex(obj: Any) -> Any:
+    """Turn every ``{"real": x, "imag": y}`` object in a decoded document into a complex, in place.
+
+    Used by the codecs whose parsers have no object hook.  Nested objects are
+    converted before their parents, like an object hook would.
+    """
+    if type(obj) is dict:
+        for key, value in obj.items():
+            if type(value) is dict or type(value) is list:
+                obj[key] = restore_complex(value)
+        if len(obj) == 2 and "imag" in obj and "real" in obj:
+            return json_extension.jsonDecoderExtension(obj)
+    elif type(obj) is list:
+        for index, value in enumerate(obj):
+            if type(value) is dict or type(value) is list:
+                obj[index] = restore_complex(value)
+    return obj
+
+
+def _may_hold_complex(data: str | bytes) -> bool:
+    # Without an "imag" key anywhere there is nothing for restore_complex to do.
+    if isinstance(data, str):
+        return '"imag"' in data
+    return b'"imag"' in data
+
+
+def _encode_default(obj: Any) -> Any:
+    if isinstance(obj, complex):
+        return {"real": obj.real, "imag": obj.imag}
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    raise TypeError("Object of type {} is not JSON serializable".format(type(obj).__name__))
+
+
+class Codec(object):
+    """Encodes Python objects to JSON text and back."""
+
+    name = ""
+
+    def dumps(self, obj: Any) -> str:
+        raise NotImplementedError()
+
+    def loads(self, data: str | bytes) -> Any:
+        raise NotImplementedError()
+
+
+class StdlibCodec(Codec):
+    name = "stdlib"
+
+    def dumps(self, obj: Any) -> str:
+        return json_extension.dumps(obj)
+
+    def loads(self, data: str | bytes) -> Any:
+        return json_extension.loads(data)
+
+
+class OrjsonCodec(Codec):
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+
+        self._orjson = orjson
+        self._options = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj: Any) -> str:
+        return self._orjson.dumps(obj, default=_encode_default, option=self._options).decode("utf-8")
+
+    def loads(self, data: str | bytes) -> Any:
+        obj = self._orjson.loads(data)
+        return restore_complex(obj) if _may_hold_complex(data) else obj
+
+
+class MsgspecCodec(Codec):
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+
+        self._encoder = msgspec.json.Encoder(enc_hook=_encode_default)
+        self._decoder = msgspec.json.Decoder()
+
+    def dumps(self, obj: Any) -> str:
+        encoded: bytes = self._encoder.encode(obj)
+        return encoded.decode("utf-8")
+
+    def loads(self, data: str | bytes) -> Any:
+        obj = self._decoder.decode(data)
+        return restore_complex(obj) if _may_hold_complex(data) else obj
+
+
+_CODECS: dict[str, type[Codec]] = {
+    StdlibCodec.name: StdlibCodec,
+    OrjsonCodec.name: OrjsonCodec,
+    MsgspecCodec.name: MsgspecCodec,
+}
+
+# Preference order for "auto".
+_AUTO_ORDER = (MsgspecCodec.name, OrjsonCodec.name, StdlibCodec.name)
+
+
+def available_codecs() -> list[str]:
+    """Return the names of the codecs whose packages are installed."""
+    names = []
+    for name, codec_class in _CODECS.items():
+        try:
+            codec_class()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def create_codec(name: str) -> Codec:
+    """Return a new codec by name; ``auto`` selects the fastest installed one.
+
+    :raises ValueError: for an unknown name.
+    :raises ImportError: if the codec's package is not installed.
+    """
+    if name == "auto":
+        for candidate in _AUTO_ORDER:
+            try:
+                return _CODECS[candidate]()
+            except ImportError:
+                continue
+    if name not in _CODECS:
+        raise ValueError("Unknown JSON codec {!r}, expected one of {}".format(name, ", ".join(["auto", *_CODECS])))
+    return _CODECS[name]()
+
+
+def _codec_from_environment() -> Codec:
+    name = os.environ.get(JSON_CODEC_ENV)
+    if not name:
+        return StdlibCodec()
+    try:
+        return create_codec(name)
+    except (ImportError, ValueError) as e:
+        _log.warning("Using the stdlib JSON codec, {}={} is not usable: {}".format(JSON_CODEC_ENV, name, e))
+        return StdlibCodec()
+
+
+_codec: Codec = _codec_from_environment()
+
+
+def get_codec() -> Codec:
+    """Return the codec in use."""
+    return _codec
+
+
+def set_codec(codec: str | Codec) -> Codec:
+    """Use codec, given by name or as a :class:`Codec` instance, for all messages from now on.
+
+    :return: the codec that was in use before.
+    """
+    global _codec
+    previous = _codec
+    _codec = create_codec(codec) if isinstance(codec, str) else codec
+    return previous
+
+
+def dumps(obj: Any) -> str:
+    """Encode obj with the codec in use."""
+    return _codec.dumps(obj)
+
+
+def loads(data: str | bytes) -> Any:
+    """Decode data with the codec in use."""
+    return _codec.loads(data)
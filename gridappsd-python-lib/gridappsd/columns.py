@@ -0,0 +1,161 @@
+"""Columnar SPARQL query results.
+
+A SPARQL JSON result holds one dict per row, with one more dict per bound
+variable.  :func:`to_columns` turns it into one array per variable, so
+analytics over thousands of equipment rows can be vectorized:
+
+.. code-block:: python
+
+    columns = gapps.query_data_columns(query, dtypes={"ratedS": float, "phases": str})
+    total = columns["ratedS"].values[~columns["ratedS"].mask].sum()
+
+The arrays are NumPy arrays when NumPy is installed and otherwise
+:class:`array.array` for numbers and lists for strings.  Every column comes
+with a mask that is true for the rows where the variable is unbound, as in
+NumPy masked arrays.  Unbound rows hold NaN in float columns, 0 in int and
+bool columns and None (or "" in a NumPy array) in str columns.
+
+Column types come from dtypes, else from the XSD datatype of the first
+bound value, else str.
+"""
+
+from __future__ import annotations
+
+import array
+from typing import Any, NamedTuple, Optional, Union
+
+DType = Union[str, type]
+
+_XSD = "http://www.w3.org/2001/XMLSchema#"
+
+_XSD_DTYPES = {
+    **{_XSD + name: "float" for name in ("double", "float", "decimal")},
+    **{
+        _XSD + name: "int"
+        for name in (
+            "integer",
+            "int",
+            "long",
+            "short",
+            "byte",
+            "nonNegativeInteger",
+            "positiveInteger",
+            "unsignedInt",
+            "unsignedLong",
+        )
+    },
+    _XSD + "boolean": "bool",
+}
+
+_DTYPE_NAMES = {float: "float", int: "int", bool: "bool", str: "str"}
+
+_TRUE = frozenset(("true", "1"))
+
+
+class Column(NamedTuple):
+    """The values of one variable and the mask of the rows it is unbound in."""
+
+    values: Any
+    mask: Any
+
+    def to_list(self) -> list[Any]:
+        """Return the values as Python objects, None where unbound."""
+        values = self.values.tolist() if hasattr(self.values, "tolist") else list(self.values)
+        return [None if missing else value for value, missing in zip(values, self.mask)]
+
+
+def _numpy():
+    try:
+        import numpy
+
+        return numpy
+    except ImportError:
+        return None
+
+
+def _dtype_name(variable: str, dtype: DType) -> str:
+    name = _DTYPE_NAMES.get(dtype, dtype) if isinstance(dtype, type) else dtype
+    if name not in ("float", "int", "bool", "str"):
+        raise ValueError("Unsupported dtype {!r} for {}, expected float, int, bool or str".format(dtype, variable))
+    return name
+
+
+def _infer_dtype(bindings: list[dict[str, Any]], variable: str) -> str:
+    for row in bindings:
+        value = row.get(variable)
+        if value is not None:
+            return _XSD_DTYPES.get(value.get("datatype"), "str")
+    return "str"
+
+
+def _convert(variable: str, dtype: str, texts: list[Optional[str]], mask: list[bool], numpy) -> Column:
+    try:
+        if dtype == "str":
+            if numpy is not None:
+                return Column(numpy.array([text or "" for text in texts], dtype=str), numpy.array(mask, dtype=bool))
+            return Column(texts, array.array("b", mask))
+        if dtype == "bool":
+            values: list[Any] = [text is not None and text.lower() in _TRUE for text in texts]
+        elif dtype == "int":
+            values = [0 if text is None else int(text) for text in texts]
+        else:
+            values = [float("nan") if text is None else float(text) for text in texts]
+    except ValueError as e:
+        raise ValueError("Column {} does not hold {} values: {}".format(variable, dtype, e))
+    if numpy is not None:
+        numpy_type = {"bool": bool, "int": numpy.int64, "float": numpy.float64}[dtype]
+        return Column(numpy.array(values, dtype=numpy_type), numpy.array(mask, dtype=bool))
+    typecode = {"bool": "b", "int": "q", "float": "d"}[dtype]
+    return Column(array.array(typecode, values), array.array("b", mask))
+
+
+def to_columns(
+    response: Any,
+    dtypes: Optional[dict[str, DType]] = None,
+    use_numpy: Optional[bool] = None,
+) -> dict[str, Column]:
+    """Return the columns of a SPARQL JSON query result by variable name.
+
+    :param response: a :meth:`~gridappsd.GridAPPSD.query_data` response, the
+        SPARQL JSON result in its ``data`` or the ``bindings`` list itself.
+    :param dtypes: type of the values of some variables: ``float``, ``int``,
+        ``bool`` or ``str``, or their names.
+    :param use_numpy: force or prevent NumPy arrays; by default they are
+        used when NumPy is installed.
+    :raises ValueError: if a value does not convert to its column's type.
+    """
+    if isinstance(response, dict) and "data" in response:
+        response = response["data"]
+    variables: list[str] = []
+    if isinstance(response, dict):
+        variables = list(response.get("head", {}).get("vars", []))
+        bindings = response["results"]["bindings"]
+    else:
+        bindings = response
+    dtypes = dtypes or {}
+    # Variables the head does not name, in the order they first appear.
+    seen = set(variables)
+    for row in bindings:
+        for variable in row:
+            if variable not in seen:
+                seen.add(variable)
+                variables.append(variable)
+    for variable in dtypes:
+        if variable not in seen:
+            variables.append(variable)
+
+    numpy = _numpy() if use_numpy is not False else None
+    if use_numpy and numpy is None:
+        raise ImportError("use_numpy requires NumPy to be installed")
+
+    columns = {}
+    for variable in variables:
+        if variable in dtypes:
+            dtype = _dtype_name(variable, dtypes[variable])
+        else:
+            dtype = _infer_dtype(bindings, variable)
+        cells = [row.get(variable) for row in bindings]
+        texts = [None if cell is None else cell["value"] for cell in cells]
+        mask = [cell is None for cell in cells]
+        columns[variable] = _convert(variable, dtype, texts, mask, numpy)
+    return columns
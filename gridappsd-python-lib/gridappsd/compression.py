@@ -0,0 +1,169 @@
+"""Compression of large message bodies.
+
+Bodies at least as large as a threshold can be compressed before they are
+sent.  The algorithm is named in the frame's ``content-encoding`` header and
+receivers decompress such frames before anything else looks at them, so
+compression is invisible to callbacks.  Smaller bodies are sent untouched and
+cost nothing beyond a length check.
+
+Requesters list the algorithms they can decompress in an ``accept-encoding``
+header, which lets responders compress large replies without any
+configuration.  Services that do not know the header, like the platform
+itself, simply ignore it.
+
+Algorithms:
+
+``zlib``
+    The standard library zlib module; always available.
+``zstd``
+    Zstandard through the zstandard package, when it is installed.  Faster
+    than zlib at a similar ratio.
+"""
+
+from __future__ import annotations
+
+import logging
+import zlib
+from typing import Any, Callable, Optional
+
+from gridappsd.topic_matcher import TopicMap
+
+_log = logging.getLogger(__name__)
+
+CONTENT_ENCODING_HEADER = "content-encoding"
+ACCEPT_ENCODING_HEADER = "accept-encoding"
+
+ZLIB = "zlib"
+ZSTD = "zstd"
+
+# Bodies shorter than this many bytes (characters for text) are not worth compressing.
+DEFAULT_THRESHOLD = 64 * 1024
+
+
+def _zlib() -> tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    return zlib.compress, zlib.decompress
+
+
+def _zstd() -> tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    import zstandard
+
+    # Compressor objects are not thread safe, so each call makes its own.
+    def compress(data: bytes) -> bytes:
+        compressed: bytes = zstandard.ZstdCompressor().compress(data)
+        return compressed
+
+    def decompress(data: bytes) -> bytes:
+        decompressed: bytes = zstandard.ZstdDecompressor().decompress(data)
+        return decompressed
+
+    return compress, decompress
+
+
+# Preference order for replies to an accept-encoding header.
+_ALGORITHMS: dict[str, Callable[[], tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]]] = {
+    ZSTD: _zstd,
+    ZLIB: _zlib,
+}
+
+_loaded: dict[str, tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {}
+
+
+def _functions(algorithm: str) -> tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    functions = _loaded.get(algorithm)
+    if functions is None:
+        if algorithm not in _ALGORITHMS:
+            raise ValueError(
+                "Unknown compression {!r}, expected one of {}".format(algorithm, ", ".join(sorted(_ALGORITHMS)))
+            )
+        functions = _loaded[algorithm] = _ALGORITHMS[algorithm]()
+    return functions
+
+
+def available_algorithms() -> list[str]:
+    """Return the algorithms that can be used on this installation, preferred first."""
+    names = []
+    for algorithm in _ALGORITHMS:
+        try:
+            _functions(algorithm)
+        except ImportError:
+            continue
+        names.append(algorithm)
+    return names
+
+
+def compress(algorithm: str, data: bytes) -> bytes:
+    """Compress data with algorithm.
+
+    :raises ValueError: for an unknown algorithm.
+    :raises ImportError: if the algorithm's package is not installed.
+    """
+    return _functions(algorithm)[0](data)
+
+
+def decompress(algorithm: str, data: bytes) -> bytes:
+    """Decompress data compressed with algorithm."""
+    return _functions(algorithm)[1](data)
+
+
+_accepted: Optional[str] = None
+
+
+def accept_encoding() -> str:
+    """Return the accept-encoding header value listing the algorithms this process can decompress."""
+    global _accepted
+    if _accepted is None:
+        _accepted = ",".join(available_algorithms())
+    return _accepted
+
+
+def negotiate(accepted: Optional[str]) -> Optional[str]:
+    """Return the preferred algorithm from an accept-encoding header value, None if there is none in common."""
+    if not accepted:
+        return None
+    offered = {name.strip() for name in accepted.split(",")}
+    for algorithm in accept_encoding().split(","):
+        if algorithm in offered:
+            return algorithm
+    return None
+
+
+def compress_body(body: Any, headers: dict[str, Any], algorithm: Optional[str], threshold: int) -> Any:
+    """Return body compressed with algorithm if it is at least threshold long.
+
+    Sets the content-encoding header when the body is compressed.  Bodies that
+    are neither text nor bytes are returned unchanged.
+    """
+    if algorithm is None or not isinstance(body, (str, bytes)) or len(body) < threshold:
+        return body
+    data = body.encode("utf-8") if isinstance(body, str) else body
+    headers[CONTENT_ENCODING_HEADER] = algorithm
+    return compress(algorithm, data)
+
+
+def decompress_body(headers: dict[str, Any], body: Any) -> Any:
+    """Return a received body decompressed according to its content-encoding header.
+
+    A body that cannot be decompressed is logged and returned as received.
+    """
+    algorithm = headers.get(CONTENT_ENCODING_HEADER)
+    if algorithm is None or not isinstance(body, bytes):
+        return body
+    try:
+        return decompress(algorithm, body)
+    except Exception as e:
+        _log.error("Cannot decompress {} body on {}: {}".format(algorithm, headers.get("destination"), e))
+        return body
+
+
+class CompressionPolicy(TopicMap):
+    """The compression algorithm chosen for each topic a client sends to."""
+
+    def set(self, topic: str, algorithm: Optional[str]):
+        """Compress large bodies for topic with algorithm, or not at all when None.
+
+        :raises ValueError: for an unknown algorithm.
+        :raises ImportError: if the algorithm's package is not installed.
+        """
+        if algorithm is not None:
+            _functions(algorithm)
+        super().set(topic, algorithm)
@@ -0,0 +1,144 @@
+"""Bounded queue between the stomp receiver thread and CallbackRouter workers.
+
+When callbacks fall behind the rate messages arrive, an unbounded queue
+grows until the process runs out of memory.  :class:`DispatchQueue` caps the
+number of waiting messages and applies an :class:`OverflowPolicy`, chosen
+per destination, once the cap is reached.  It also counts what it drops so
+applications can alarm before data is lost.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import defaultdict, deque
+from enum import Enum
+from typing import Any
+
+
+class OverflowPolicy(Enum):
+    """What to do with a message that arrives while the queue is full.
+
+    BLOCK makes the stomp receiver wait for room (backpressure onto the
+    broker).  DROP_OLDEST discards the oldest waiting message, DROP_NEWEST
+    discards the arriving one.  LATEST conflates: at most one message per
+    destination waits in the queue and a newer one replaces it, whether or
+    not the queue is full.
+    """
+
+    BLOCK = "block"
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+    LATEST = "latest"
+
+
+class DispatchQueue(object):
+    """A FIFO of (destination, item) pairs with a maximum depth and overflow policies.
+
+    :param maxsize: maximum number of waiting messages, 0 for unbounded.
+    """
+
+    def __init__(self, maxsize: int = 0):
+        if maxsize < 0:
+            raise ValueError("maxsize must be >= 0")
+        self.maxsize = maxsize
+        self._entries: deque[tuple[str, Any]] = deque()
+        # Conflated destinations hold a slot in _entries with a None item; the
+        # message to deliver for that slot is kept here and may be replaced.
+        self._latest: dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._all_done = threading.Condition(self._lock)
+        # Items queued and not yet marked done with task_done().
+        self._unfinished = 0
+        self._dropped: dict[str, int] = defaultdict(int)
+        self._high_water_mark = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _is_full(self):
+        return self.maxsize > 0 and len(self._entries) >= self.maxsize
+
+    def _drop_oldest(self):
+        destination, item = self._entries.popleft()
+        if item is None:
+            self._latest.pop(destination, None)
+        self._dropped[destination] += 1
+        self._finish(1)
+
+    def _finish(self, count):
+        self._unfinished -= count
+        if not self._unfinished:
+            self._all_done.notify_all()
+
+    def put(self, destination: str, item: Any, policy: OverflowPolicy = OverflowPolicy.BLOCK):
+        """Add item for destination, applying policy if the queue is full.
+
+        :return: True if the item was queued, False if it was dropped.
+        """
+        with self._not_empty:
+            if policy is OverflowPolicy.LATEST:
+                if destination in self._latest:
+                    # Replace the waiting message; the superseded one is dropped.
+                    self._latest[destination] = item
+                    self._dropped[destination] += 1
+                    return True
+                if self._is_full():
+                    self._drop_oldest()
+                self._latest[destination] = item
+                self._entries.append((destination, None))
+                self._unfinished += 1
+            else:
+                if self._is_full():
+                    if policy is OverflowPolicy.DROP_NEWEST:
+                        self._dropped[destination] += 1
+                        return False
+                    if policy is OverflowPolicy.DROP_OLDEST:
+                        self._drop_oldest()
+                    else:
+                        while self._is_full():
+                            self._not_full.wait()
+                self._entries.append((destination, item))
+                self._unfinished += 1
+
+            if len(self._entries) > self._high_water_mark:
+                self._high_water_mark = len(self._entries)
+            self._not_empty.notify()
+            return True
+
+    def get(self, timeout: float | None = None) -> Any:
+        """Remove and return the oldest item, blocking until one is available.
+
+        :raises TimeoutError: if timeout passes with the queue still empty.
+        """
+        with self._not_empty:
+            if not self._not_empty.wait_for(lambda: self._entries, timeout):
+                raise TimeoutError("DispatchQueue.get timed out")
+            destination, item = self._entries.popleft()
+            if item is None:
+                item = self._latest.pop(destination)
+            self._not_full.notify()
+            return item
+
+    def task_done(self):
+        """Mark an item returned by :meth:`get` as fully processed."""
+        with self._lock:
+            self._finish(1)
+
+    def join(self, timeout: float | None = None) -> bool:
+        """Wait until every queued item was processed; return False if timeout passed first."""
+        with self._all_done:
+            return self._all_done.wait_for(lambda: not self._unfinished, timeout)
+
+    def stats(self) -> dict[str, Any]:
+        """Return the current depth, high water mark and per-destination drop counts."""
+        with self._not_empty:
+            dropped = dict(self._dropped)
+            return dict(
+                depth=len(self._entries),
+                maxsize=self.maxsize,
+                high_water_mark=self._high_water_mark,
+                dropped=dropped,
+                dropped_total=sum(dropped.values()),
+            )
@@ -50,21 +50,51 @@ import inspect
 import logging
 import os
 import random
+import socket
 import threading
-from collections import defaultdict
+import time
+import uuid
+import weakref
+from collections import defaultdict, deque
 from datetime import datetime
 from enum import Enum
 from logging import Logger
-from queue import Queue
+from queue import Empty, Queue
 
 from stomp import Connection12 as Connection
-from stomp.exception import NotConnectedException
-from time import sleep
-
-from gridappsd import json_extension as json
+from stomp.exception import ConnectFailedException, NotConnectedException
+
+from gridappsd import codec, compression, payload_encoding, single_flight, tracing
+from gridappsd.compression import ACCEPT_ENCODING_HEADER, CompressionPolicy
+from gridappsd.dispatch_queue import DispatchQueue, OverflowPolicy
+from gridappsd.message import MessageEnvelope
+from gridappsd.metrics import MessageMetrics, start_http_server
+from gridappsd.payload_encoding import CONTENT_TYPE_HEADER, EncodingPolicy
+from gridappsd.single_flight import request_key
+from gridappsd.token_cache import token_cache, token_key
+from gridappsd.topic_matcher import TopicMatcher, normalize_destination
+from gridappsd.tracing import TRACEPARENT_HEADER
 
 _log: Logger = logging.getLogger(inspect.getmodulename(__file__))
 
+_REPLY_QUEUE_PREFIX = "/temp-queue/response."
+
+# Headers of the message a CallbackRouter is currently dispatching on this thread.
+_dispatch_context = threading.local()
+
+
+def _metric_destination(destination):
+    """Return the destination label metrics are recorded under."""
+    # Reply queues are unique per connection or request; count them together.
+    if destination.startswith(_REPLY_QUEUE_PREFIX):
+        return _REPLY_QUEUE_PREFIX + "*"
+    return destination
+
+
+def _current_inbound_headers():
+    """Return the headers of the message being dispatched on this thread, or None."""
+    return getattr(_dispatch_context, "headers", None)
+
 
 def _unpack_stomp_args(*args):
     """Return (headers, body) from a stomp listener callback's arguments.
@@ -77,7 +107,7 @@ def _unpack_stomp_args(*args):
     receives the two argument shape, regardless of the installed stomp-py
     version, because CallbackRouter.run_callbacks is the caller, not
     stomp itself. Only a listener registered directly on a raw stomp
-    Connection (CallbackRouter itself, TokenResponseListener) is actually
+    Connection (CallbackRouter itself, _TokenResponseListener) is actually
     invoked by stomp's own version dependent dispatch. Detecting the
     argument shape at each call, instead of trusting a single global
     version sniffed flag, is correct for both callers.
@@ -94,14 +124,115 @@ def _unpack_stomp_args(*args):
 def _serialize_message(message):
     """Return message ready to send on the wire.
 
-    A list or dict body is serialized to a JSON string; any other body
+    A list or dict body is serialized to a JSON string; a received
+    MessageEnvelope is forwarded as its original raw body; any other body
     (already a string, bytes, etc.) is passed through unchanged.
     """
     if isinstance(message, (list, dict)):
-        return json.dumps(message)
+        return codec.dumps(message)
+    if isinstance(message, MessageEnvelope):
+        return message.raw
     return message
 
 
+def _encode_payload(message, content_type=None):
+    """Return (body, content_type) of message ready to send on the wire.
+
+    A list or dict body is encoded as content_type when one is given and
+    serialized like :func:`_serialize_message` otherwise.  A received
+    MessageEnvelope keeps the binary encoding it arrived in.  content_type is
+    None in the result when the body is sent as text.
+    """
+    if isinstance(message, MessageEnvelope):
+        received = message.headers.get(CONTENT_TYPE_HEADER)
+        return message.raw, received if payload_encoding.is_binary(received) else None
+    if content_type is not None and isinstance(message, (list, dict)):
+        return payload_encoding.encode(content_type, message), content_type
+    return _serialize_message(message), None
+
+
+class _PendingResponse(object):
+    """A request sent through GOSS.get_response that is waiting for its reply."""
+
+    def __init__(self, result_format, notify=None):
+        self.response = None
+        self.result_format = result_format
+        # Request destination and perf_counter time it was sent, for metrics.
+        self.topic = None
+        self.sent_at = None
+        self.span = None
+        self._received = threading.Event()
+        self._notify = notify
+
+    def wait(self, timeout):
+        """Block until a response has been stored or timeout seconds pass.
+
+        :return: True if a response arrived, False on timeout.
+        """
+        return self._received.wait(timeout)
+
+    def on_message(self, *args):
+        header, message = _unpack_stomp_args(*args)
+        _log.debug("Internal on message is: {} {}".format(header, message))
+        self.response = _decode_response(self.result_format, header, message)
+        self._received.set()
+        if self._notify is not None:
+            self._notify(self)
+
+
+class _TokenResponseListener(object):
+    """Receives the reply of the GOSS token service on a temporary connection."""
+
+    def __init__(self):
+        self.token = None
+        self._received = threading.Event()
+
+    def wait(self, timeout):
+        return self._received.wait(timeout)
+
+    def on_message(self, *args):
+        header, message = _unpack_stomp_args(*args)
+        _log.debug("Internal on message is: {} {}".format(header, message))
+        self.token = str(message)
+        self._received.set()
+
+    def on_error(self, *args):
+        headers, message = _unpack_stomp_args(*args)
+        _log.error("ERR: {}".format(headers))
+        _log.error("OUR ERROR: {}".format(message))
+
+
+def _set_nodelay(conn):
+    """Turn off Nagle's algorithm on the socket of a stomp connection.
+
+    A request is a SUBSCRIBE to its reply queue followed by a SEND; with
+    Nagle the SEND waits for the broker's delayed ACK of the SUBSCRIBE,
+    adding about 40 ms to every round trip.
+    """
+    sock = getattr(getattr(conn, "transport", None), "socket", None)
+    if sock is None:
+        return
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError as e:
+        _log.debug("Could not set TCP_NODELAY: {}".format(e))
+
+
+class _ConnectionListener(object):
+    """Tells a GOSS client when its stomp connection drops."""
+
+    def __init__(self, goss, conn):
+        self._goss = goss
+        self._conn = conn
+
+    def on_connecting(self, host_and_port):
+        # Called once the socket is open, before the CONNECT frame is sent.
+        _set_nodelay(self._conn)
+
+    def on_disconnected(self):
+        self._goss._on_connection_lost(self._conn)
+
+
 class GRIDAPPSD_ENV_ENUM(Enum):
     GRIDAPPSD_USER = "GRIDAPPSD_USER"
     GRIDAPPSD_PASSWORD = "GRIDAPPSD_PASSWORD"
@@ -115,8 +246,132 @@ class TimeoutError(Exception):
     pass
 
 
+TOKEN_TOPIC = "/topic/pnnl.goss.token.topic"
+
+# Seconds to wait for the token service to answer.
+_TOKEN_TIMEOUT = 10
+
+
+def _connection_settings(username, password, stomp_address, stomp_port):
+    """Return (username, password, address, port) with GRIDAPPSD_* environment variables applied.
+
+    Environmental variables overrule the passed arguments.
+    """
+    if os.environ.get(GRIDAPPSD_ENV_ENUM.GRIDAPPSD_USER.value):
+        _log.debug(f"Environment for {GRIDAPPSD_ENV_ENUM.GRIDAPPSD_USER.value} is set")
+        username = os.environ.get(GRIDAPPSD_ENV_ENUM.GRIDAPPSD_USER.value)
+
+    if os.environ.get(GRIDAPPSD_ENV_ENUM.GRIDAPPSD_PASSWORD.value):
+        _log.debug(f"Environment for {GRIDAPPSD_ENV_ENUM.GRIDAPPSD_PASSWORD.value} is set")
+        password = os.environ.get(GRIDAPPSD_ENV_ENUM.GRIDAPPSD_PASSWORD.value)
+
+    if os.environ.get(GRIDAPPSD_ENV_ENUM.GRIDAPPSD_ADDRESS.value):
+        _log.debug(f"Environment for {GRIDAPPSD_ENV_ENUM.GRIDAPPSD_ADDRESS.value} is set")
+        stomp_address = os.environ.get(GRIDAPPSD_ENV_ENUM.GRIDAPPSD_ADDRESS.value)
+
+    if os.environ.get(GRIDAPPSD_ENV_ENUM.GRIDAPPSD_PORT.value):
+        _log.debug(f"Environment for {GRIDAPPSD_ENV_ENUM.GRIDAPPSD_PORT.value} is set")
+        stomp_port = os.environ.get(GRIDAPPSD_ENV_ENUM.GRIDAPPSD_PORT.value)
+
+    if not username or not password:
+        raise ValueError("Invalid username/password specified.")
+
+    return username, password, stomp_address, stomp_port
+
+
+def _token_request(username, password):
+    """Return (reply destination, body) of a request for an auth token on TOKEN_TOPIC.
+
+    The reply destination is a queue name without the ``/queue/`` prefix, as
+    the token service expects it in the reply-to header.
+    """
+    reply_dest = f"temp.token_resp.{username}-{datetime.now()}"
+    body = base64.b64encode(f"{username}:{password}".encode())
+    return reply_dest, body
+
+
+def _decode_response(result_format, header, message):
+    """Return the value get_response hands back for a reply body."""
+    try:
+        if result_format == "JSON":
+            if isinstance(message, dict):
+                return message
+            return codec.loads(message)
+        return message
+    except ValueError:
+        return dict(error="Invalid json returned", header=header, message=message)
+
+
+class _ConnectionPool(object):
+    """Process-wide registry of the GOSS connections shared by clients created with share_connection=True.
+
+    Connections are reference counted; the last client to release one
+    disconnects it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections = {}
+
+    def acquire(self, key, factory):
+        with self._lock:
+            entry = self._connections.get(key)
+            if entry is None:
+                entry = self._connections[key] = [factory(), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, key):
+        with self._lock:
+            entry = self._connections.get(key)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self._connections[key]
+        entry[0].disconnect()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._connections)
+
+
+_connection_pool = _ConnectionPool()
+
+
 class GOSS(object):
-    """Base class providing connections to a GOSS instance via stomp protocol"""
+    """Base class providing connections to a GOSS instance via stomp protocol
+
+    With share_connection=True the client is a lightweight view on a STOMP
+    connection shared by every such client in the process with the same
+    address, credentials and token mode.  The views share one socket, one
+    auth token and one :class:`CallbackRouter` (and with shared_reply_queue=True
+    one reply queue), while each keeps its own subscriptions, which
+    :meth:`disconnect` removes again.  The
+    router and reconnect options of the first client to open a shared
+    connection apply to all of its views.
+
+    Every subscription is re-issued whenever a new connection replaces a lost
+    one.  With auto_reconnect=True a lost connection is re-established in the
+    background, retrying with exponential backoff and jitter between
+    reconnect_initial_delay and reconnect_max_delay seconds.  While it is
+    down, up to outage_buffer_size messages passed to :meth:`send` are held
+    and sent once the connection is back; the oldest are dropped when the
+    buffer is full.  :meth:`get_response` requests are not buffered.
+
+    Bodies sent to selected topics can use a binary encoding such as
+    MessagePack instead of JSON, see :meth:`set_payload_encoding`, and
+    bodies of at least compression_threshold bytes can be compressed, see
+    :meth:`set_compression`.  Large replies sent from callbacks are
+    compressed whenever the requester accepts it.
+
+    With collect_metrics=True (the default) message counts, sizes and
+    latencies are recorded per destination, see :meth:`get_metrics`,
+    :meth:`metrics_text` and :mod:`gridappsd.metrics`.  Once enabled with
+    :func:`gridappsd.tracing.enable`, requests and the messages handled
+    because of them are traced across processes, see :mod:`gridappsd.tracing`.
+    """
 
     def __init__(
         self,
@@ -129,48 +384,103 @@ class GOSS(object):
         stomp_log_level=logging.WARNING,
         goss_log_level=logging.INFO,
         use_auth_token=True,
+        shared_reply_queue=False,
+        callback_workers=1,
+        max_queue_depth=0,
+        overflow_policy=OverflowPolicy.BLOCK,
+        share_connection=False,
+        auto_reconnect=False,
+        reconnect_initial_delay=0.5,
+        reconnect_max_delay=30.0,
+        outage_buffer_size=0,
+        compression_threshold=compression.DEFAULT_THRESHOLD,
+        collect_metrics=True,
     ):
         logging.getLogger("stomp.py").setLevel(stomp_log_level)
         logging.getLogger("goss").setLevel(goss_log_level)
 
-        self.__user__ = username
-        self.__pass__ = password
-        self.stomp_address = stomp_address
-        self.stomp_port = stomp_port
+        self.__user__, self.__pass__, self.stomp_address, self.stomp_port = _connection_settings(
+            username, password, stomp_address, stomp_port
+        )
         self.use_auth_token = use_auth_token
-
-        # Environmental variables should overrule the passed arguments.
-        if os.environ.get(GRIDAPPSD_ENV_ENUM.GRIDAPPSD_USER.value):
-            _log.debug(f"Environment for {GRIDAPPSD_ENV_ENUM.GRIDAPPSD_USER.value} is set")
-            self.__user__ = os.environ.get(GRIDAPPSD_ENV_ENUM.GRIDAPPSD_USER.value)
-
-        if os.environ.get(GRIDAPPSD_ENV_ENUM.GRIDAPPSD_PASSWORD.value):
-            _log.debug(f"Environment for {GRIDAPPSD_ENV_ENUM.GRIDAPPSD_PASSWORD.value} is set")
-            self.__pass__ = os.environ.get(GRIDAPPSD_ENV_ENUM.GRIDAPPSD_PASSWORD.value)
-
-        if os.environ.get(GRIDAPPSD_ENV_ENUM.GRIDAPPSD_ADDRESS.value):
-            _log.debug(f"Environment for {GRIDAPPSD_ENV_ENUM.GRIDAPPSD_ADDRESS.value} is set")
-            self.stomp_address = os.environ.get(GRIDAPPSD_ENV_ENUM.GRIDAPPSD_ADDRESS.value)
-
-        if os.environ.get(GRIDAPPSD_ENV_ENUM.GRIDAPPSD_PORT.value):
-            _log.debug(f"Environment for {GRIDAPPSD_ENV_ENUM.GRIDAPPSD_PORT.value} is set")
-            self.stomp_port = os.environ.get(GRIDAPPSD_ENV_ENUM.GRIDAPPSD_PORT.value)
-
-        if not self.__user__ or not self.__pass__:
-            raise ValueError("Invalid username/password specified.")
+        self.shared_reply_queue = shared_reply_queue
 
         self._heartbeat = int(os.environ.get(GRIDAPPSD_ENV_ENUM.GRIDAPPSD_HEARTBEAT.value, 10000))
         self._conn = None
         self._ids = set()
+        self._subscriptions = {}
         self._topic_set = set()
         self._override_thread_fc = override_threading
-        self._router_callback = CallbackRouter()
         self.result_format = None
         self.__token = None
+        self._reply_queue = None
+        self._shared = None
+        self._share_connection = share_connection
+        self._connection_options = dict(
+            callback_workers=callback_workers,
+            max_queue_depth=max_queue_depth,
+            overflow_policy=overflow_policy,
+            auto_reconnect=auto_reconnect,
+            reconnect_initial_delay=reconnect_initial_delay,
+            reconnect_max_delay=reconnect_max_delay,
+            outage_buffer_size=outage_buffer_size,
+            collect_metrics=collect_metrics,
+        )
+        self.auto_reconnect = auto_reconnect
+        self.reconnect_initial_delay = reconnect_initial_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self._connect_lock = threading.RLock()
+        self._closing = False
+        self._reconnect_thread = None
+        self._reply_subscription_id = None
+        self._views = weakref.WeakSet()
+        self._outage_lock = threading.Lock()
+        self._outage_buffer = deque(maxlen=outage_buffer_size) if outage_buffer_size > 0 else None
+        self._outage_dropped = 0
+        self._payload_encodings = EncodingPolicy()
+        self._compression = CompressionPolicy()
+        self.compression_threshold = compression_threshold
+        if share_connection:
+            self._acquire_shared()
+        else:
+            self._router_callback = CallbackRouter(
+                workers=callback_workers,
+                max_queue_depth=max_queue_depth,
+                overflow_policy=overflow_policy,
+                collect_metrics=collect_metrics,
+            )
+            self._pending_responses = {}
+            self._pending_lock = threading.Lock()
 
         if attempt_connection:
             self._make_connection()
 
+    def _shared_key(self):
+        return (self.stomp_address, str(self.stomp_port), self.__user__, self.__pass__, bool(self.use_auth_token))
+
+    def _acquire_shared(self):
+        """Attach to the shared connection for this client's settings, creating it on first use."""
+        self._shared = _connection_pool.acquire(
+            self._shared_key(),
+            lambda: GOSS(
+                username=self.__user__,
+                password=self.__pass__,
+                stomp_address=self.stomp_address,
+                stomp_port=self.stomp_port,
+                attempt_connection=False,
+                override_threading=self._override_thread_fc,
+                use_auth_token=self.use_auth_token,
+                **self._connection_options,
+            ),
+        )
+        self._shared._views.add(self)
+        # Subscription ids must be unique on the socket, and replies to every
+        # view arrive through the shared router (and reply queue, if used).
+        self._ids = self._shared._ids
+        self._router_callback = self._shared._router_callback
+        self._pending_responses = self._shared._pending_responses
+        self._pending_lock = self._shared._pending_lock
+
     @property
     def connected(self):
         return self._conn is not None and self._conn.is_connected()
@@ -179,7 +489,16 @@ class GOSS(object):
         self._make_connection()
 
     def disconnect(self):
-        if self._conn:
+        if self._shared is not None:
+            # Only this view's subscriptions go; the socket stays open for the
+            # other views until the last one disconnects.
+            for conn_id in list(self._subscriptions):
+                self.unsubscribe(conn_id)
+            self._shared._views.discard(self)
+            _connection_pool.release(self._shared_key())
+            self._shared = None
+        elif self._conn:
+            self._closing = True
             self._conn.disconnect()
 
         self._conn = None
@@ -187,82 +506,456 @@ class GOSS(object):
     def override_threading(self, callback):
         self._override_thread_fc = callback
 
+    def set_payload_encoding(self, topic, content_type):
+        """Send dict and list bodies for topic in a binary encoding instead of JSON.
+
+        The encoding is named in the ``content-type`` header of every frame,
+        and :class:`CallbackRouter` decodes such frames transparently, so only
+        senders need to opt in.  Requests made with :meth:`get_response` use
+        the encoding of their topic, and replies sent from a callback answer
+        in the encoding of the request.  Bodies given as strings are always
+        sent as they are.
+
+        :param topic: topic, which may contain ActiveMQ wildcards.
+        :param content_type: a content type from
+            :mod:`gridappsd.payload_encoding`, e.g. ``"application/msgpack"``,
+            or None to send JSON again.
+        :raises ValueError: for an unknown content type.
+        :raises ImportError: if the encoding's package is not installed.
+        """
+        self._payload_encodings.set(topic, content_type)
+
+    def set_compression(self, topic, algorithm):
+        """Compress bodies of at least compression_threshold bytes sent to topic.
+
+        Receivers decompress such bodies transparently, see
+        :mod:`gridappsd.compression`.  Applies to :meth:`send` and to the
+        requests of :meth:`get_response`; only choose it for topics whose
+        subscribers use this library, as the platform's own services cannot
+        read compressed requests.
+
+        :param topic: topic, which may contain ActiveMQ wildcards.
+        :param algorithm: ``"zlib"``, ``"zstd"`` or None to stop compressing.
+        :raises ValueError: for an unknown algorithm.
+        :raises ImportError: if the algorithm's package is not installed.
+        """
+        self._compression.set(topic, algorithm)
+
     def send(self, topic, message):
-        self._make_connection()
-        message = _serialize_message(message)
+        content_type = self._payload_encodings.content_type_for(topic)
+        algorithm = self._compression.get(topic)
+        headers = {"GOSS_HAS_SUBJECT": True, "GOSS_SUBJECT": self.__token}
+        inbound = _current_inbound_headers()
+        if inbound is not None and inbound.get("reply-to") == topic:
+            # Replying from inside a callback: echo the request's correlation-id
+            # so the requester can match the reply on its shared reply queue.
+            if "correlation-id" in inbound:
+                headers["correlation-id"] = inbound["correlation-id"]
+            # Answer a binary request in its own encoding.
+            if content_type is None and payload_encoding.is_binary(inbound.get(CONTENT_TYPE_HEADER)):
+                content_type = inbound[CONTENT_TYPE_HEADER]
+            if algorithm is None:
+                algorithm = compression.negotiate(inbound.get(ACCEPT_ENCODING_HEADER))
+        message, content_type = _encode_payload(message, content_type)
+        if content_type is not None:
+            headers[CONTENT_TYPE_HEADER] = content_type
+        message = compression.compress_body(message, headers, algorithm, self.compression_threshold)
+        span = None
+        if tracing.is_enabled():
+            parent = tracing.current_span()
+            if parent is not None:
+                span = parent.child("send", tracing.PRODUCER, topic)
+                headers[TRACEPARENT_HEADER] = span.traceparent
         _log.debug("Sending topic: {} body: {}".format(topic, message))
-        self._conn.send(
-            body=message, destination=topic, headers={"GOSS_HAS_SUBJECT": True, "GOSS_SUBJECT": self.__token}
-        )
 
-    def get_response(self, topic, message, timeout=5):
-        id = datetime.now().strftime("%Y%m%d%h%M%S%f")[:-3]
-        reply_to = "/temp-queue/response.{}".format(id)
+        owner = self._shared or self
+        if owner._buffer_during_outage(topic, message, headers):
+            if span is not None:
+                span.finish(buffered=True)
+            return
+        self._make_connection()
+        headers["GOSS_SUBJECT"] = self.__token
+        try:
+            self._conn.send(body=message, destination=topic, headers=headers)
+        except NotConnectedException:
+            if not owner._buffer_during_outage(topic, message, headers, lost=True):
+                raise
+            if span is not None:
+                span.finish(buffered=True)
+            return
+        if self.metrics is not None:
+            self.metrics.count_sent(topic, message)
+        if span is not None:
+            span.finish()
+
+    def _buffer_during_outage(self, topic, message, headers, lost=False):
+        """Hold a message while the connection is being re-established.
+
+        :param lost: the connection was just found to be down while sending.
+        :return: True if the message was buffered and must not be sent now.
+        """
+        if self._outage_buffer is None:
+            return False
+        with self._outage_lock:
+            if lost and self.auto_reconnect and not self._closing:
+                self._start_reconnect()
+            if self._reconnect_thread is None:
+                return False
+            if len(self._outage_buffer) == self._outage_buffer.maxlen:
+                self._outage_dropped += 1
+                _log.warning("Outage buffer full, dropping oldest message for {}".format(self._outage_buffer[0][0]))
+            self._outage_buffer.append((topic, message, headers))
+            return True
+
+    def _on_connection_lost(self, conn):
+        """Called by stomp when conn drops; starts reconnecting unless disconnect() was called."""
+        if conn is not self._conn or self._closing or not self.auto_reconnect:
+            return
+        _log.warning("Connection to {}:{} lost, reconnecting".format(self.stomp_address, self.stomp_port))
+        with self._outage_lock:
+            self._start_reconnect()
+
+    def _start_reconnect(self):
+        # Called with _outage_lock held.
+        if self._reconnect_thread is None:
+            self._reconnect_thread = threading.Thread(target=self._reconnect_loop, name="GOSS-reconnect")
+            self._reconnect_thread.daemon = True
+            self._reconnect_thread.start()
+
+    def _reconnect_loop(self):
+        attempt = 0
+        while not self._closing:
+            delay = min(self.reconnect_max_delay, self.reconnect_initial_delay * 2**attempt)
+            # Jitter keeps many clients from reconnecting in lock step after a
+            # broker restart.
+            time.sleep(random.uniform(delay / 2, delay))
+            attempt += 1
+            with self._connect_lock:
+                if self._closing:
+                    break
+                try:
+                    self._make_connection()
+                except Exception as e:
+                    _log.debug("Reconnect attempt {} failed: {}".format(attempt, e))
+                    continue
+                if not self.connected:
+                    continue
+            # Send what was held during the outage before new messages can
+            # bypass the buffer.
+            with self._outage_lock:
+                if self._flush_outage_buffer():
+                    _log.info(
+                        "Reconnected to {}:{} after {} attempts".format(self.stomp_address, self.stomp_port, attempt)
+                    )
+                    self._reconnect_thread = None
+                    return
+
+        with self._outage_lock:
+            self._reconnect_thread = None
+
+    def _flush_outage_buffer(self):
+        """Send the buffered messages; return False if the connection dropped again."""
+        while self._outage_buffer:
+            topic, message, headers = self._outage_buffer[0]
+            headers["GOSS_SUBJECT"] = self.__token
+            try:
+                self._conn.send(body=message, destination=topic, headers=headers)
+            except NotConnectedException:
+                return False
+            self._outage_buffer.popleft()
+            if self.metrics is not None:
+                self.metrics.count_sent(topic, message)
+        return True
+
+    def get_outage_stats(self):
+        """Return the number of messages buffered and dropped while disconnected."""
+        owner = self._shared or self
+        with owner._outage_lock:
+            buffered = len(owner._outage_buffer) if owner._outage_buffer is not None else 0
+            return dict(
+                buffered=buffered, dropped=owner._outage_dropped, reconnecting=owner._reconnect_thread is not None
+            )
 
-        if isinstance(message, str):
-            message = json.loads(message)
+    @property
+    def metrics(self):
+        """The :class:`~gridappsd.metrics.MessageMetrics` of this connection, None when not collected."""
+        return self._router_callback.metrics
 
-        if "resultFormat" in message:
-            self.result_format = message["resultFormat"]
+    def get_metrics(self):
+        """Return the message metrics and callback queue statistics.
 
-        # Change message to string if we have a dictionary or list.
-        message = _serialize_message(message)
+        :return: dict of ``{metric name: {destination: value}}`` as described
+            in :mod:`gridappsd.metrics`, plus the :meth:`get_dispatch_stats`
+            under ``"dispatch"``.
+        """
+        result = self.metrics.snapshot() if self.metrics is not None else {}
+        result["dispatch"] = self.get_dispatch_stats()
+        return result
+
+    def metrics_text(self):
+        """Return :meth:`get_metrics` in the Prometheus text exposition format."""
+        dispatch = self.get_dispatch_stats()
+        gauges = dict(
+            dispatch_queue_depth=dispatch["depth"],
+            dispatch_queue_high_water_mark=dispatch["high_water_mark"],
+            dispatch_dropped_total=dispatch["dropped_total"],
+        )
+        return (self.metrics or MessageMetrics()).prometheus_text(gauges)
 
-        class ResponseListener(object):
-            def __init__(self, topic, result_format):
-                self.response = None
-                self._topic = topic
-                self.result_format = result_format
+    def start_metrics_server(self, port=9464, address="127.0.0.1"):
+        """Serve :meth:`metrics_text` for Prometheus at ``http://address:port/metrics``.
 
-            def on_message(self, *args):
-                header, message = _unpack_stomp_args(*args)
-                _log.debug("Internal on message is: {} {}".format(header, message))
-                try:
-                    if self.result_format == "JSON":
-                        if isinstance(message, dict):
-                            self.response = message
-                        else:
-                            self.response = json.loads(message)
-                    else:
-                        self.response = message
-                except ValueError:
-                    self.response = dict(error="Invalid json returned", header=header, message=message)
-
-            def on_error(self, *args):
-                headers, message = _unpack_stomp_args(*args)
-                _log.error("ERR: {}".format(headers))
-                _log.error("OUR ERROR: {}".format(message))
-
-        listener = ResponseListener(reply_to, self.result_format)
-        self.subscribe(reply_to, listener)
-
-        self._conn.send(
-            body=message,
-            destination=topic,
-            headers={"reply-to": reply_to, "GOSS_HAS_SUBJECT": True, "GOSS_SUBJECT": self.__token},
-        )
-        count = 0
+        :return: the HTTP server; call ``shutdown()`` on it to stop serving.
+        """
+        return start_http_server(self.metrics_text, port, address)
+
+    def _record_request(self, pending, timed_out=False):
+        """Record the metrics and close the trace span of a finished request."""
+        if pending.span is not None:
+            pending.span.finish(timed_out=timed_out)
+        if self.metrics is None or pending.sent_at is None:
+            return
+        if timed_out:
+            self.metrics.inc("request_timeouts_total", pending.topic)
+        else:
+            self.metrics.observe("request_seconds", pending.topic, time.perf_counter() - pending.sent_at)
 
-        while count < timeout:
-            if listener.response is not None:
-                break
+    def get_response(self, topic, message, timeout=5):
+        """Send message to topic and block until the reply arrives.
+
+        Every request carries a unique correlation-id header.  By default each
+        request gets its own temporary reply queue that is unsubscribed again
+        once the request completes, so any responder can answer it.  With
+        shared_reply_queue=True the reply-to destination is a single temporary
+        queue shared by all requests on this connection, and replies are
+        matched back to their request through the correlation-id the
+        responder echoes; replies without one are discarded, so only use it
+        when every responder echoes the header.
+
+        :param topic: destination the request is sent to.
+        :param message: request body (dict, list or JSON string).
+        :param timeout: seconds to wait for the reply; may be fractional.
+        :raises TimeoutError: if no reply is received within timeout.
+        """
+        correlation_id, pending, subscription_id = self._send_request(topic, message)
+        try:
+            # Wake up as soon as the reply is delivered instead of polling;
+            # timeout may be fractional.
+            if pending.wait(timeout):
+                self._record_request(pending)
+                return pending.response
+
+            self._record_request(pending, timed_out=True)
+            raise TimeoutError("Request not responded to in a timely manner!")
+        finally:
+            self._finish_request(correlation_id, subscription_id)
+
+    def get_shared_response(self, topic, message, timeout=5):
+        """Like :meth:`get_response`, but identical requests in flight share one round trip.
+
+        While a request is awaiting its reply, the same request from any
+        client of this process connected to the same broker as the same user
+        waits for that reply instead of being sent again, see
+        :mod:`gridappsd.single_flight`.  Use it for queries only.
+        """
+        key = self._token_key() + (request_key(topic, message),)
+        return single_flight.in_flight.do(key, lambda: self.get_response(topic, message, timeout), timeout)
+
+    def get_responses(self, requests, timeout=5, max_in_flight=64, return_exceptions=False):
+        """Send many requests pipelined on this connection and return their replies in order.
+
+        Up to max_in_flight requests are outstanding at any time, so the total
+        time approaches that of the slowest request rather than the sum of
+        all round trips.  Each request waits on its own reply queue, also
+        with shared_reply_queue=True, so the replies are matched to their
+        requests even when a responder does not echo the correlation-id.
+
+        :param requests: iterable of (topic, message) tuples, see :meth:`get_response`.
+        :param timeout: seconds each request waits for its reply, counted
+            from the moment it is sent.
+        :param max_in_flight: maximum number of requests awaiting a reply.
+        :param return_exceptions: put the exception of a failed request
+            (e.g. :class:`TimeoutError`) in its place in the result instead
+            of raising it.
+        :return: list of replies, in the order of requests.
+        """
+        requests = list(requests)
+        results = [None] * len(requests)
+        responses = self.iter_responses(requests, timeout=timeout, max_in_flight=max_in_flight)
+        try:
+            for index, response in responses:
+                if isinstance(response, Exception) and not return_exceptions:
+                    raise response
+                results[index] = response
+        finally:
+            # Withdraw the requests still in flight when one failed.
+            responses.close()
+        return results
+
+    def iter_responses(self, requests, timeout=5, max_in_flight=64):
+        """Send many requests like :meth:`get_responses`, yielding replies as they complete.
+
+        :return: iterator of (index, reply) tuples, index being the position
+            of the request in requests.  For a failed request the reply is
+            the exception, e.g. :class:`TimeoutError`.
+        """
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        completed = Queue()
+        remaining = enumerate(requests)
+        exhausted = False
+        # Requests are sent in order with the same timeout, so the first entry
+        # always has the earliest deadline.
+        in_flight = {}
+        try:
+            while True:
+                while not exhausted and len(in_flight) < max_in_flight:
+                    try:
+                        index, (topic, message) = next(remaining)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    try:
+                        correlation_id, pending, subscription_id = self._send_request(
+                            topic, message, completed.put, own_reply_queue=True
+                        )
+                    except Exception as e:
+                        yield index, e
+                        continue
+                    in_flight[pending] = (index, correlation_id, subscription_id, time.monotonic() + timeout)
+
+                if not in_flight:
+                    return
+
+                deadline = next(iter(in_flight.values()))[3]
+                try:
+                    pending = completed.get(timeout=max(0.0, deadline - time.monotonic()))
+                except Empty:
+                    now = time.monotonic()
+                    for pending, (index, correlation_id, subscription_id, deadline) in list(in_flight.items()):
+                        if deadline > now:
+                            break
+                        del in_flight[pending]
+                        self._finish_request(correlation_id, subscription_id)
+                        self._record_request(pending, timed_out=True)
+                        yield index, TimeoutError("Request not responded to in a timely manner!")
+                    continue
+
+                entry = in_flight.pop(pending, None)
+                if entry is None:
+                    # A duplicate reply, or one for a request that timed out.
+                    continue
+                index, correlation_id, subscription_id, _ = entry
+                self._finish_request(correlation_id, subscription_id)
+                self._record_request(pending)
+                yield index, pending.response
+        finally:
+            for _, correlation_id, subscription_id, _ in in_flight.values():
+                self._finish_request(correlation_id, subscription_id)
+
+    def _send_request(self, topic, message, notify=None, own_reply_queue=False):
+        """Send a request and register it as pending.
+
+        :param notify: called with the _PendingResponse when its reply arrives.
+        :param own_reply_queue: wait on a reply queue of its own even with
+            shared_reply_queue=True.
+        :return: (correlation_id, pending, subscription_id); pass the
+            correlation_id and subscription_id to _finish_request when done.
+        """
+        if isinstance(message, str):
+            message = codec.loads(message)
 
-            sleep(1)
-            count += 1
+        if "resultFormat" in message:
+            self.result_format = message["resultFormat"]
 
-        if listener.response is not None:
-            return listener.response
+        message, content_type = _encode_payload(message, self._payload_encodings.content_type_for(topic))
+
+        correlation_id = uuid.uuid4().hex
+        pending = _PendingResponse(self.result_format, notify)
+        with self._pending_lock:
+            self._pending_responses[correlation_id] = pending
+
+        subscription_id = None
+        try:
+            if self.shared_reply_queue and not own_reply_queue:
+                reply_to = self._get_reply_queue()
+            else:
+                reply_to = _REPLY_QUEUE_PREFIX + correlation_id
+                subscription_id = self.subscribe(reply_to, pending.on_message)
+
+            headers = {
+                "reply-to": reply_to,
+                "correlation-id": correlation_id,
+                "GOSS_HAS_SUBJECT": True,
+                "GOSS_SUBJECT": self.__token,
+                ACCEPT_ENCODING_HEADER: compression.accept_encoding(),
+            }
+            if content_type is not None:
+                headers[CONTENT_TYPE_HEADER] = content_type
+            message = compression.compress_body(
+                message, headers, self._compression.get(topic), self.compression_threshold
+            )
+            if tracing.is_enabled():
+                pending.span = tracing.start_span("request", tracing.CLIENT, topic)
+                headers[TRACEPARENT_HEADER] = pending.span.traceparent
+            pending.topic = topic
+            pending.sent_at = time.perf_counter()
+            self._conn.send(body=message, destination=topic, headers=headers)
+        except BaseException:
+            self._finish_request(correlation_id, subscription_id)
+            raise
+        if self.metrics is not None:
+            self.metrics.count_sent(topic, message)
+        return correlation_id, pending, subscription_id
+
+    def _finish_request(self, correlation_id, subscription_id):
+        with self._pending_lock:
+            self._pending_responses.pop(correlation_id, None)
+        if subscription_id is not None:
+            self.unsubscribe(subscription_id)
+
+    def _get_reply_queue(self):
+        """Return this connection's shared reply queue, subscribing to it on first use."""
+        self._make_connection()
+        if self._shared is not None:
+            return self._shared._get_reply_queue()
+        with self._pending_lock:
+            if self._reply_queue is None:
+                reply_queue = _REPLY_QUEUE_PREFIX + uuid.uuid4().hex
+                self._reply_subscription_id = self.subscribe(reply_queue, self._on_reply)
+                self._reply_queue = reply_queue
+            return self._reply_queue
+
+    def _on_reply(self, headers, message):
+        """Hand a reply from the shared reply queue to the request waiting for it."""
+        correlation_id = headers.get("correlation-id")
+        with self._pending_lock:
+            pending = self._pending_responses.get(correlation_id)
+
+        if pending is None:
+            _log.warning(
+                "Discarding unmatched reply on {} (correlation-id: {})".format(
+                    headers.get("destination"), correlation_id
+                )
+            )
+            return
 
-        raise TimeoutError("Request not responded to in a timely manner!")
+        pending.on_message(headers, message)
 
-    def subscribe(self, topic, callback):
+    def subscribe(self, topic, callback, raw=False):
         """Subscribe to a given topic, and call callback on message.
 
-        :param topic: topic to subscribe to. See topics.py.
+        :param topic: topic to subscribe to. See topics.py.  ActiveMQ
+            wildcards are supported, e.g. ``topics.BASE_FIELD_TOPIC + ".*"``
+            or ``"goss.gridappsd.process.request.>"``.
         :param callback: function (callable) or class to be hit on
             every message. Note the class must have an "on_message"
             method. The function (or class's on_message method) will be
             passed two arguments: header and message.
+        :param raw: when True the callback's message argument is the
+            :class:`~gridappsd.message.MessageEnvelope` as received, so
+            forwarders and recorders can pass the original body on without
+            it ever being decoded.
         """
         conn_id = str(random.randint(1, 1000000))
         while conn_id in self._ids:
@@ -279,11 +972,12 @@ class GOSS(object):
 
         self._make_connection()
 
+        self._ids.add(conn_id)
         if self._conn.get_listener("gridappsd") is None:
             self._conn.set_listener("gridappsd", self._router_callback)
 
         if callable(callback):
-            self._router_callback.add_callback(topic, callback)
+            self._router_callback.add_callback(topic, callback, conn_id, raw=raw)
             # Handle the case where callback is a function
             # self._conn.set_listener(conn_id,
             #                         CallbackWrapperListener(callback, conn_id))
@@ -302,81 +996,78 @@ class GOSS(object):
             # necessarily an ideal solution because we aren't also passing on the
             # other functions in the lifecycle, however this does pass the
             # test that was written so that listeners aren't called multiple times.
-            self._router_callback.add_callback(topic, callback.on_message)
+            callback = callback.on_message
+            self._router_callback.add_callback(topic, callback, conn_id, raw=raw)
             # self._conn.set_listener(conn_id,
             #                         CallbackWrapperListener(callback.on_message, conn_id))
 
+        self._subscriptions[conn_id] = (topic, callback)
         _log.debug("Subscribing to {topic}".format(topic=topic))
         self._conn.subscribe(destination=topic, ack="auto", id=conn_id)
 
         return conn_id
 
-    def unsubscribe(self, conn_id):
-        self._conn.unsubscribe(conn_id)
+    def set_overflow_policy(self, topic, policy):
+        """Choose what happens to messages for topic when the callback queue is full.
 
-    def _make_connection(self):
-        if self._conn is None or not self._conn.is_connected():
-            _log.debug("Creating connection")
-            if self.use_auth_token is True and not self.__token:
-                # get token
-                # get initial connection
-                dt = datetime.now()
-                replyDest = f"temp.token_resp.{self.__user__}-{dt}"
+        See :class:`~gridappsd.dispatch_queue.OverflowPolicy`.  topic may
+        contain ActiveMQ wildcards.
+        """
+        self._router_callback.set_overflow_policy(topic, policy)
 
-                # create token request string
-                userAuthStr = f"{self.__user__}:{self.__pass__}"
-                base64Str = base64.b64encode(userAuthStr.encode())
+    def get_dispatch_stats(self):
+        """Return callback queue depth and per-destination drop counters.
 
-                # set up token callback
-                # send request to token topic
-                tokenTopic = "/topic/pnnl.goss.token.topic"
+        See :meth:`CallbackRouter.stats`.
+        """
+        return self._router_callback.stats()
 
-                tmpConn = Connection(
-                    [(self.stomp_address, self.stomp_port)], heartbeats=(self._heartbeat, self._heartbeat)
-                )
-                if self._override_thread_fc is not None:
-                    tmpConn.transport.override_threading(self._override_thread_fc)
-                tmpConn.connect(self.__user__, self.__pass__, wait=True)
-
-                class TokenResponseListener:
-                    def __init__(self):
-                        self.__token = None
-
-                    def get_token(self):
-                        return self.__token
-
-                    def on_message(self, *args):
-                        header, message = _unpack_stomp_args(*args)
-                        _log.debug("Internal on message is: {} {}".format(header, message))
-
-                        self.__token = str(message)
-
-                    def on_error(self, *args):
-                        headers, message = _unpack_stomp_args(*args)
-                        _log.error("ERR: {}".format(headers))
-                        _log.error("OUR ERROR: {}".format(message))
-
-                # receive token and set token variable
-                # set callback
-                listener = TokenResponseListener()
-
-                # self.subscribe(replyDest, listener)
-                tmpConn.subscribe("/queue/" + replyDest, 123)
-                tmpConn.set_listener("token_resp", listener)
-                tmpConn.send(body=base64Str, destination=tokenTopic, headers={"reply-to": replyDest})
-                # while token is null or for x iterations
-                iter = 0
-                while not self.__token and iter < 10:
-                    # wait
-                    self.__token = listener.get_token()
-                    sleep(1)
-                    iter += 1
+    def unsubscribe(self, conn_id):
+        if self._conn is not None:
+            self._conn.unsubscribe(conn_id)
+        self._ids.discard(conn_id)
+        subscription = self._subscriptions.pop(conn_id, None)
+        if subscription is not None:
+            self._router_callback.remove_callback(*subscription)
 
+    def _make_connection(self):
+        if self._share_connection:
+            if self._shared is None:
+                self._acquire_shared()
+            self._shared._make_connection()
+            self._conn = self._shared._conn
+            self.__token = self._shared.__token
+            return
+        with self._connect_lock:
+            if self._conn is None or not self._conn.is_connected():
+                self._connect()
+
+    def _connect(self):
+        _log.debug("Creating connection")
+        self._closing = False
+        for attempt in range(2):
+            if self.use_auth_token is True and not self.__token:
+                # Tokens are shared process wide; only the first client
+                # for an address and user pays for the handshake.
+                self.__token = token_cache.get_or_fetch(self._token_key(), self._request_token)
+
+            if self._reply_queue is not None:
+                # Temporary queues die with the connection that created them.
+                self._router_callback.remove_callback(self._reply_queue, self._on_reply)
+                self._subscriptions.pop(self._reply_subscription_id, None)
+                self._ids.discard(self._reply_subscription_id)
+                self._reply_queue = None
+
+            # Bodies arrive as bytes; CallbackRouter turns them into text
+            # unless they carry a binary payload encoding.
             self._conn = Connection(
-                [(self.stomp_address, self.stomp_port)], heartbeats=(self._heartbeat, self._heartbeat)
+                [(self.stomp_address, self.stomp_port)],
+                heartbeats=(self._heartbeat, self._heartbeat),
+                auto_decode=False,
             )
             if self._override_thread_fc is not None:
                 self._conn.transport.override_threading(self._override_thread_fc)
+            self._conn.set_listener("goss-connection", _ConnectionListener(self, self._conn))
             try:
                 if self.use_auth_token and self.__token is not None:
                     self._conn.connect(self.__token, "", wait=True)
@@ -388,54 +1079,298 @@ class GOSS(object):
                 _log.error("NotConnectedException: {e}".format(e=e))
             except AttributeError as e:
                 _log.error("AttributeError: {e}".format(e=e))
+            except ConnectFailedException:
+                # The broker rejected the login; only a cached token is worth a retry.
+                if attempt or not (self.use_auth_token and self.__token):
+                    raise
+
+            if attempt or self._conn.is_connected() or not (self.use_auth_token and self.__token):
+                break
+            # The cached token may have expired on the server; fetch a new one.
+            _log.debug("Connecting with cached token failed, requesting a new token")
+            token_cache.invalidate(self._token_key())
+            self.__token = None
+
+        if self._conn.is_connected():
+            self._resubscribe()
+
+    def _resubscribe(self):
+        """Re-issue the subscriptions of this client and its views on a new connection."""
+        subscriptions = dict(self._subscriptions)
+        for view in list(self._views):
+            subscriptions.update(view._subscriptions)
+        if not subscriptions:
+            return
+        self._conn.set_listener("gridappsd", self._router_callback)
+        for conn_id, (topic, _) in subscriptions.items():
+            _log.debug("Resubscribing to {topic}".format(topic=topic))
+            self._conn.subscribe(destination=topic, ack="auto", id=conn_id)
+
+    def _token_key(self):
+        return token_key(self.stomp_address, self.stomp_port, self.__user__, self.__pass__)
+
+    def _request_token(self):
+        """Fetch an auth token from the GOSS token service over a temporary connection.
+
+        :return: the token, or None if the service did not answer in time.
+        """
+        reply_dest, body = _token_request(self.__user__, self.__pass__)
+
+        tmp_conn = Connection([(self.stomp_address, self.stomp_port)], heartbeats=(self._heartbeat, self._heartbeat))
+        if self._override_thread_fc is not None:
+            tmp_conn.transport.override_threading(self._override_thread_fc)
+        tmp_conn.connect(self.__user__, self.__pass__, wait=True)
+        _set_nodelay(tmp_conn)
+        try:
+            listener = _TokenResponseListener()
+            tmp_conn.set_listener("token_resp", listener)
+            tmp_conn.subscribe("/queue/" + reply_dest, 123)
+            tmp_conn.send(body=body, destination=TOKEN_TOPIC, headers={"reply-to": reply_dest})
+            if not listener.wait(_TOKEN_TIMEOUT):
+                _log.error("Token request not responded to within {} seconds".format(_TOKEN_TIMEOUT))
+            return listener.token
+        finally:
+            tmp_conn.disconnect()
 
 
 class CallbackRouter(object):
-    def __init__(self):
+    """Dispatch messages received from the stomp connection to subscribed callbacks.
+
+    Messages are queued by the stomp receiver thread and handed to callbacks on
+    one or more worker threads.  With more than one worker, every destination
+    is always served by the same worker, so callbacks still see the messages of
+    a given topic in the order they arrived.  Replies to requests, on
+    temporary ``/temp-queue/response.*`` queues, are handed over directly
+    by the receiver thread, so they are never dropped and reach a request
+    made from inside a callback.
+
+    Destinations are resolved through a :class:`~gridappsd.topic_matcher.TopicMatcher`,
+    so callbacks registered for ActiveMQ wildcard topics receive the messages of
+    every concrete destination the wildcard covers.
+
+    Waiting messages are held in a :class:`~gridappsd.dispatch_queue.DispatchQueue`.
+    With max_queue_depth set, a message arriving while a worker's queue is
+    full is handled according to the overflow policy of its destination,
+    see :meth:`set_overflow_policy`.  Queue depth and drop counts are
+    available from :meth:`stats`.
+
+    :param workers: number of dispatch threads to run.
+    :param max_queue_depth: maximum number of messages waiting for each
+        worker, 0 for unbounded.
+    :param overflow_policy: :class:`~gridappsd.dispatch_queue.OverflowPolicy`
+        for destinations without a policy of their own.
+    :param collect_metrics: record message counts and dispatch latencies in
+        :attr:`metrics`, a :class:`~gridappsd.metrics.MessageMetrics`.
+    """
+
+    def __init__(self, workers=1, max_queue_depth=0, overflow_policy=OverflowPolicy.BLOCK, collect_metrics=True):
+        if workers < 1:
+            raise ValueError("CallbackRouter needs at least one worker")
         self.callbacks = {}
         self._topics_callback_map = defaultdict(list)
-        self._queue_callerback = Queue()
-        self._thread = threading.Thread(target=self.run_callbacks)
-        self._thread.daemon = True
-        self._thread.start()
+        self._matcher = TopicMatcher()
+        self._routes = {}
+        self._subscription_ids = set()
+        self._overflow_policy = OverflowPolicy(overflow_policy)
+        self._policy_matcher = TopicMatcher()
+        self._policies = {}
+        self.metrics = MessageMetrics() if collect_metrics else None
+        self._queues = [DispatchQueue(max_queue_depth) for _ in range(workers)]
+        self._queue_callerback = self._queues[0]
+        self._threads = []
+        for index, queue in enumerate(self._queues):
+            thread = threading.Thread(target=self.run_callbacks, args=(queue,), name=f"CallbackRouter-{index}")
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        self._thread = self._threads[0]
+
+    def _queue_for(self, destination):
+        if len(self._queues) == 1:
+            return self._queue_callerback
+        return self._queues[hash(destination) % len(self._queues)]
+
+    def set_overflow_policy(self, topic, policy):
+        """Set the overflow policy for topic, which may contain wildcards.
+
+        :param topic: topic or wildcard pattern, normalized like add_callback.
+        :param policy: an OverflowPolicy (or its value), or None to fall back
+            to the router's default again.
+        """
+        topic = self._normalize_topic(topic)
+        previous = self._policies.pop(topic, None)
+        if previous is not None:
+            self._policy_matcher.remove(topic, previous)
+        if policy is not None:
+            policy = OverflowPolicy(policy)
+            self._policies[topic] = policy
+            self._policy_matcher.add(topic, policy)
+
+    def overflow_policy_for(self, destination):
+        """Return the overflow policy applied to messages for destination."""
+        policies = self._policy_matcher.match(destination)
+        return policies[0] if policies else self._overflow_policy
+
+    def stats(self):
+        """Return queue depth and drop counters summed over all workers.
+
+        :return: dict with depth, high_water_mark, dropped_total and dropped,
+            a mapping of destination to number of messages dropped.
+        """
+        depth = high_water_mark = 0
+        dropped = defaultdict(int)
+        for queue in self._queues:
+            queue_stats = queue.stats()
+            depth += queue_stats["depth"]
+            high_water_mark = max(high_water_mark, queue_stats["high_water_mark"])
+            for destination, count in queue_stats["dropped"].items():
+                dropped[destination] += count
+        return dict(
+            depth=depth,
+            high_water_mark=high_water_mark,
+            dropped=dict(dropped),
+            dropped_total=sum(dropped.values()),
+        )
 
-    def run_callbacks(self):
+    def run_callbacks(self, queue=None):
+        if queue is None:
+            queue = self._queue_callerback
         _log.debug("Starting thread queue")
         while True:
-            cb, hdrs, msg = self._queue_callerback.get()
-            try:
-                msg = json.loads(msg)
-            except (TypeError, ValueError):
-                # msg was not JSON text (already a dict, or plain string body);
-                # pass it through unchanged rather than as a decode failure.
-                pass
+            cb, envelope, enqueued_at = queue.get()
+            self._dispatch(cb, envelope, enqueued_at)
+            queue.task_done()
+
+    def _dispatch(self, cb, envelope, enqueued_at):
+        hdrs = envelope.headers
+        metrics = self.metrics
+        if metrics is not None:
+            started = decoded = time.perf_counter()
+            for _, raw in cb:
+                if not raw:
+                    # Decode up front to time it apart from the callbacks.
+                    _ = envelope.body
+                    decoded = time.perf_counter()
+                    break
+
+        span = tracing.start_consumer_span(hdrs) if tracing.is_enabled() else None
+        if span is not None:
+            span.attributes["queue_wait"] = time.perf_counter() - enqueued_at
+            tracing.set_current_span(span)
+
+        _dispatch_context.headers = hdrs
+        try:
+            for c, raw in cb:
+                try:
+                    # The body is decoded on first use and shared by every
+                    # callback; raw callbacks get the envelope untouched.
+                    c(hdrs, envelope if raw else envelope.body)
+                except Exception:
+                    # A failing callback must not stop dispatch for every
+                    # other subscription served by this thread.
+                    _log.exception("Callback {} failed for {}".format(c, hdrs.get("destination")))
+        finally:
+            _dispatch_context.headers = None
+            if span is not None:
+                tracing.set_current_span(None)
+                span.finish()
+        if metrics is not None:
+            metrics.observe_dispatch(
+                _metric_destination(hdrs.get("destination", "")),
+                started - enqueued_at,
+                decoded - started,
+                time.perf_counter() - decoded,
+            )
 
-            for c in cb:
-                c(hdrs, msg)
-            sleep(0.01)
+    def join(self, timeout=None):
+        """Wait until every message received so far was handed to its callbacks.
 
-    def add_callback(self, topic, callback):
-        if not topic.startswith("/topic/") and not topic.startswith("/temp-queue/"):
-            topic = "/queue/{topic}".format(topic=topic)
+        :return: False if timeout seconds passed first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for queue in self._queues:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not queue.join(remaining):
+                return False
+        return True
+
+    @staticmethod
+    def _normalize_topic(topic):
+        return normalize_destination(topic)
+
+    def add_callback(self, topic, callback, subscription_id=None, raw=False):
+        """Route messages for topic to callback.
+
+        topic may contain ActiveMQ wildcards (``*`` for one path element, ``>``
+        for the remaining elements).  When subscription_id is given, frames
+        that carry that stomp subscription id are only routed to the callbacks
+        registered with it, so overlapping subscriptions do not deliver the
+        same message to a callback twice; frames carrying an id that is not
+        registered (any more) are dropped.  A raw callback is passed the
+        :class:`~gridappsd.message.MessageEnvelope` instead of the decoded body.
+        """
+        topic = self._normalize_topic(topic)
         if callback in self._topics_callback_map[topic]:
             raise ValueError("Callbacks can only be used one time per topic")
         _log.debug("Added callbac using topic {topic}".format(topic=topic))
         self._topics_callback_map[topic].append(callback)
+        route = (subscription_id, callback, raw)
+        self._routes[(topic, callback)] = route
+        if subscription_id is not None:
+            self._subscription_ids.add(subscription_id)
+        self._matcher.add(topic, route)
 
     def remove_callback(self, topic, callback):
+        topic = self._normalize_topic(topic)
         if topic in self._topics_callback_map:
             callbacks = self._topics_callback_map[topic]
             try:
                 callbacks.remove(callback)
             except ValueError:
                 pass
+            if not callbacks:
+                del self._topics_callback_map[topic]
+        route = self._routes.pop((topic, callback), None)
+        if route is not None:
+            self._subscription_ids.discard(route[0])
+            self._matcher.remove(topic, route)
+
+    def _resolve_routes(self, destination, subscription_id):
+        routes = self._matcher.match(destination)
+        if subscription_id is None:
+            return [(callback, raw) for _, callback, raw in routes]
+        if subscription_id in self._subscription_ids:
+            return [(callback, raw) for sub_id, callback, raw in routes if sub_id == subscription_id]
+        # The subscription is gone, e.g. a frame still in flight when its
+        # view unsubscribed; other subscriptions get their own copy.
+        return []
+
+    def resolve(self, destination, subscription_id=None):
+        """Return the callbacks a frame for destination is dispatched to."""
+        return [callback for callback, _ in self._resolve_routes(destination, subscription_id)]
 
     def on_message(self, *args):
         headers, message = _unpack_stomp_args(*args)
         destination = headers["destination"]
-        # _log.debug("Topic map keys are: {keys}".format(keys=self._topics_callback_map.keys()))
-        if destination in self._topics_callback_map:
-            self._queue_callerback.put((self._topics_callback_map[destination], headers, message))
+        if self.metrics is not None:
+            self.metrics.count_received(_metric_destination(destination), message)
+        subscription_id = headers.get("subscription")
+        if subscription_id is not None and subscription_id not in self._subscription_ids:
+            _log.debug("Dropping message for {} on unknown subscription {}".format(destination, subscription_id))
+            return
+        message = payload_encoding.text_body(headers, compression.decompress_body(headers, message))
+        routes = self._resolve_routes(destination, subscription_id)
+        if routes and destination.startswith(_REPLY_QUEUE_PREFIX):
+            # Replies only wake up the request waiting for them.  Completing
+            # them here rather than behind the callbacks lets a callback wait
+            # on get_response without blocking the worker its reply needs.
+            self._dispatch(routes, MessageEnvelope(headers, message), time.perf_counter())
+        elif routes:
+            self._queue_for(destination).put(
+                destination,
+                (routes, MessageEnvelope(headers, message), time.perf_counter()),
+                self.overflow_policy_for(destination),
+            )
         else:
             _log.error("INVALID DESTINATION {destination}".format(destination=destination))
 
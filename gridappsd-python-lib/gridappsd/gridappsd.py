@@ -38,18 +38,25 @@
 # UNITED STATES DEPARTMENT OF ENERGY under Contract DE-AC05-76RL01830
 # -------------------------------------------------------------------------------
 
+import asyncio
 import inspect
+import itertools
 import logging
+import re
+from collections import deque
 from datetime import datetime
 from logging import INFO
 import time
+from typing import Optional
 
 from gridappsd.goss import GOSS
 from gridappsd import utils, json_extension as json
 import gridappsd.topics as t
 from gridappsd import ProcessStatusEnum
+from gridappsd.columns import to_columns
 from gridappsd.houses import Houses
 from gridappsd.loghandler import Logger, VALID_LOG_LEVELS, getNameToLevel
+from gridappsd.query_cache import QueryCache, default_query_cache
 
 # from . configuration_types import ConfigurationType
 
@@ -58,15 +65,285 @@ _log = logging.getLogger(inspect.getmodulename(__file__))
 POWERGRID_MODEL = "powergridmodel"
 
 
+# A LIMIT or OFFSET clause ending a SPARQL query.
+_LIMIT_OFFSET = re.compile(r"\b(LIMIT|OFFSET)\s+\d+\s*$", re.IGNORECASE)
+
+
 class InvalidSimulationIdError(Exception):
     pass
 
 
-class GridAPPSD(GOSS):
+def _sparql_result(response):
+    """Return the SPARQL JSON result of a query response, raising the error a failed request ended with."""
+    if isinstance(response, Exception):
+        raise response
+    try:
+        response["data"]["results"]["bindings"]
+    except (KeyError, TypeError):
+        raise ValueError("Unexpected SPARQL query response: {!r:.200}".format(response))
+    return response["data"]
+
+
+def _bindings(response):
+    return _sparql_result(response)["results"]["bindings"]
+
+
+class _QueryMixin(object):
+    """Platform request helpers shared by :class:`GridAPPSD` and :class:`~gridappsd.aio.AsyncGridAPPSD`.
+
+    Every method builds its request and returns ``self.get_response(...)``
+    (or ``self.get_responses(...)`` for the batch variants), so on the asyncio
+    client, whose get_response is a coroutine function, each one returns an
+    awaitable.  Model queries go through ``self.get_shared_response(...)``
+    instead, so identical queries issued concurrently are sent only once.
+
+    Responses to the model queries that rarely change (object types, model
+    names, model info, object dictionaries and SPARQL queries) are served from
+    :attr:`query_cache` when one is set, see :mod:`gridappsd.query_cache`.
+    """
+
+    query_cache: Optional[QueryCache] = None
+
+    def _cached_response(self, topic, payload, timeout=30, message=None):
+        """Return the cached response to payload, or send message (default payload) and cache its response."""
+        cache = self.query_cache
+        if message is None:
+            message = payload
+        if cache is None:
+            return self.get_shared_response(topic, message, timeout=timeout)
+        response = cache.get(topic, payload)
+        if inspect.iscoroutinefunction(self.get_response):
+
+            async def fetch():
+                if response is not None:
+                    return response
+                fetched = await self.get_shared_response(topic, message, timeout=timeout)
+                cache.put(topic, payload, fetched)
+                return fetched
+
+            return fetch()
+        if response is None:
+            response = self.get_shared_response(topic, message, timeout=timeout)
+            cache.put(topic, payload, response)
+        return response
+
+    def query_object_types(self, model_id=None):
+        """Allows the caller to query the different object types.
+
+        :param model_id:
+        :return:
+        """
+        args = {}
+        if model_id:
+            args["modelId"] = model_id
+        payload = self._build_query_payload("QUERY_OBJECT_TYPES", **args)
+        return self._cached_response(t.REQUEST_POWERGRID_DATA, payload)
+
+    def query_model_names(self, model_id=None):
+        args = {}
+        if model_id is not None:
+            args["modelId"] = model_id
+        payload = self._build_query_payload("QUERY_MODEL_NAMES", **args)
+        return self._cached_response(t.REQUEST_POWERGRID_DATA, payload)
+
+    def query_model_info(self):
+        payload = self._build_query_payload("QUERY_MODEL_INFO")
+        return self._cached_response(t.REQUEST_POWERGRID_DATA, payload)
+
+    def query_model(self, model_id=None, object_type=None, object_id=None, response_format="JSON"):
+        args = {}
+        if model_id is not None:
+            args["modelId"] = model_id
+        if object_type is not None:
+            args["objectType"] = object_type
+        if object_id is not None:
+            args["objectId"] = object_id
+        if response_format is not None:
+            args["resultFormat"] = response_format
+        payload = self._build_query_payload("QUERY_MODEL", **args)
+        return self.get_shared_response(t.REQUEST_POWERGRID_DATA, payload, timeout=30)
+
+    def query_object(self, object_id, model_id=None):
+        payload = self._object_query_payload(object_id, model_id)
+        return self.get_shared_response(t.REQUEST_POWERGRID_DATA, payload, timeout=30)
+
+    def query_objects(self, object_ids, model_id=None, max_in_flight=64, return_exceptions=False):
+        """Batch variant of :meth:`query_object`.
+
+        The requests for all object_ids are pipelined, see get_responses.
+
+        :return: list of responses in the order of object_ids.
+        """
+        requests = [
+            (t.REQUEST_POWERGRID_DATA, self._object_query_payload(object_id, model_id)) for object_id in object_ids
+        ]
+        return self.get_responses(
+            requests, timeout=30, max_in_flight=max_in_flight, return_exceptions=return_exceptions
+        )
+
+    def query_object_dictionary(self, model_id, object_type=None, object_id=None):
+        payload = self.object_dictionary_payload(model_id, object_type, object_id)
+        return self._cached_response(t.REQUEST_POWERGRID_DATA, payload)
+
+    def query_object_dictionaries(self, model_id, object_ids, max_in_flight=64, return_exceptions=False):
+        """Batch variant of :meth:`query_object_dictionary` for many object ids of one model.
+
+        :return: list of responses in the order of object_ids.
+        """
+        requests = [
+            (t.REQUEST_POWERGRID_DATA, self.object_dictionary_payload(model_id, object_id=object_id))
+            for object_id in object_ids
+        ]
+        return self.get_responses(
+            requests, timeout=30, max_in_flight=max_in_flight, return_exceptions=return_exceptions
+        )
+
+    def _object_query_payload(self, object_id, model_id=None):
+        if not object_id:
+            raise ValueError("Invalid object_id specified.")
+        args = dict(objectId=object_id)
+        if model_id is not None:
+            args["modelId"] = model_id
+        return self._build_query_payload("QUERY_OBJECT", **args)
+
+    def object_dictionary_payload(self, model_id, object_type=None, object_id=None):
+        """Return the request payload of :meth:`query_object_dictionary`.
+
+        For sending many object dictionary queries at once with get_responses.
+        """
+        if not model_id:
+            raise ValueError("model_id is not specified.")
+        if not object_id and not object_type:
+            raise ValueError("No obejct_id or object_type specified.")
+        args = {}
+        args["modelId"] = model_id
+        if object_id is not None:
+            args["objectId"] = object_id
+        if object_type is not None:
+            args["objectType"] = object_type
+        return self._build_query_payload("QUERY_OBJECT_DICT", **args)
+
+    def query_data(self, query, database_type=POWERGRID_MODEL, timeout=30):
+        request_topic = self._data_request_topic(database_type)
+        payload = self._build_query_payload("QUERY", queryString=query)
+        return self._cached_response(request_topic, payload, timeout=timeout, message=json.dumps(payload))
+
+    def query_data_columns(self, query, dtypes=None, database_type=POWERGRID_MODEL, timeout=30):
+        """Return the result of a SPARQL SELECT query as one array per variable.
+
+        See :func:`gridappsd.columns.to_columns`.  On the asyncio client this
+        returns an awaitable.
+
+        :param dtypes: type of the values of some variables: ``float``,
+            ``int``, ``bool`` or ``str``.
+        :return: dict of :class:`~gridappsd.columns.Column` by variable name.
+        """
+        response = self.query_data(query, database_type=database_type, timeout=timeout)
+        if inspect.isawaitable(response):
+
+            async def convert():
+                return to_columns(_sparql_result(await response), dtypes)
+
+            return convert()
+        return to_columns(_sparql_result(response), dtypes)
+
+    def query_data_iter(self, query, page_size=1000, prefetch=1, database_type=POWERGRID_MODEL, timeout=30):
+        """Yield the result rows of a SPARQL SELECT query, fetched page by page.
+
+        The query is sent again with ``LIMIT page_size OFFSET n`` appended for
+        each page, until a page comes back short.  While the caller works
+        through one page the next prefetch pages are already requested, so at
+        most 1 + prefetch pages are held at a time and the first rows arrive
+        after one page instead of the whole result.  Give the query an
+        ORDER BY so consecutive pages neither overlap nor skip rows.
+
+        On the asyncio client this returns an asynchronous iterator.
+
+        :param query: SPARQL SELECT query without a LIMIT or OFFSET clause.
+        :param page_size: rows requested per page.
+        :param prefetch: pages requested ahead of the one being consumed.
+        :param timeout: seconds to wait for each page.
+        :return: iterator of the rows of ``response["data"]["results"]["bindings"]``.
+        """
+        if page_size < 1:
+            raise ValueError("page_size must be at least 1")
+        if prefetch < 0:
+            raise ValueError("prefetch must not be negative")
+        if _LIMIT_OFFSET.search(query):
+            raise ValueError("query_data_iter adds LIMIT and OFFSET to the query itself")
+        request_topic = self._data_request_topic(database_type)
+
+        def pages():
+            offset = 0
+            while True:
+                paged = "{}\nLIMIT {} OFFSET {}".format(query, page_size, offset)
+                yield request_topic, json.dumps(self._build_query_payload("QUERY", queryString=paged))
+                offset += page_size
+
+        if inspect.iscoroutinefunction(self.get_response):
+            return self._aiter_rows(pages(), page_size, prefetch, timeout)
+        return self._iter_rows(pages(), page_size, prefetch, timeout)
+
+    def _iter_rows(self, pages, page_size, prefetch, timeout):
+        responses = self.iter_responses(pages, timeout=timeout, max_in_flight=1 + prefetch)
+        # Pages may be answered out of order; hold the early ones back.
+        arrived = {}
+        expected = 0
+        try:
+            for index, response in responses:
+                arrived[index] = response
+                while expected in arrived:
+                    rows = _bindings(arrived.pop(expected))
+                    expected += 1
+                    yield from rows
+                    if len(rows) < page_size:
+                        return
+        finally:
+            responses.close()
+
+    async def _aiter_rows(self, pages, page_size, prefetch, timeout):
+        # Like iter_responses, every page waits on a reply queue of its own.
+        requested = deque()
+        try:
+            for topic, message in itertools.islice(pages, 1 + prefetch):
+                requested.append(asyncio.ensure_future(self._request(topic, message, timeout)))
+            while requested:
+                rows = _bindings(await requested.popleft())
+                if len(rows) == page_size:
+                    topic, message = next(pages)
+                    requested.append(asyncio.ensure_future(self._request(topic, message, timeout)))
+                for row in rows:
+                    yield row
+                if len(rows) < page_size:
+                    return
+        finally:
+            for request in requested:
+                request.cancel()
+
+    def _data_request_topic(self, database_type):
+        if database_type != POWERGRID_MODEL:
+            raise ValueError("Only supported {} currently".format(POWERGRID_MODEL))
+        # Do this so we can eventually support other db through this mechanism.
+        return ".".join((t.REQUEST_DATA, database_type))
+
+    def get_platform_status(self, applications=True, services=True, appInstances=True, serviceInstances=True):
+        _log.debug("Retrieving platform status from GridAPPSD")
+        msg = dict(
+            appInstances=appInstances, applications=applications, services=services, serviceInstances=serviceInstances
+        )
+        return self.get_response(t.REQUEST_PLATFORM_STATUS, json.dumps(msg), timeout=30)
+
+    def _build_query_payload(self, request_type, response_format="JSON", **kwargs):
+        d = dict(requestType=request_type, resultFormat=response_format)
+        d.update(**kwargs)
+        return d
+
+
+class GridAPPSD(GOSS, _QueryMixin):
     """The main :class:`GridAPPSD` interface for connecting to a GridAPPSD instance"""
 
     # TODO Get the caller from the traceback/inspect module.
-    def __init__(self, simulation_id=None, address=None, **kwargs):
+    def __init__(self, simulation_id=None, address=None, query_cache=None, **kwargs):
         if address is None:
             address = utils.get_gridappsd_address()
 
@@ -82,6 +359,7 @@ class GridAPPSD(GOSS):
 
         super(GridAPPSD, self).__init__(stomp_address=address[0], stomp_port=address[1], **kwargs)
         self._houses: Houses = Houses(self)
+        self.query_cache = query_cache if query_cache is not None else default_query_cache()
         self._simulation_log_topic = None
         self._simulation_id = None
         # Transfer simulation_id from environment if its not passed
@@ -172,84 +450,6 @@ class GridAPPSD(GOSS):
         """
         return self._get_status()
 
-    def query_object_types(self, model_id=None):
-        """Allows the caller to query the different object types.
-
-        :param model_id:
-        :return:
-        """
-        args = {}
-        if model_id:
-            args["modelId"] = model_id
-        payload = self._build_query_payload("QUERY_OBJECT_TYPES", **args)
-        return self.get_response(t.REQUEST_POWERGRID_DATA, payload, timeout=30)
-
-    def query_model_names(self, model_id=None):
-        args = {}
-        if model_id is not None:
-            args["modelId"] = model_id
-        payload = self._build_query_payload("QUERY_MODEL_NAMES", **args)
-        return self.get_response(t.REQUEST_POWERGRID_DATA, payload, timeout=30)
-
-    def query_model_info(self):
-        payload = self._build_query_payload("QUERY_MODEL_INFO")
-        return self.get_response(t.REQUEST_POWERGRID_DATA, payload, timeout=30)
-
-    def query_model(self, model_id=None, object_type=None, object_id=None, response_format="JSON"):
-        args = {}
-        if model_id is not None:
-            args["modelId"] = model_id
-        if object_type is not None:
-            args["objectType"] = object_type
-        if object_id is not None:
-            args["objectId"] = object_id
-        if response_format is not None:
-            args["resultFormat"] = response_format
-        payload = self._build_query_payload("QUERY_MODEL", **args)
-        return self.get_response(t.REQUEST_POWERGRID_DATA, payload, timeout=30)
-
-    def query_object(self, object_id, model_id=None):
-        if not object_id:
-            raise ValueError("Invalid object_id specified.")
-        args = dict(objectId=object_id)
-        if model_id is not None:
-            args["modelId"] = model_id
-        payload = self._build_query_payload("QUERY_OBJECT", **args)
-        return self.get_response(t.REQUEST_POWERGRID_DATA, payload, timeout=30)
-
-    def query_object_dictionary(self, model_id, object_type=None, object_id=None):
-        if not model_id:
-            raise ValueError("model_id is not specified.")
-        if not object_id and not object_type:
-            raise ValueError("No obejct_id or object_type specified.")
-        args = {}
-        args["modelId"] = model_id
-        if object_id is not None:
-            args["objectId"] = object_id
-        if object_type is not None:
-            args["objectType"] = object_type
-        payload = self._build_query_payload("QUERY_OBJECT_DICT", **args)
-        return self.get_response(t.REQUEST_POWERGRID_DATA, payload, timeout=30)
-
-    def query_data(self, query, database_type=POWERGRID_MODEL, timeout=30):
-        request_type = None
-        if database_type == POWERGRID_MODEL:
-            request_type = "QUERY"
-        else:
-            raise ValueError("Only supported {} currently".format(POWERGRID_MODEL))
-
-        payload = self._build_query_payload(request_type, queryString=query)
-        # Do this so we can eventually support other db through this mechanism.
-        request_topic = ".".join((t.REQUEST_DATA, database_type))
-        return self.get_response(request_topic, json.dumps(payload), timeout=timeout)
-
-    def get_platform_status(self, applications=True, services=True, appInstances=True, serviceInstances=True):
-        _log.debug("Retrieving platform status from GridAPPSD")
-        msg = dict(
-            appInstances=appInstances, applications=applications, services=services, serviceInstances=serviceInstances
-        )
-        return self.get_response(t.REQUEST_PLATFORM_STATUS, json.dumps(msg), timeout=30)
-
     def send_simulation_status(self, status, message, log_level=INFO):
         _log.debug("SEND SIM STATUS: {} message: {}".format(status, message))
         # Transform log level into something for use if we can.
@@ -282,8 +482,3 @@ class GridAPPSD(GOSS):
         data = json.dumps(status_message)
 
         return data
-
-    def _build_query_payload(self, request_type, response_format="JSON", **kwargs):
-        d = dict(requestType=request_type, resultFormat=response_format)
-        d.update(**kwargs)
-        return d
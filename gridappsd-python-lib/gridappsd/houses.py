@@ -76,20 +76,12 @@ WHERE {
 """
                 % feeder
             )
-            response = self._gappsd.query_data(query)
+            columns = self._gappsd.query_data_columns(query, dtypes={d: str for d in House._fields})
+            fields = [columns[d].to_list() for d in House._fields]
             houses = {}
-            for rec in response["data"]["results"]["bindings"]:
-                create_order = {}
-                name = None
-                for d in House._fields:
-                    if d == "name":
-                        name = rec[d]["value"]
-                    try:
-                        create_order[d] = rec[d]["value"]
-                    except KeyError:
-                        create_order[d] = None
-
-                houses[name] = House(**create_order)
+            for values in zip(*fields):
+                house = House(*values)
+                houses[house.name] = house
 
             self._houses[feeder] = houses
 
@@ -11,11 +11,12 @@ class JsonComplex:
 
 def jsonDecoderExtension(obj: Any):
     rv = obj
-    if isinstance(obj, dict):
+    # Only an object with exactly the real and imag keys is a JsonComplex;
+    # check the keys first so other objects don't pay for an exception.
+    if isinstance(obj, dict) and len(obj) == 2 and "real" in obj and "imag" in obj:
         try:
-            complexInstance = JsonComplex(**obj)
-            rv = complex(complexInstance.real, complexInstance.imag)
-        except (TypeError, KeyError):
+            rv = complex(obj["real"], obj["imag"])
+        except (TypeError, ValueError):
             rv = obj
     return rv
 
@@ -109,7 +110,7 @@ def load(
 
 
 def loads(
-    data: str, *, cls=None, parse_float=None, parse_int=None, parse_constant=None, object_pairs_hook=None, **kw
+    data: str | bytes, *, cls=None, parse_float=None, parse_int=None, parse_constant=None, object_pairs_hook=None, **kw
 ) -> Any:
     rv = _json.loads(
         data,
@@ -0,0 +1,368 @@
+"""An in-process STOMP 1.2 broker for offline testing and benchmarking.
+
+:class:`LoopbackBroker` speaks enough of the ActiveMQ dialect of STOMP for the
+clients of this library to run unmodified against it, without a GridAPPS-D
+container or any network beyond localhost:
+
+* ``/topic/`` destinations deliver every message to every subscriber.
+* ``/queue/`` destinations deliver each message to one subscriber, taking
+  turns, and hold messages sent while nobody is subscribed.
+* ``/temp-queue/`` destinations behave like queues but drop messages nobody
+  is subscribed to.
+* Subscriptions may use the ActiveMQ ``*`` and ``>`` wildcards.
+* The GOSS token handshake on :data:`~gridappsd.goss.TOKEN_TOPIC` issues
+  tokens that the broker then accepts as logins.
+
+Platform services can be stood in for with :meth:`LoopbackBroker.add_responder`.
+
+.. code-block:: python
+
+    with LoopbackBroker() as broker:
+        broker.add_responder(t.PLATFORM_STATUS, lambda headers, message: {"status": "ok"})
+        gapps = GridAPPSD(address=broker.address, username="system", password="manager")
+
+The broker runs an asyncio event loop on a daemon thread, so it can serve
+threaded clients from the same process.  To run it standalone:
+
+.. code-block:: shell
+
+    python -m gridappsd.loopback --port 61613
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import itertools
+import logging
+import threading
+import uuid
+from collections import deque
+from typing import Any, Callable, Optional
+
+from gridappsd import codec
+from gridappsd.goss import TOKEN_TOPIC
+from gridappsd.stomp_frame import Frame, FrameParser, encode_frame
+from gridappsd.topic_matcher import TopicMatcher, is_wildcard
+
+_log = logging.getLogger(__name__)
+
+# Headers of a SEND frame that are not passed on in the MESSAGE frames it becomes.
+_SEND_ONLY_HEADERS = ("destination", "receipt", "content-length", "transaction")
+
+
+def _full_name(destination: str) -> str:
+    # Like ActiveMQ, names without a /topic/, /queue/ or /temp-queue/ prefix are queues.
+    return destination if destination.startswith("/") else "/queue/" + destination
+
+
+class _Client(object):
+    """A connected STOMP client and its subscriptions."""
+
+    def __init__(self, number: int, writer: asyncio.StreamWriter):
+        self.number = number
+        self.writer = writer
+        self.login: Optional[str] = None
+        # Subscription id -> destination pattern.
+        self.subscriptions: dict[str, str] = {}
+        self._message_ids = itertools.count()
+
+    def next_message_id(self) -> str:
+        return "ID:loopback-{}-{}".format(self.number, next(self._message_ids))
+
+    def write(self, frame: Frame):
+        self.writer.write(encode_frame(frame))
+
+
+class LoopbackBroker(object):
+    """A STOMP broker serving localhost from a background thread.
+
+    :param host: interface to listen on.
+    :param port: TCP port, 0 to pick a free one (see :attr:`port`).
+    :param users: accepted login names and passwords, None to accept any
+        login.  Tokens the broker issued are always accepted.
+    :param max_pending: messages held per queue while it has no subscriber;
+        older ones are dropped.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        users: Optional[dict[str, str]] = None,
+        max_pending: int = 10000,
+    ):
+        self.host = host
+        self.port = port
+        self.users = users
+        self.max_pending = max_pending
+        self.messages_routed = 0
+        self._tokens: dict[str, str] = {}
+        self._responders: dict[str, Callable[[dict[str, Any], Any], Any]] = {}
+        self._matcher = TopicMatcher()
+        self._pending: dict[str, deque[Frame]] = {}
+        self._turns: dict[str, int] = {}
+        self._clients: set[_Client] = set()
+        self._handlers: set[asyncio.Task] = set()
+        self._client_numbers = itertools.count(1)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.Server] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> tuple[str, int]:
+        """The (host, port) clients connect to, e.g. the ``address`` of :class:`~gridappsd.GridAPPSD`."""
+        return self.host, self.port
+
+    def environment(self) -> dict[str, str]:
+        """Return the GRIDAPPSD_ADDRESS and GRIDAPPSD_PORT values that point clients at this broker."""
+        return {"GRIDAPPSD_ADDRESS": self.host, "GRIDAPPSD_PORT": str(self.port)}
+
+    def add_responder(self, destination: str, handler: Callable[[dict[str, Any], Any], Any]):
+        """Answer requests sent to destination with handler(headers, message).
+
+        The message is the decoded JSON body, or the text when it is not JSON.
+        A reply is sent to the request's reply-to destination, with its
+        correlation-id, unless handler returns None.  Handlers run on the
+        broker's event loop and must not block.
+        """
+        self._responders[_full_name(destination)] = handler
+
+    def remove_responder(self, destination: str):
+        self._responders.pop(_full_name(destination), None)
+
+    def start(self) -> LoopbackBroker:
+        """Start serving on a daemon thread; return once the broker is listening."""
+        started = threading.Event()
+        errors: list[BaseException] = []
+
+        def run():
+            loop = self._loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(self.open())
+            except BaseException as e:
+                errors.append(e)
+                started.set()
+                loop.close()
+                return
+            started.set()
+            try:
+                loop.run_forever()
+            finally:
+                loop.run_until_complete(self.close())
+                loop.close()
+
+        self._thread = threading.Thread(target=run, name="gridappsd-loopback")
+        self._thread.daemon = True
+        self._thread.start()
+        started.wait()
+        if errors:
+            raise errors[0]
+        return self
+
+    def stop(self):
+        """Disconnect every client and stop the thread started by :meth:`start`."""
+        if self._thread is None or self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+
+    async def open(self):
+        """Start listening on the running event loop, for use from asyncio code."""
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        _log.debug("Loopback broker listening on {}:{}".format(self.host, self.port))
+
+    async def close(self):
+        """Stop listening and disconnect every client."""
+        if self._server is None:
+            return
+        self._server.close()
+        for client in list(self._clients):
+            client.writer.close()
+        # Closed connections read end of file, so their handlers return.
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        await self._server.wait_closed()
+        self._server = None
+
+    def __enter__(self) -> LoopbackBroker:
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = _Client(next(self._client_numbers), writer)
+        self._clients.add(client)
+        handler = asyncio.current_task()
+        if handler is not None:
+            self._handlers.add(handler)
+        parser = FrameParser()
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                written = {client}
+                for frame in parser.feed(data):
+                    if not self._handle(client, frame, written):
+                        return
+                # Slow readers hold up the clients sending to them rather
+                # than letting the broker's buffers grow without bound.
+                for target in written:
+                    if not target.writer.is_closing():
+                        await target.writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._disconnect(client)
+            self._handlers.discard(handler)
+
+    def _disconnect(self, client: _Client):
+        self._clients.discard(client)
+        for subscription_id, pattern in client.subscriptions.items():
+            self._matcher.remove(pattern, (client, subscription_id))
+        client.subscriptions.clear()
+        client.writer.close()
+
+    def _handle(self, client: _Client, frame: Frame, written: set[_Client]) -> bool:
+        """Act on one frame from client; return False once the connection should close."""
+        command, headers = frame.command, frame.headers
+        if command in ("CONNECT", "STOMP"):
+            if not self._authenticate(headers.get("login"), headers.get("passcode")):
+                client.write(Frame("ERROR", {"message": "Authentication failed"}))
+                return False
+            client.login = headers.get("login")
+            client.write(Frame("CONNECTED", {"version": "1.2", "heart-beat": "0,0", "server": "gridappsd-loopback"}))
+            return True
+        if client.login is None and self.users is not None:
+            client.write(Frame("ERROR", {"message": "Not connected"}))
+            return False
+
+        if "destination" in headers:
+            headers["destination"] = _full_name(headers["destination"])
+        if command == "SEND":
+            self._route(frame, written)
+        elif command == "SUBSCRIBE":
+            if "id" not in headers or "destination" not in headers:
+                client.write(Frame("ERROR", {"message": "SUBSCRIBE needs id and destination headers"}))
+                return False
+            self._subscribe(client, headers["id"], headers["destination"], written)
+        elif command == "UNSUBSCRIBE":
+            pattern = client.subscriptions.pop(headers.get("id", ""), None)
+            if pattern is not None:
+                self._matcher.remove(pattern, (client, headers["id"]))
+        if "receipt" in headers:
+            client.write(Frame("RECEIPT", {"receipt-id": headers["receipt"]}))
+        return command != "DISCONNECT"
+
+    def _authenticate(self, login: Optional[str], passcode: Optional[str]) -> bool:
+        if login in self._tokens or self.users is None:
+            return True
+        return login is not None and self.users.get(login) == passcode
+
+    def _subscribe(self, client: _Client, subscription_id: str, pattern: str, written: set[_Client]):
+        client.subscriptions[subscription_id] = pattern
+        self._matcher.add(pattern, (client, subscription_id))
+        if not self._pending:
+            return
+        # Hand over what queued up for the destinations the pattern covers.
+        matcher = TopicMatcher()
+        matcher.add(pattern, None)
+        for destination in [destination for destination in self._pending if matcher.match(destination)]:
+            for frame in self._pending.pop(destination):
+                self._deliver(client, subscription_id, frame)
+            written.add(client)
+
+    def _route(self, frame: Frame, written: set[_Client]):
+        destination = frame.headers.get("destination", "")
+        self.messages_routed += 1
+        if destination == TOKEN_TOPIC and "reply-to" in frame.headers:
+            self._issue_token(frame, written)
+        subscribers = self._matcher.match(destination)
+        if destination.startswith("/topic/"):
+            for client, subscription_id in subscribers:
+                self._deliver(client, subscription_id, frame)
+                written.add(client)
+        elif subscribers:
+            turn = self._turns.get(destination, 0)
+            self._turns[destination] = turn + 1
+            client, subscription_id = subscribers[turn % len(subscribers)]
+            self._deliver(client, subscription_id, frame)
+            written.add(client)
+        elif destination.startswith("/queue/") and not is_wildcard(destination):
+            pending = self._pending.get(destination)
+            if pending is None:
+                pending = self._pending[destination] = deque(maxlen=self.max_pending)
+            pending.append(frame)
+
+        responder = self._responders.get(destination)
+        if responder is not None and "reply-to" in frame.headers:
+            self._respond(responder, frame, written)
+
+    def _deliver(self, client: _Client, subscription_id: str, frame: Frame):
+        headers = {key: value for key, value in frame.headers.items() if key not in _SEND_ONLY_HEADERS}
+        headers["destination"] = frame.headers["destination"]
+        headers["subscription"] = subscription_id
+        headers["message-id"] = client.next_message_id()
+        client.write(Frame("MESSAGE", headers, frame.body))
+
+    def _reply(self, request: Frame, reply_to: str, body: bytes, written: set[_Client]):
+        headers = {"destination": reply_to}
+        if "correlation-id" in request.headers:
+            headers["correlation-id"] = request.headers["correlation-id"]
+        self._route(Frame("SEND", headers, body), written)
+
+    def _issue_token(self, frame: Frame, written: set[_Client]):
+        try:
+            login, _, password = base64.b64decode(frame.body).decode("utf-8").partition(":")
+        except ValueError:
+            login = password = ""
+        if self.users is None or self.users.get(login) == password:
+            token = uuid.uuid4().hex
+            self._tokens[token] = login
+        else:
+            token = "authentication failed"
+        # The token service takes reply-to as a bare queue name.
+        self._reply(frame, _full_name(frame.headers["reply-to"]), token.encode("utf-8"), written)
+
+    def _respond(self, responder: Callable[[dict[str, Any], Any], Any], frame: Frame, written: set[_Client]):
+        text = frame.body.decode("utf-8", errors="replace")
+        try:
+            message = codec.loads(text)
+        except ValueError:
+            message = text
+        try:
+            reply = responder(dict(frame.headers), message)
+        except Exception:
+            _log.exception("Responder for {} failed".format(frame.headers["destination"]))
+            return
+        if reply is None:
+            return
+        if not isinstance(reply, (str, bytes)):
+            reply = codec.dumps(reply)
+        body = reply.encode("utf-8") if isinstance(reply, str) else reply
+        self._reply(frame, _full_name(frame.headers["reply-to"]), body, written)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a loopback STOMP broker for GridAPPS-D clients.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=61613)
+    opts = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    broker = LoopbackBroker(opts.host, opts.port).start()
+    _log.info("Serving on {}:{}, press Ctrl-C to stop".format(*broker.address))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Envelope for messages received from the GOSS message bus.
+
+A :class:`MessageEnvelope` keeps the frame exactly as it came off the wire
+and decodes its JSON body lazily with the active :mod:`gridappsd.codec`, at
+most once, no matter how many callbacks read it.  Callbacks that only forward or record traffic can subscribe with
+``raw=True`` to receive the envelope itself and never pay for decoding.
+Bodies whose ``content-type`` header names a binary encoding from
+:mod:`gridappsd.payload_encoding` are decoded with that encoding instead.
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Any
+
+from gridappsd import codec, payload_encoding
+
+_log = logging.getLogger(__name__)
+
+_NOT_DECODED = object()
+
+
+class MessageEnvelope(object):
+    """A received message: its headers, the raw body and the cached decoded body.
+
+    :param headers: stomp headers of the frame.
+    :param raw: body exactly as received (str or bytes, or an object that
+        was already decoded by the sender in-process).
+    """
+
+    __slots__ = ("headers", "raw", "_body")
+
+    def __init__(self, headers: dict[str, Any], raw: Any):
+        self.headers = headers
+        self.raw = raw
+        self._body = _NOT_DECODED
+
+    @property
+    def destination(self) -> str | None:
+        return self.headers.get("destination")
+
+    @property
+    def decoded(self) -> bool:
+        """True once the body has been decoded."""
+        return self._body is not _NOT_DECODED
+
+    @property
+    def body(self) -> Any:
+        """The body decoded from JSON or its binary encoding, or the raw body unchanged if it is neither."""
+        if self._body is _NOT_DECODED:
+            content_type = self.headers.get(payload_encoding.CONTENT_TYPE_HEADER)
+            if content_type is not None and isinstance(self.raw, bytes) and payload_encoding.is_binary(content_type):
+                self._body = self._decode_binary(content_type)
+                return self._body
+            try:
+                self._body = codec.loads(self.raw)
+            except (TypeError, ValueError):
+                # raw was not JSON text (already a dict, or plain string body);
+                # pass it through unchanged rather than as a decode failure.
+                self._body = self.raw
+        return self._body
+
+    def _decode_binary(self, content_type: str) -> Any:
+        try:
+            return payload_encoding.decode(content_type, self.raw)
+        except ImportError as e:
+            _log.error("Cannot decode {} body on {}: {}".format(content_type, self.destination, e))
+        except Exception as e:
+            _log.error("Invalid {} body on {}: {}".format(content_type, self.destination, e))
+        return self.raw
+
+    def __repr__(self):
+        return "MessageEnvelope(destination={!r}, decoded={})".format(self.destination, self.decoded)
@@ -0,0 +1,295 @@
+"""Counters and latency histograms for the message layer.
+
+Every :class:`~gridappsd.goss.CallbackRouter` keeps a :class:`MessageMetrics`
+that :class:`~gridappsd.goss.GOSS` and the router update as messages flow:
+
+``messages_sent_total`` / ``bytes_sent_total``
+    Frames and body bytes sent, per destination.
+``messages_received_total`` / ``bytes_received_total``
+    Frames and body bytes received, per destination.
+``decode_seconds``
+    Time spent decoding received bodies.
+``callback_seconds``
+    Time spent in subscription callbacks.
+``queue_wait_seconds``
+    Time received messages waited for a dispatch worker.
+``request_seconds`` / ``request_timeouts_total``
+    :meth:`~gridappsd.goss.GOSS.get_response` round trip times and timeouts,
+    per request destination.
+
+Body sizes of text frames are counted in characters.  Read the values with
+:meth:`MessageMetrics.snapshot`, or in the Prometheus text format with
+:meth:`MessageMetrics.prometheus_text`, which :func:`start_http_server` serves
+over HTTP.  Recording takes no lock and costs a few dictionary updates per
+event; ``benchmarks/bench_metrics.py`` measures it.
+"""
+
+from __future__ import annotations
+
+import bisect
+import logging
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Optional
+
+_log = logging.getLogger(__name__)
+
+PROMETHEUS_PREFIX = "gridappsd_"
+
+# Upper bounds in seconds, from 100 µs to 10 s.
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_HELP = {
+    "messages_sent_total": "Messages sent.",
+    "bytes_sent_total": "Message body bytes sent.",
+    "messages_received_total": "Messages received.",
+    "bytes_received_total": "Message body bytes received.",
+    "decode_seconds": "Time spent decoding received message bodies.",
+    "callback_seconds": "Time spent in subscription callbacks.",
+    "queue_wait_seconds": "Time received messages waited for a dispatch worker.",
+    "request_seconds": "Round trip time of get_response requests.",
+    "request_timeouts_total": "get_response requests that timed out.",
+}
+
+
+class Histogram(object):
+    """Observation counts per bucket, with their sum and total count."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # One count per bucket plus one for values above the last bound.
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[float, int]]:
+        """Return (upper bound, observations at or below it) pairs, ending with infinity."""
+        total = 0
+        result = []
+        for bound, count in zip((*self.buckets, float("inf")), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def as_dict(self) -> dict[str, Any]:
+        return dict(count=self.count, sum=self.sum, buckets=self.cumulative())
+
+
+_DISPATCH_HISTOGRAMS = ("queue_wait_seconds", "decode_seconds", "callback_seconds")
+
+
+class _Shard(object):
+    """The metrics recorded by one thread.
+
+    Message counts are kept as [messages, bytes] per destination and the
+    dispatch histograms as one tuple per destination, so recording a message
+    costs a single lookup.
+    """
+
+    __slots__ = ("sent", "received", "dispatch", "counters", "histograms")
+
+    def __init__(self):
+        self.sent: dict[str, list[int]] = {}
+        self.received: dict[str, list[int]] = {}
+        self.dispatch: dict[str, tuple[Histogram, Histogram, Histogram]] = {}
+        self.counters: dict[tuple[str, str], float] = {}
+        self.histograms: dict[tuple[str, str], Histogram] = {}
+
+
+def _count(counts: dict[str, list[int]], destination: str, body: Any):
+    entry = counts.get(destination)
+    if entry is None:
+        entry = counts[destination] = [0, 0]
+    entry[0] += 1
+    if isinstance(body, (str, bytes)):
+        entry[1] += len(body)
+
+
+class MessageMetrics(object):
+    """Counters and histograms labelled by destination.
+
+    Each thread records into its own shard, so recording takes no lock;
+    :meth:`snapshot` merges the shards.
+
+    :param buckets: histogram bucket upper bounds in seconds.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._shards: list[_Shard] = []
+        self._local = threading.local()
+
+    def _shard(self) -> _Shard:
+        try:
+            shard: _Shard = self._local.shard
+            return shard
+        except AttributeError:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def count_sent(self, destination: str, body: Any):
+        """Count a message sent to destination and the size of its body."""
+        _count(self._shard().sent, destination, body)
+
+    def count_received(self, destination: str, body: Any):
+        """Count a message received from destination and the size of its body."""
+        _count(self._shard().received, destination, body)
+
+    def observe_dispatch(self, destination: str, queue_wait: float, decode: float, callback: float):
+        """Record the queue wait, decode and callback seconds of one dispatched message."""
+        dispatch = self._shard().dispatch
+        histograms = dispatch.get(destination)
+        if histograms is None:
+            histograms = dispatch[destination] = (
+                Histogram(self.buckets),
+                Histogram(self.buckets),
+                Histogram(self.buckets),
+            )
+        histograms[0].observe(queue_wait)
+        histograms[1].observe(decode)
+        histograms[2].observe(callback)
+
+    def inc(self, name: str, destination: str, amount: float = 1):
+        """Add amount to the counter name for destination."""
+        counters = self._shard().counters
+        key = (name, destination)
+        counters[key] = counters.get(key, 0) + amount
+
+    def observe(self, name: str, destination: str, seconds: float):
+        """Record a duration in the histogram name for destination."""
+        histograms = self._shard().histograms
+        histogram = histograms.get((name, destination))
+        if histogram is None:
+            histogram = histograms[(name, destination)] = Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        """Return every metric as ``{name: {destination: value}}``.
+
+        Counter values are numbers; histogram values are dicts with count, sum
+        and cumulative buckets.
+        """
+        counters: dict[str, dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        histograms: dict[str, dict[str, Histogram]] = defaultdict(dict)
+
+        def merge(name, destination, histogram):
+            merged = histograms[name].get(destination)
+            if merged is None:
+                merged = histograms[name][destination] = Histogram(self.buckets)
+            merged.counts = [a + b for a, b in zip(merged.counts, list(histogram.counts))]
+            merged.sum += histogram.sum
+            merged.count += histogram.count
+
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            # Copies are taken in one step each, so recording threads can carry on.
+            for direction, counts in (("sent", shard.sent), ("received", shard.received)):
+                for destination, (messages, size) in dict(counts).items():
+                    counters["messages_" + direction + "_total"][destination] += messages
+                    counters["bytes_" + direction + "_total"][destination] += size
+            for (name, destination), value in dict(shard.counters).items():
+                counters[name][destination] += value
+            for destination, dispatch in dict(shard.dispatch).items():
+                for name, histogram in zip(_DISPATCH_HISTOGRAMS, dispatch):
+                    merge(name, destination, histogram)
+            for (name, destination), histogram in dict(shard.histograms).items():
+                merge(name, destination, histogram)
+        result: dict[str, dict[str, Any]] = {name: dict(values) for name, values in counters.items()}
+        for name, by_destination in histograms.items():
+            result[name] = {destination: histogram.as_dict() for destination, histogram in by_destination.items()}
+        return result
+
+    def reset(self):
+        """Set every metric back to zero."""
+        with self._lock:
+            for shard in self._shards:
+                shard.sent.clear()
+                shard.received.clear()
+                shard.dispatch.clear()
+                shard.counters.clear()
+                shard.histograms.clear()
+
+    def prometheus_text(self, gauges: Optional[dict[str, float]] = None) -> str:
+        """Return the metrics in the Prometheus text exposition format.
+
+        :param gauges: extra unlabelled values to include, such as queue depth.
+        """
+        lines = []
+        for name, value in (gauges or {}).items():
+            lines.append("# TYPE {}{} gauge".format(PROMETHEUS_PREFIX, name))
+            lines.append("{}{} {}".format(PROMETHEUS_PREFIX, name, _number(value)))
+        for name, values in sorted(self.snapshot().items()):
+            metric = PROMETHEUS_PREFIX + name
+            if name in _HELP:
+                lines.append("# HELP {} {}".format(metric, _HELP[name]))
+            if name.endswith("_seconds"):
+                lines.append("# TYPE {} histogram".format(metric))
+                for destination, histogram in sorted(values.items()):
+                    label = _label(destination)
+                    for bound, count in histogram["buckets"]:
+                        le = "+Inf" if bound == float("inf") else repr(float(bound))
+                        lines.append('{}_bucket{{destination="{}",le="{}"}} {}'.format(metric, label, le, count))
+                    lines.append('{}_sum{{destination="{}"}} {}'.format(metric, label, _number(histogram["sum"])))
+                    lines.append('{}_count{{destination="{}"}} {}'.format(metric, label, histogram["count"]))
+            else:
+                lines.append("# TYPE {} counter".format(metric))
+                for destination, value in sorted(values.items()):
+                    lines.append('{}{{destination="{}"}} {}'.format(metric, _label(destination), _number(value)))
+        return "\n".join(lines) + "\n"
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    collect: Callable[[], str]
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = type(self).collect().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        _log.debug("Metrics request: " + format % args)
+
+
+def start_http_server(collect: Callable[[], str], port: int = 9464, address: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve the text returned by collect at ``/metrics`` on a daemon thread.
+
+    :param collect: returns the Prometheus text, e.g.
+        :meth:`gridappsd.goss.GOSS.metrics_text`.
+    :param port: TCP port, 0 to pick a free one (see ``server.server_port``).
+    :param address: interface to listen on; the default only accepts local
+        connections.
+    :return: the server; call ``shutdown()`` on it to stop serving.
+    """
+    handler = type("MetricsHandler", (_MetricsHandler,), {"collect": staticmethod(collect)})
+    server = ThreadingHTTPServer((address, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="gridappsd-metrics")
+    thread.daemon = True
+    thread.start()
+    return server
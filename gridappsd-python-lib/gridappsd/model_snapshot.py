@@ -0,0 +1,291 @@
+"""Local, indexed snapshot of a powergrid model.
+
+Resolving mRIDs to names, types and containers through ``query_object``,
+``query_object_dictionary`` or ``query_data`` costs a broker round trip per
+lookup.  A :class:`ModelSnapshot` pulls the object dictionaries of every
+object type of a feeder once and stores them in a SQLite file indexed by
+id, type, name and container, so lookups need no broker:
+
+.. code-block:: python
+
+    snapshot = ModelSnapshot.build(gapps, feeder_mrid, "feeder.sqlite")
+    breaker = snapshot.get(mrid)
+    switches = snapshot.find(object_type="LoadBreakSwitch", container=feeder_mrid)
+
+Snapshots opened with ``ModelSnapshot(path)`` are read only and may be shared
+by any number of processes; the file is in WAL mode, so they keep reading
+while another process refreshes it with :meth:`ModelSnapshot.refresh`.
+A refresh pulls the object types again and only rewrites the objects that
+changed.
+
+Objects are the dicts of the object dictionary, returned as the platform
+sent them.  Their id, name and container are taken from the first of the
+keys in :data:`ID_KEYS`, :data:`NAME_KEYS` and :data:`CONTAINER_KEYS` they
+have.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from gridappsd import json_extension as json
+from gridappsd import topics as t
+
+_log = logging.getLogger(__name__)
+
+ID_KEYS = ("id", "mRID", "IdentifiedObject.mRID")
+NAME_KEYS = ("name", "IdentifiedObject.name")
+CONTAINER_KEYS = ("container", "Equipment.EquipmentContainer", "fdrid")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS objects (
+    id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    name TEXT,
+    container TEXT,
+    digest TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS objects_type ON objects (type);
+CREATE INDEX IF NOT EXISTS objects_name ON objects (name);
+CREATE INDEX IF NOT EXISTS objects_container ON objects (container);
+"""
+
+
+def _short_type(object_type: str) -> str:
+    """Return ``ACLineSegment`` for ``http://iec.ch/TC57/CIM100#ACLineSegment``."""
+    return object_type.rpartition("#")[2]
+
+
+def _first(obj: dict[str, Any], keys: Iterable[str]) -> Optional[str]:
+    for key in keys:
+        value = obj.get(key)
+        if value is not None:
+            return str(value)
+    return None
+
+
+def _data(response: Any) -> Any:
+    if isinstance(response, Exception):
+        raise response
+    if isinstance(response, dict):
+        if response.get("error"):
+            raise ValueError("Model query failed: {}".format(response["error"]))
+        return response.get("data")
+    return response
+
+
+class ModelSnapshot(object):
+    """A powergrid model stored in an indexed SQLite file.
+
+    :param path: the snapshot file, see :meth:`build`.
+    :param readonly: open the file read only; :meth:`refresh` needs False.
+    """
+
+    def __init__(self, path: str | Path, readonly: bool = True):
+        self.path = Path(path)
+        self.readonly = readonly
+        if readonly:
+            if not self.path.exists():
+                raise FileNotFoundError("No model snapshot at {}".format(self.path))
+            self._db = sqlite3.connect("file:{}?mode=ro".format(self.path), uri=True, check_same_thread=False)
+        else:
+            self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(
+        cls,
+        gapps: Any,
+        model_id: str,
+        path: str | Path,
+        object_types: Optional[Iterable[str]] = None,
+        timeout: float = 120,
+        max_in_flight: int = 8,
+    ) -> ModelSnapshot:
+        """Pull a model into the snapshot file at path and return it, open for refreshing.
+
+        An existing snapshot of the same model is refreshed.
+
+        :param gapps: a connected :class:`~gridappsd.GridAPPSD`.
+        :param model_id: mRID of the feeder.
+        :param object_types: the object types to pull, by default every type
+            ``query_object_types`` reports for the model.
+        :param timeout: seconds to wait for each object type.
+        :param max_in_flight: object types requested at the same time.
+        """
+        snapshot = cls(path, readonly=False)
+        stored_model = snapshot.model_id
+        if stored_model is not None and stored_model != model_id:
+            snapshot.close()
+            raise ValueError("{} holds model {}, not {}".format(path, stored_model, model_id))
+        with snapshot._lock, snapshot._db:
+            snapshot._db.execute("INSERT OR REPLACE INTO meta VALUES ('model_id', ?)", (model_id,))
+        snapshot.refresh(gapps, object_types, timeout=timeout, max_in_flight=max_in_flight)
+        return snapshot
+
+    def refresh(
+        self,
+        gapps: Any,
+        object_types: Optional[Iterable[str]] = None,
+        timeout: float = 120,
+        max_in_flight: int = 8,
+    ) -> dict[str, int]:
+        """Pull object types again and store what changed.
+
+        Objects of a pulled type that the platform no longer reports are
+        removed; other types are left as they are.
+
+        :param object_types: the object types to pull, by default every type
+            ``query_object_types`` reports for the model.
+        :return: the number of objects ``added``, ``updated``, ``removed`` and
+            ``unchanged``.
+        """
+        if self.readonly:
+            raise ValueError("Open the snapshot with readonly=False to refresh it")
+        model_id = self.model_id
+        if model_id is None:
+            raise ValueError("{} is not a model snapshot, create it with ModelSnapshot.build".format(self.path))
+        cache = getattr(gapps, "query_cache", None)
+        if cache is not None:
+            # Pull the model as it is now, not as cached before it changed.
+            cache.invalidate(model_id=model_id)
+        if object_types is None:
+            object_types = _data(gapps.query_object_types(model_id)) or []
+        object_types = list(object_types)
+        started = time.perf_counter()
+        requests = [
+            (t.REQUEST_POWERGRID_DATA, gapps.object_dictionary_payload(model_id, object_type=object_type))
+            for object_type in object_types
+        ]
+        responses = gapps.get_responses(requests, timeout=timeout, max_in_flight=max_in_flight)
+
+        counts = dict(added=0, updated=0, removed=0, unchanged=0)
+        with self._lock, self._db:
+            for object_type, response in zip(object_types, responses):
+                self._store(_short_type(object_type), _data(response) or [], counts)
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('refreshed', ?)", (str(time.time()),))
+        _log.debug(
+            "Refreshed {} object types of {} in {:.2f}s: {}".format(
+                len(object_types), model_id, time.perf_counter() - started, counts
+            )
+        )
+        return counts
+
+    def _store(self, object_type: str, objects: list[dict[str, Any]], counts: dict[str, int]):
+        stored = dict(self._db.execute("SELECT id, digest FROM objects WHERE type = ?", (object_type,)))
+        for obj in objects:
+            mrid = _first(obj, ID_KEYS)
+            if mrid is None:
+                _log.debug("Skipping {} without an id: {}".format(object_type, obj))
+                continue
+            data = json.dumps(obj, sort_keys=True)
+            digest = hashlib.sha1(data.encode("utf-8")).hexdigest()
+            previous = stored.pop(mrid, None)
+            if previous == digest:
+                counts["unchanged"] += 1
+                continue
+            counts["updated" if previous is not None else "added"] += 1
+            self._db.execute(
+                "INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?)",
+                (mrid, object_type, _first(obj, NAME_KEYS), _first(obj, CONTAINER_KEYS), digest, data),
+            )
+        if stored:
+            counts["removed"] += len(stored)
+            self._db.executemany("DELETE FROM objects WHERE id = ?", ((mrid,) for mrid in stored))
+
+    def _meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @property
+    def model_id(self) -> Optional[str]:
+        """mRID of the model in the snapshot."""
+        return self._meta("model_id")
+
+    @property
+    def refreshed(self) -> Optional[float]:
+        """Time of the last refresh, in seconds since the epoch."""
+        value = self._meta("refreshed")
+        return float(value) if value is not None else None
+
+    def get(self, mrid: str) -> Optional[dict[str, Any]]:
+        """Return the object with mrid, or None."""
+        with self._lock:
+            row = self._db.execute("SELECT data FROM objects WHERE id = ?", (mrid,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find(
+        self, object_type: Optional[str] = None, name: Optional[str] = None, container: Optional[str] = None
+    ) -> list[dict[str, Any]]:
+        """Return the objects of object_type, with name and in container; each is optional."""
+        clauses, values = [], []
+        for column, value in (
+            ("type", object_type and _short_type(object_type)),
+            ("name", name),
+            ("container", container),
+        ):
+            if value is not None:
+                clauses.append("{} = ?".format(column))
+                values.append(value)
+        sql = "SELECT data FROM objects"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        with self._lock:
+            rows = self._db.execute(sql + " ORDER BY id", values).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def object_types(self) -> dict[str, int]:
+        """Return the number of objects by object type."""
+        with self._lock:
+            return dict(self._db.execute("SELECT type, COUNT(*) FROM objects GROUP BY type ORDER BY type"))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(self._db.execute("SELECT COUNT(*) FROM objects").fetchone()[0])
+
+    def __contains__(self, mrid: object) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM objects WHERE id = ?", (mrid,)).fetchone() is not None
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self) -> ModelSnapshot:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    from gridappsd import GridAPPSD
+
+    parser = argparse.ArgumentParser(description="Build or refresh a local snapshot of a GridAPPS-D model.")
+    parser.add_argument("model_id", help="mRID of the feeder")
+    parser.add_argument("path", help="snapshot file to create or refresh")
+    parser.add_argument("--types", nargs="+", help="object types to pull, by default all of them")
+    opts = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    gapps = GridAPPSD()
+    try:
+        with ModelSnapshot.build(gapps, opts.model_id, opts.path, object_types=opts.types) as snapshot:
+            _log.info("{} holds {} objects: {}".format(opts.path, len(snapshot), snapshot.object_types()))
+    finally:
+        gapps.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Binary payload encodings selected by the ``content-type`` header.
+
+Message bodies are JSON text by default.  A client can instead send the
+bodies for chosen topics in a compact binary encoding, see
+:meth:`gridappsd.goss.GOSS.set_payload_encoding`.  The encoding is named in
+the frame's ``content-type`` header, so receivers decode it transparently and
+applications sharing a bus can opt in topic by topic.
+
+Built in encodings, available when their package is installed:
+
+``application/msgpack``
+    MessagePack, through the msgpack package.
+``application/cbor``
+    CBOR, through the cbor2 package.
+
+Both keep complex numbers and dataclasses working the way the JSON codecs
+do.  Further encodings can be added with :func:`register_encoding`.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Optional
+
+from gridappsd.codec import _encode_default
+from gridappsd.json_extension import jsonDecoderExtension
+from gridappsd.topic_matcher import TopicMap
+
+CONTENT_TYPE_HEADER = "content-type"
+
+MSGPACK = "application/msgpack"
+CBOR = "application/cbor"
+
+
+class PayloadEncoding(object):
+    """A named pair of functions turning message bodies into bytes and back."""
+
+    def __init__(self, content_type: str, encode: Callable[[Any], bytes], decode: Callable[[bytes], Any]):
+        self.content_type = content_type
+        self.encode = encode
+        self.decode = decode
+
+
+def _msgpack() -> PayloadEncoding:
+    import msgpack
+
+    return PayloadEncoding(
+        MSGPACK,
+        lambda obj: msgpack.packb(obj, default=_encode_default, use_bin_type=True),
+        lambda data: msgpack.unpackb(data, object_hook=jsonDecoderExtension, raw=False, strict_map_key=False),
+    )
+
+
+def _cbor() -> PayloadEncoding:
+    import cbor2
+
+    return PayloadEncoding(
+        CBOR,
+        lambda obj: cbor2.dumps(obj, default=lambda encoder, value: encoder.encode(_encode_default(value))),
+        lambda data: cbor2.loads(data, object_hook=lambda decoder, value: jsonDecoderExtension(value)),
+    )
+
+
+# Built in encodings are only loaded when first used, as their packages are optional.
+_BUILTIN: dict[str, Callable[[], PayloadEncoding]] = {MSGPACK: _msgpack, CBOR: _cbor}
+
+_encodings: dict[str, PayloadEncoding] = {}
+
+
+def register_encoding(content_type: str, encode: Callable[[Any], bytes], decode: Callable[[bytes], Any]):
+    """Make content_type available as a payload encoding, replacing any encoding of that name."""
+    _encodings[content_type] = PayloadEncoding(content_type, encode, decode)
+
+
+def unregister_encoding(content_type: str):
+    """Remove an encoding added with :func:`register_encoding`."""
+    _encodings.pop(content_type, None)
+
+
+def is_binary(content_type: Optional[str]) -> bool:
+    """Return True if content_type names a binary payload encoding, whether or not its package is installed."""
+    return content_type is not None and (content_type in _encodings or content_type in _BUILTIN)
+
+
+def get_encoding(content_type: str) -> PayloadEncoding:
+    """Return the encoding for content_type.
+
+    :raises ValueError: for a content type that is not a known encoding.
+    :raises ImportError: if the encoding's package is not installed.
+    """
+    encoding = _encodings.get(content_type)
+    if encoding is None:
+        if content_type not in _BUILTIN:
+            raise ValueError(
+                "Unknown payload encoding {!r}, expected one of {}".format(
+                    content_type, ", ".join(sorted({*_BUILTIN, *_encodings}))
+                )
+            )
+        encoding = _encodings[content_type] = _BUILTIN[content_type]()
+    return encoding
+
+
+def available_encodings() -> list[str]:
+    """Return the content types that can be used on this installation."""
+    names = []
+    for content_type in sorted({*_BUILTIN, *_encodings}):
+        try:
+            get_encoding(content_type)
+        except ImportError:
+            continue
+        names.append(content_type)
+    return names
+
+
+def encode(content_type: str, obj: Any) -> bytes:
+    """Encode obj as content_type."""
+    return get_encoding(content_type).encode(obj)
+
+
+def decode(content_type: str, data: bytes) -> Any:
+    """Decode data received with content_type."""
+    return get_encoding(content_type).decode(data)
+
+
+def text_body(headers: dict[str, Any], body: Any) -> Any:
+    """Return a received body as text, unless headers name a binary encoding or it is not utf-8."""
+    if isinstance(body, bytes) and not is_binary(headers.get(CONTENT_TYPE_HEADER)):
+        try:
+            return body.decode("utf-8")
+        except UnicodeDecodeError:
+            pass
+    return body
+
+
+class EncodingPolicy(TopicMap):
+    """The payload encoding chosen for each topic a client sends to."""
+
+    def set(self, topic: str, content_type: Optional[str]):
+        """Send bodies for topic as content_type, or as JSON again when None.
+
+        :raises ValueError: for an unknown content type.
+        :raises ImportError: if the encoding's package is not installed.
+        """
+        if content_type is not None:
+            get_encoding(content_type)
+        super().set(topic, content_type)
+
+    def content_type_for(self, destination: str) -> Optional[str]:
+        """Return the encoding for destination, None to send JSON."""
+        content_type: Optional[str] = self.get(destination)
+        return content_type
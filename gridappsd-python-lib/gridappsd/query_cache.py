@@ -0,0 +1,278 @@
+"""Cache of powergrid model query responses.
+
+Model queries go through the platform to Blazegraph on every call, although
+a model rarely changes during a run.  A :class:`QueryCache` given to
+:class:`~gridappsd.GridAPPSD` (or :class:`~gridappsd.aio.AsyncGridAPPSD`)
+answers repeated ``query_object_types``, ``query_model_names``,
+``query_model_info``, ``query_object_dictionary`` and ``query_data`` calls
+from memory:
+
+.. code-block:: python
+
+    cache = QueryCache(max_bytes=512 * 1024 * 1024, directory="~/.cache/gridappsd/queries")
+    gapps = GridAPPSD(query_cache=cache)
+
+Entries are keyed by the request topic and payload, so requests that differ
+only in key order share an entry.  The in-memory tier is a least recently
+used cache bounded by the encoded size of its responses.  With a directory,
+responses are also written to disk and survive restarts.  Setting the
+GRIDAPPSD_QUERY_CACHE environment variable to a directory gives clients that
+are not handed a cache one persisted there.
+
+Cached responses are shared between callers; treat them as read only.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, NamedTuple, Optional
+
+from gridappsd import json_extension as json
+from gridappsd.single_flight import request_key
+
+_log = logging.getLogger(__name__)
+
+QUERY_CACHE_ENV = "GRIDAPPSD_QUERY_CACHE"
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class _Entry(NamedTuple):
+    response: Any
+    size: int
+    expires: float
+    request_type: Optional[str]
+    model_id: Optional[str]
+
+
+def _cacheable(response: Any) -> bool:
+    # Error replies are worth asking again.
+    return response is not None and not (isinstance(response, dict) and response.get("error"))
+
+
+class QueryCache(object):
+    """Thread safe LRU cache of query responses with an optional disk tier.
+
+    :param max_bytes: upper bound of the encoded size of the responses held
+        in memory.  Responses larger than this are only kept on disk.
+    :param ttl: seconds a response is reused, None to keep it until it is
+        invalidated or evicted.
+    :param ttls: ttl by request type (e.g. ``{"QUERY": 60}``), overriding ttl.
+    :param directory: directory to persist responses to, None to keep them
+        in memory only.
+    :param max_disk_bytes: upper bound of the size of the directory; the
+        least recently written responses are removed first.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl: Optional[float] = 24 * 3600,
+        ttls: Optional[dict[str, Optional[float]]] = None,
+        directory: Optional[str | Path] = None,
+        max_disk_bytes: Optional[int] = None,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.ttls = dict(ttls or {})
+        self.directory = Path(directory).expanduser() if directory else None
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._bytes = 0
+        self._stats = dict(hits=0, disk_hits=0, misses=0, evictions=0)
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(topic: str, payload: Any) -> str:
+        """Return the cache key of a request: a digest of its topic and normalized payload."""
+        return request_key(topic, payload)
+
+    def _expiry(self, request_type: Optional[str]) -> float:
+        ttl = self.ttls.get(request_type, self.ttl) if request_type is not None else self.ttl
+        return float("inf") if ttl is None else time.time() + ttl
+
+    def get(self, topic: str, payload: Any) -> Optional[Any]:
+        """Return the cached response to a request, or None."""
+        key = self.key(topic, payload)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires > time.time():
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return entry.response
+                self._discard(key)
+            entry = self._read(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["disk_hits"] += 1
+            self._remember(key, entry)
+            return entry.response
+
+    def put(self, topic: str, payload: Any, response: Any):
+        """Cache the response to a request.  None and error replies are not cached."""
+        if not _cacheable(response):
+            return
+        key = self.key(topic, payload)
+        if isinstance(payload, (str, bytes)):
+            payload = json.loads(payload)
+        request_type = payload.get("requestType")
+        model_id = payload.get("modelId")
+        encoded = json.dumps(response)
+        entry = _Entry(response, len(encoded), self._expiry(request_type), request_type, model_id)
+        with self._lock:
+            self._remember(key, entry)
+            self._write(key, entry, encoded)
+
+    def invalidate(self, request_type: Optional[str] = None, model_id: Optional[str] = None) -> int:
+        """Forget cached responses, e.g. after a model was changed.
+
+        Without arguments every response is forgotten; otherwise only those
+        to requests of request_type and/or about model_id.
+
+        :return: the number of responses removed from memory or disk.
+        """
+
+        def matches(entry_request_type, entry_model_id):
+            return (request_type is None or request_type == entry_request_type) and (
+                model_id is None or model_id == entry_model_id
+            )
+
+        removed = set()
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if matches(entry.request_type, entry.model_id):
+                    self._discard(key)
+                    removed.add(key)
+            for path in self._disk_files():
+                meta = self._read_meta(path)
+                if meta is None or matches(meta.get("requestType"), meta.get("modelId")):
+                    self._unlink(path)
+                    removed.add(path.stem)
+        return len(removed)
+
+    def clear(self):
+        """Forget every cached response, in memory and on disk."""
+        self.invalidate()
+
+    def stats(self) -> dict[str, int]:
+        """Return ``hits``, ``disk_hits``, ``misses``, ``evictions``, and the ``entries`` and ``bytes`` in memory."""
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), bytes=self._bytes)
+
+    def _remember(self, key: str, entry: _Entry):
+        self._discard(key)
+        if entry.size > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self._stats["evictions"] += 1
+
+    def _discard(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    # The disk tier keeps one file per response: a line of metadata followed
+    # by the response, so invalidation only reads the first line of each.
+
+    def _path(self, key: str) -> Path:
+        assert self.directory is not None
+        return self.directory / "{}.json".format(key)
+
+    def _disk_files(self) -> list[Path]:
+        if self.directory is None:
+            return []
+        return list(self.directory.glob("*.json"))
+
+    def _read_meta(self, path: Path) -> Optional[dict[str, Any]]:
+        try:
+            with open(path) as fp:
+                meta: dict[str, Any] = json.loads(fp.readline())
+                return meta
+        except (OSError, ValueError) as e:
+            _log.debug("Unreadable cached response {}: {}".format(path, e))
+            return None
+
+    def _read(self, key: str) -> Optional[_Entry]:
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path) as fp:
+                meta = json.loads(fp.readline())
+                encoded = fp.readline()
+            response = json.loads(encoded)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            _log.warning("Ignoring unreadable cached response {}: {}".format(path, e))
+            self._unlink(path)
+            return None
+        if meta["expires"] is not None and meta["expires"] <= time.time():
+            self._unlink(path)
+            return None
+        expires = float("inf") if meta["expires"] is None else meta["expires"]
+        return _Entry(response, len(encoded), expires, meta.get("requestType"), meta.get("modelId"))
+
+    def _write(self, key: str, entry: _Entry, encoded: str):
+        if self.directory is None:
+            return
+        meta = dict(
+            expires=None if entry.expires == float("inf") else entry.expires,
+            requestType=entry.request_type,
+            modelId=entry.model_id,
+        )
+        path = self._path(key)
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            with open(tmp, "w") as fp:
+                fp.write(json.dumps(meta))
+                fp.write("\n")
+                fp.write(encoded)
+                fp.write("\n")
+            os.replace(tmp, path)
+        except OSError as e:
+            _log.warning("Could not write cached response {}: {}".format(path, e))
+            return
+        if self.max_disk_bytes is not None:
+            self._trim_disk()
+
+    def _trim_disk(self):
+        files = []
+        for path in self._disk_files():
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files, key=lambda item: item[0]):
+            if total <= self.max_disk_bytes:
+                break
+            self._unlink(path)
+            total -= size
+
+    @staticmethod
+    def _unlink(path: Path):
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+
+def default_query_cache() -> Optional[QueryCache]:
+    """Return a cache persisted to the GRIDAPPSD_QUERY_CACHE directory, or None if it is not set."""
+    directory = os.environ.get(QUERY_CACHE_ENV)
+    return QueryCache(directory=directory) if directory else None
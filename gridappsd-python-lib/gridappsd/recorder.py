@@ -0,0 +1,369 @@
+"""Record bus traffic to an indexed, append-only log on disk.
+
+A :class:`Recorder` subscribes to any number of topics, wildcards included,
+and writes every message it receives, with its headers and receive time, to
+a directory of log segments:
+
+``segment-000000.log``
+    The magic bytes ``GRIDREC1`` followed by length prefixed records.  Each
+    record is a ``<IIdI`` header (length of headers and body, crc32 of
+    headers and body, receive time in seconds since the epoch, length of
+    the headers) followed by the headers as JSON and the body bytes.
+``segment-000000.idx``
+    The time index of the segment: ``<dQ`` (receive time, file offset)
+    pairs, one for the first record and one at most every
+    ``index_interval`` seconds after it.
+
+Segments are never rewritten; a new one is started when the current one
+reaches ``segment_bytes``, and recording into an existing directory
+continues after its last segment.  A record cut short by a crash ends its
+segment when read back.  :func:`read_messages` reads a recording, seeking
+through the index to a start time.
+
+Callbacks subscribe with ``raw=True``, so bodies are recorded as they
+arrived without being decoded, and only append to an in-memory buffer: the
+dispatch threads never wait for the disk.  A background thread writes the
+buffer out.  When the buffer holds ``max_buffer_bytes`` the newest messages
+are dropped and counted rather than slowing dispatch down.
+
+To record from the command line:
+
+.. code-block:: shell
+
+    python -m gridappsd.recorder --directory capture "/topic/goss.gridappsd.simulation.output.>"
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import logging
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional
+
+from gridappsd import codec, payload_encoding
+from gridappsd.compression import CONTENT_ENCODING_HEADER
+from gridappsd.message import MessageEnvelope
+
+_log = logging.getLogger(__name__)
+
+MAGIC = b"GRIDREC1"
+
+_RECORD = struct.Struct("<IIdI")
+_INDEX = struct.Struct("<dQ")
+
+DEFAULT_SEGMENT_BYTES = 256 * 1024 * 1024
+DEFAULT_BUFFER_BYTES = 64 * 1024 * 1024
+
+# Estimated bytes of buffer taken by a message's headers.
+_HEADER_ALLOWANCE = 256
+
+
+@dataclass
+class RecordedMessage:
+    """A message read back from a recording."""
+
+    timestamp: float
+    headers: dict[str, Any] = field(default_factory=dict)
+    body: bytes = b""
+
+    @property
+    def destination(self) -> Optional[str]:
+        return self.headers.get("destination")
+
+    def envelope(self) -> MessageEnvelope:
+        """Return the message as the :class:`~gridappsd.message.MessageEnvelope` a callback receives."""
+        return MessageEnvelope(self.headers, payload_encoding.text_body(self.headers, self.body))
+
+
+def _segment_name(number: int) -> str:
+    return "segment-{:06d}".format(number)
+
+
+def _segments(directory: Path) -> list[Path]:
+    """Return the segment log files of a recording in the order they were written."""
+    return sorted(directory.glob("segment-*.log"))
+
+
+class SegmentWriter(object):
+    """Appends records to the segments and time index of a recording directory.
+
+    Not thread safe; :class:`Recorder` calls it from its writer thread only.
+
+    :param directory: the recording directory, created if missing.
+    :param segment_bytes: size at which a new segment is started.
+    :param index_interval: seconds between time index entries.
+    """
+
+    def __init__(self, directory: str | Path, segment_bytes: int = DEFAULT_SEGMENT_BYTES, index_interval: float = 1.0):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.index_interval = index_interval
+        self.bytes_written = 0
+        existing = _segments(self.directory)
+        self._number = int(existing[-1].stem.split("-")[1]) + 1 if existing else 0
+        self._log: Optional[Any] = None
+        self._index: Optional[Any] = None
+        self._offset = 0
+        self._last_indexed: Optional[float] = None
+
+    def _open_segment(self):
+        self.close()
+        name = _segment_name(self._number)
+        self._number += 1
+        self._log = open(self.directory / (name + ".log"), "xb", buffering=1024 * 1024)
+        self._index = open(self.directory / (name + ".idx"), "xb")
+        self._log.write(MAGIC)
+        self._offset = len(MAGIC)
+        self._last_indexed = None
+
+    def append(self, timestamp: float, headers: dict[str, Any], body: bytes):
+        if self._log is None or self._offset >= self.segment_bytes:
+            self._open_segment()
+        assert self._log is not None and self._index is not None
+        encoded_headers = codec.dumps(headers).encode("utf-8")
+        crc = zlib.crc32(body, zlib.crc32(encoded_headers))
+        if self._last_indexed is None or timestamp - self._last_indexed >= self.index_interval:
+            self._index.write(_INDEX.pack(timestamp, self._offset))
+            self._last_indexed = timestamp
+        self._log.write(_RECORD.pack(len(encoded_headers) + len(body), crc, timestamp, len(encoded_headers)))
+        self._log.write(encoded_headers)
+        self._log.write(body)
+        size = _RECORD.size + len(encoded_headers) + len(body)
+        self._offset += size
+        self.bytes_written += size
+
+    def flush(self):
+        if self._log is not None and self._index is not None:
+            self._log.flush()
+            self._index.flush()
+
+    def close(self):
+        if self._log is not None and self._index is not None:
+            self._log.close()
+            self._index.close()
+        self._log = self._index = None
+
+
+def _read_index(path: Path) -> list[tuple[float, int]]:
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        return []
+    # A torn final entry is ignored.
+    return list(_INDEX.iter_unpack(data[: len(data) - len(data) % _INDEX.size]))
+
+
+def _read_segment(path: Path, offset: int) -> Iterator[RecordedMessage]:
+    with open(path, "rb") as log:
+        if log.read(len(MAGIC)) != MAGIC:
+            _log.warning("{} is not a recording segment".format(path))
+            return
+        log.seek(max(offset, len(MAGIC)))
+        while True:
+            head = log.read(_RECORD.size)
+            if len(head) < _RECORD.size:
+                return
+            length, crc, timestamp, headers_length = _RECORD.unpack(head)
+            data = log.read(length)
+            if len(data) < length:
+                _log.debug("{} ends with an incomplete record".format(path))
+                return
+            if zlib.crc32(data) != crc:
+                _log.warning(
+                    "Corrupt record at offset {} of {}, skipping the rest of the segment".format(
+                        log.tell() - length - _RECORD.size, path
+                    )
+                )
+                return
+            yield RecordedMessage(timestamp, codec.loads(data[:headers_length]), data[headers_length:])
+
+
+def read_messages(
+    directory: str | Path, start: Optional[float] = None, end: Optional[float] = None
+) -> Iterator[RecordedMessage]:
+    """Yield the messages of a recording in the order they were recorded.
+
+    :param start: skip messages received before this time (seconds since
+        the epoch), using the time index to seek close to it.
+    :param end: stop at the first message received after this time.
+    """
+    segments = _segments(Path(directory))
+    for position, segment in enumerate(segments):
+        offset = 0
+        if start is not None:
+            if position + 1 < len(segments):
+                following = _read_index(segments[position + 1].with_suffix(".idx"))
+                if following and following[0][0] <= start:
+                    continue
+            index = _read_index(segment.with_suffix(".idx"))
+            entry = bisect.bisect_right([timestamp for timestamp, _ in index], start) - 1
+            if entry >= 0:
+                offset = index[entry][1]
+        for message in _read_segment(segment, offset):
+            if start is not None and message.timestamp < start:
+                continue
+            if end is not None and message.timestamp > end:
+                return
+            yield message
+
+
+class Recorder(object):
+    """Records the messages of some topics to a recording directory.
+
+    :param gapps: a connected :class:`~gridappsd.goss.GOSS` (or GridAPPSD) client.
+    :param directory: where the segments are written.
+    :param topics: topics to record, ActiveMQ wildcards allowed.  The broker
+        delivers a message once per matching subscription, so overlapping
+        topics record it more than once.
+    :param segment_bytes: size at which a new segment is started.
+    :param max_buffer_bytes: bytes of messages held for the writer thread
+        before new ones are dropped.
+    :param index_interval: seconds between time index entries.
+    :param flush_interval: seconds between flushes to disk while recording.
+    """
+
+    def __init__(
+        self,
+        gapps,
+        directory: str | Path,
+        topics: Iterable[str],
+        segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+        max_buffer_bytes: int = DEFAULT_BUFFER_BYTES,
+        index_interval: float = 1.0,
+        flush_interval: float = 0.5,
+    ):
+        self._gapps = gapps
+        self.topics = list(topics)
+        self.max_buffer_bytes = max_buffer_bytes
+        self.flush_interval = flush_interval
+        self._writer = SegmentWriter(directory, segment_bytes, index_interval)
+        self._buffer: deque[tuple[float, dict[str, Any], Any, int]] = deque()
+        self._buffered_bytes = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._subscriptions: list[str] = []
+        self.recorded = 0
+        self.dropped = 0
+
+    def start(self) -> Recorder:
+        """Subscribe to the topics and start writing."""
+        self._stopping = False
+        self._thread = threading.Thread(target=self._write_loop, name="gridappsd-recorder")
+        self._thread.daemon = True
+        self._thread.start()
+        for topic in self.topics:
+            self._subscriptions.append(self._gapps.subscribe(topic, self._on_message, raw=True))
+        return self
+
+    def stop(self):
+        """Unsubscribe, write out what is buffered and close the recording."""
+        for subscription in self._subscriptions:
+            self._gapps.unsubscribe(subscription)
+        self._subscriptions = []
+        if self._thread is not None:
+            self._stopping = True
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        self._writer.close()
+
+    def __enter__(self) -> Recorder:
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stats(self) -> dict[str, int]:
+        """Return the messages recorded and dropped, the bytes buffered and the bytes written."""
+        return dict(
+            recorded=self.recorded,
+            dropped=self.dropped,
+            buffered_bytes=self._buffered_bytes,
+            bytes_written=self._writer.bytes_written,
+        )
+
+    def _on_message(self, headers: dict[str, Any], envelope: MessageEnvelope):
+        timestamp = time.time()
+        raw = envelope.raw
+        size = (len(raw) if isinstance(raw, (str, bytes)) else 0) + _HEADER_ALLOWANCE
+        with self._lock:
+            if self._buffered_bytes + size > self.max_buffer_bytes:
+                self.dropped += 1
+                if self.dropped == 1 or self.dropped % 1000 == 0:
+                    _log.warning("Recorder buffer full, {} messages dropped".format(self.dropped))
+                return
+            self._buffered_bytes += size
+        self._buffer.append((timestamp, headers, raw, size))
+        self._wake.set()
+
+    def _write_loop(self):
+        buffer = self._buffer
+        last_flush = time.monotonic()
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            while buffer:
+                timestamp, headers, raw, size = buffer.popleft()
+                try:
+                    self._write(timestamp, headers, raw)
+                except Exception:
+                    _log.exception("Cannot record message for {}".format(headers.get("destination")))
+                with self._lock:
+                    self._buffered_bytes -= size
+                    self.recorded += 1
+            if self._stopping:
+                self._writer.flush()
+                return
+            if time.monotonic() - last_flush >= self.flush_interval:
+                self._writer.flush()
+                last_flush = time.monotonic()
+
+    def _write(self, timestamp: float, headers: dict[str, Any], raw: Any):
+        if isinstance(raw, str):
+            body = raw.encode("utf-8")
+        elif isinstance(raw, bytes):
+            body = raw
+        else:
+            body = codec.dumps(raw).encode("utf-8")
+        if CONTENT_ENCODING_HEADER in headers:
+            # The body was decompressed on receipt and is recorded that way.
+            headers = {key: value for key, value in headers.items() if key != CONTENT_ENCODING_HEADER}
+        self._writer.append(timestamp, headers, body)
+
+
+def main():
+    from gridappsd import GridAPPSD
+
+    parser = argparse.ArgumentParser(description="Record GridAPPS-D bus traffic to disk.")
+    parser.add_argument("topics", nargs="+", help="topics to record, wildcards allowed")
+    parser.add_argument("--directory", default="recording")
+    parser.add_argument("--segment-mb", type=int, default=DEFAULT_SEGMENT_BYTES // (1024 * 1024))
+    opts = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    gapps = GridAPPSD()
+    recorder = Recorder(gapps, opts.directory, opts.topics, segment_bytes=opts.segment_mb * 1024 * 1024).start()
+    _log.info("Recording {} to {}, press Ctrl-C to stop".format(", ".join(opts.topics), opts.directory))
+    try:
+        while True:
+            time.sleep(10)
+            _log.info("Recorder stats: {}".format(recorder.stats()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recorder.stop()
+        gapps.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""Replay traffic captured by :mod:`gridappsd.recorder`.
+
+A :class:`Replayer` republishes the messages of a recording in the order
+and, optionally, at the pace they were recorded:
+
+* to a broker through a :class:`~gridappsd.goss.GOSS` (or GridAPPSD)
+  client, to drive applications and field agents in other processes, or
+* straight into a :class:`~gridappsd.goss.CallbackRouter`, to drive the
+  callbacks of this process without a broker and measure how fast they
+  keep up.
+
+``speed`` scales the recorded pace: 1 replays in real time, 10 ten times
+faster and :data:`MAX_SPEED` as fast as the target accepts messages.
+Destinations can be remapped, e.g. to present a recorded simulation as a
+new one:
+
+.. code-block:: python
+
+    Replayer("capture", gapps, speed=10, remap=replace_element("1234567890", simulation_id)).run()
+
+Bodies are sent exactly as they were recorded; only destinations change.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Optional, Union
+
+from gridappsd.goss import CallbackRouter
+from gridappsd.recorder import RecordedMessage, read_messages
+
+_log = logging.getLogger(__name__)
+
+# Replay as fast as the target accepts messages.
+MAX_SPEED = None
+
+Remap = Union[dict[str, Optional[str]], Callable[[str], Optional[str]]]
+
+
+def replace_element(old: str, new: str) -> Callable[[str], Optional[str]]:
+    """Return a remap function replacing the destination path element old with new.
+
+    ``replace_element("123", "456")`` maps
+    ``/topic/goss.gridappsd.simulation.output.123`` to
+    ``/topic/goss.gridappsd.simulation.output.456``.
+    """
+
+    def remap(destination: str) -> Optional[str]:
+        name = destination.rpartition("/")[2]
+        parts = [new if part == old else part for part in name.split(".")]
+        return destination[: len(destination) - len(name)] + ".".join(parts)
+
+    return remap
+
+
+class Replayer(object):
+    """Republishes a recording to a client or a CallbackRouter.
+
+    :param directory: the recording directory.
+    :param target: a :class:`~gridappsd.goss.GOSS` client to publish
+        through, or a :class:`~gridappsd.goss.CallbackRouter` to dispatch to.
+    :param speed: multiple of the recorded pace, or :data:`MAX_SPEED`.
+    :param remap: new destinations by recorded destination, or a function
+        returning the new destination.  Messages mapped to None are skipped;
+        with a dict, destinations it does not name are kept.
+    :param start: replay messages recorded from this time (seconds since the epoch).
+    :param end: replay messages recorded up to this time.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        target: Any,
+        speed: Optional[float] = 1.0,
+        remap: Optional[Remap] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+    ):
+        if speed is not None and speed <= 0:
+            raise ValueError("speed must be positive, or MAX_SPEED")
+        self.directory = directory
+        self.target = target
+        self.speed = speed
+        self.start_time = start
+        self.end_time = end
+        if remap is None:
+            self._remap: Callable[[str], Optional[str]] = lambda destination: destination
+        elif isinstance(remap, dict):
+            mapping = remap
+            self._remap = lambda destination: mapping.get(destination, destination)
+        else:
+            self._remap = remap
+        self._publish = self._dispatch if isinstance(target, CallbackRouter) else self._send
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats: dict[str, Any] = {}
+
+    def _send(self, destination: str, message: RecordedMessage):
+        self.target.send(destination, message.envelope())
+
+    def _dispatch(self, destination: str, message: RecordedMessage):
+        headers = dict(message.headers)
+        headers["destination"] = destination
+        # The recorded subscription id means nothing to this router.
+        headers.pop("subscription", None)
+        self.target.on_message(headers, message.body)
+
+    def run(self) -> dict[str, Any]:
+        """Replay the recording and return its statistics, see :meth:`stats`.
+
+        When replaying into a CallbackRouter, returns once its callbacks have
+        handled every message.
+        """
+        self._stopped.clear()
+        replayed = skipped = 0
+        max_lag = 0.0
+        recorded_origin = None
+        started = time.perf_counter()
+        for message in read_messages(self.directory, self.start_time, self.end_time):
+            destination = message.destination and self._remap(message.destination)
+            if not destination:
+                skipped += 1
+                continue
+            if self.speed is not None:
+                if recorded_origin is None:
+                    recorded_origin = message.timestamp
+                due = started + (message.timestamp - recorded_origin) / self.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    if self._stopped.wait(delay):
+                        break
+                else:
+                    max_lag = max(max_lag, -delay)
+            if self._stopped.is_set():
+                break
+            self._publish(destination, message)
+            replayed += 1
+        if isinstance(self.target, CallbackRouter):
+            self.target.join()
+        elapsed = time.perf_counter() - started
+        self._stats = dict(
+            replayed=replayed,
+            skipped=skipped,
+            elapsed=elapsed,
+            rate=replayed / elapsed if elapsed else 0.0,
+            max_lag=max_lag,
+        )
+        _log.debug("Replayed {}: {}".format(self.directory, self._stats))
+        return self._stats
+
+    def start(self) -> Replayer:
+        """Replay on a background thread."""
+        self._thread = threading.Thread(target=self.run, name="gridappsd-replay")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for a replay started with :meth:`start`; return False if timeout passed first."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+            return not self._thread.is_alive()
+        return True
+
+    def stop(self):
+        """Stop a running replay after the message being published."""
+        self._stopped.set()
+        self.wait()
+
+    def stats(self) -> dict[str, Any]:
+        """Return the statistics of the last finished replay.
+
+        ``replayed`` and ``skipped`` messages, ``elapsed`` seconds, ``rate``
+        in messages per second and ``max_lag``, the most seconds a message
+        was published behind its recorded pace.
+        """
+        return dict(self._stats)
+
+
+def main():
+    from gridappsd import GridAPPSD
+
+    parser = argparse.ArgumentParser(description="Replay recorded GridAPPS-D bus traffic.")
+    parser.add_argument("directory", help="recording directory written by gridappsd.recorder")
+    parser.add_argument("--speed", type=float, default=1.0, help="multiple of the recorded pace, 0 for max speed")
+    parser.add_argument(
+        "--replace", nargs=2, metavar=("OLD", "NEW"), help="replace a destination path element, e.g. a simulation id"
+    )
+    opts = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    gapps = GridAPPSD()
+    try:
+        replayer = Replayer(
+            opts.directory,
+            gapps,
+            speed=opts.speed or MAX_SPEED,
+            remap=replace_element(*opts.replace) if opts.replace else None,
+        )
+        _log.info("Replayed: {}".format(replayer.run()))
+    finally:
+        gapps.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,7 @@ from typing import Any, Callable
 
 import gridappsd.topics as t
 from gridappsd import GridAPPSD
-from . import json_extension as json
+from . import codec, json_extension as json
 
 _log = logging.getLogger(__name__)
 
@@ -21,7 +21,7 @@ class SimulationFailedToStartError(Exception):
 @dataclass
 class ConfigBase:
     def asjson(self):
-        return json.dumps(self.asdict())
+        return codec.dumps(self.asdict())
 
     def asdict(self):
         built = {}
@@ -227,7 +227,7 @@ class Simulation:
         command = dict(command=command_name)
         if command_input:
             command["input"] = command_input
-        self._gapps.send(t.simulation_input_topic(self.simulation_id), json.dumps(command))
+        self._gapps.send(t.simulation_input_topic(self.simulation_id), codec.dumps(command))
         self._running_or_paused = True
 
     def pause(self):
@@ -0,0 +1,103 @@
+"""Coalesce identical requests that are in flight at the same time.
+
+When many agents or threads start together they tend to ask the platform
+the same questions at once: the same model, the same object dictionary, the
+same context.  :meth:`~gridappsd.goss.GOSS.get_shared_response` sends only
+the first of identical concurrent requests and hands its reply (or its
+error) to every caller waiting on it.  Requests are identical when they go
+to the same broker, as the same user, to the same topic with an equal
+payload; key order in the payload does not matter.
+
+Only requests without side effects should be coalesced, which is why
+:meth:`~gridappsd.goss.GOSS.get_response` never does.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import threading
+from typing import Any, Callable, Hashable, Optional
+
+from gridappsd import json_extension as json
+
+_log = logging.getLogger(__name__)
+
+
+def request_key(topic: str, message: Any) -> str:
+    """Return a digest of topic and message that ignores the key order and encoding of message."""
+    if isinstance(message, bytes):
+        message = message.decode("utf-8")
+    if isinstance(message, str):
+        try:
+            message = json.loads(message)
+        except ValueError:
+            pass
+    text = json.dumps([topic, message], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight(object):
+    """Runs at most one call per key at a time and shares its outcome with concurrent callers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+        self._stats = dict(calls=0, shared=0)
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """Return fn(), or the result of the call of fn already running for key.
+
+        An exception raised by fn is raised in every caller that shared it.
+
+        :param timeout: seconds a caller that did not start the call waits
+            for it to finish.
+        :raises TimeoutError: if the shared call did not finish within timeout.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats["calls"] += 1
+            else:
+                self._stats["shared"] += 1
+        assert call is not None
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            return call.result
+
+        _log.debug("Sharing the call in flight for {}".format(key))
+        if not call.done.wait(timeout):
+            # The local import keeps goss free to import this module.
+            from gridappsd.goss import TimeoutError
+
+            raise TimeoutError("Request not responded to in a timely manner!")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self) -> dict[str, int]:
+        """Return the number of ``calls`` started and of callers that ``shared`` a call in flight."""
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
+
+
+# Shared by every client of the process, so agents each holding their own
+# connection still coalesce their requests.
+in_flight = SingleFlight()
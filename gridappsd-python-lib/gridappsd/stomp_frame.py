@@ -0,0 +1,121 @@
+"""Minimal STOMP 1.2 frame encoding and incremental parsing.
+
+stomp-py owns the wire protocol for the threaded :class:`~gridappsd.goss.GOSS`
+client.  The asyncio client in :mod:`gridappsd.aio` speaks STOMP over an
+asyncio stream itself and uses the helpers here to build and split frames.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+
+# CONNECT and CONNECTED frames do not escape header values (STOMP 1.2 spec).
+_UNESCAPED_COMMANDS = ("CONNECT", "CONNECTED", "STOMP")
+
+_ESCAPES = (("\\", "\\\\"), ("\r", "\\r"), ("\n", "\\n"), (":", "\\c"))
+_UNESCAPES = {"\\": "\\", "r": "\r", "n": "\n", "c": ":"}
+
+
+@dataclass
+class Frame:
+    """A single STOMP frame."""
+
+    command: str
+    headers: dict[str, str] = field(default_factory=dict)
+    body: bytes = b""
+
+
+def _escape(value: str) -> str:
+    for char, escaped in _ESCAPES:
+        value = value.replace(char, escaped)
+    return value
+
+
+def _unescape(value: str) -> str:
+    if "\\" not in value:
+        return value
+    out = []
+    chars = iter(value)
+    for char in chars:
+        if char == "\\":
+            char = _UNESCAPES.get(next(chars, ""), "")
+        out.append(char)
+    return "".join(out)
+
+
+def encode_frame(frame: Frame) -> bytes:
+    """Serialize frame to bytes, adding a content-length header for any body."""
+    escape = frame.command not in _UNESCAPED_COMMANDS
+    lines = [frame.command]
+    headers = dict(frame.headers)
+    if frame.body:
+        headers["content-length"] = str(len(frame.body))
+    for key, value in headers.items():
+        key, value = str(key), str(value)
+        if escape:
+            key, value = _escape(key), _escape(value)
+        lines.append("{}:{}".format(key, value))
+    return ("\n".join(lines) + "\n\n").encode("utf-8") + frame.body + b"\x00"
+
+
+class FrameParser(object):
+    """Split a byte stream into frames.
+
+    Feed bytes as they arrive from the socket; every complete frame is
+    returned.  Heart-beat end-of-lines between frames are skipped.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> list[Frame]:
+        self._buffer.extend(data)
+        frames: list[Frame] = []
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                return frames
+            frames.append(frame)
+
+    def _next_frame(self) -> Frame | None:
+        buffer = self._buffer
+        # Drop heart-beats (bare EOLs) preceding the next frame.
+        start = 0
+        while start < len(buffer) and buffer[start] in (0x0A, 0x0D):
+            start += 1
+        if start:
+            del buffer[:start]
+
+        header_end = buffer.find(b"\n\n")
+        crlf_end = buffer.find(b"\r\n\r\n")
+        if crlf_end != -1 and (header_end == -1 or crlf_end < header_end):
+            header_end, separator = crlf_end, 4
+        elif header_end != -1:
+            separator = 2
+        else:
+            return None
+
+        head = buffer[:header_end].decode("utf-8").replace("\r\n", "\n").split("\n")
+        command = head[0]
+        escaped = command not in _UNESCAPED_COMMANDS
+        headers: dict[str, str] = {}
+        for line in head[1:]:
+            key, _, value = line.partition(":")
+            if escaped:
+                key, value = _unescape(key), _unescape(value)
+            # The first occurrence of a repeated header wins.
+            headers.setdefault(key, value)
+
+        body_start = header_end + separator
+        if "content-length" in headers:
+            body_end = body_start + int(headers["content-length"])
+            if len(buffer) < body_end + 1:
+                return None
+        else:
+            body_end = buffer.find(b"\x00", body_start)
+            if body_end == -1:
+                return None
+
+        body = bytes(buffer[body_start:body_end])
+        del buffer[: body_end + 1]
+        return Frame(command, headers, body)
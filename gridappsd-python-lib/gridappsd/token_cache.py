@@ -0,0 +1,179 @@
+"""Process-wide cache of GOSS auth tokens.
+
+Fetching a token costs a temporary STOMP connection and a round trip to the
+GOSS token service.  Tokens are cached per address, port, user and password
+(see :func:`token_key`) and shared by every client in the process, so
+reconnects and bulk agent startup skip the handshake.  Concurrent requests for the same key wait for a single fetch.
+
+Tokens expire at the JWT ``exp`` claim when the token carries one, otherwise
+after the cache's default ttl.  Setting the GRIDAPPSD_TOKEN_CACHE environment
+variable to a file path persists tokens across processes; the file is only
+readable by its owner.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Callable, Hashable, Optional
+
+from gridappsd import json_extension as json
+
+_log = logging.getLogger(__name__)
+
+TOKEN_CACHE_ENV = "GRIDAPPSD_TOKEN_CACHE"
+
+# Tokens are refreshed this many seconds before they expire.
+_EXPIRY_MARGIN = 30
+
+
+def token_expiry(token: str, default_ttl: float) -> float:
+    """Return the epoch time token expires at.
+
+    Uses the ``exp`` claim of a JWT, falling back to now + default_ttl for
+    tokens that are not JWTs or carry no expiry.
+    """
+    parts = token.split(".")
+    if len(parts) == 3:
+        payload = parts[1] + "=" * (-len(parts[1]) % 4)
+        try:
+            exp = json.loads(base64.urlsafe_b64decode(payload).decode("utf-8")).get("exp")
+            if isinstance(exp, (int, float)):
+                return float(exp)
+        except (ValueError, binascii.Error, AttributeError):
+            pass
+    return time.time() + default_ttl
+
+
+def token_key(address: str, port: int | str, user: str, password: Optional[str]) -> tuple[str, str, str, str]:
+    """Return the key of the token for user on the broker at address and port.
+
+    The key holds a digest of the password rather than the password, so a
+    client with the wrong password never reuses the token fetched with the
+    right one, and persisted keys do not reveal it.
+    """
+    digest = hashlib.sha256((password or "").encode("utf-8")).hexdigest()[:16]
+    return (str(address), str(port), str(user), digest)
+
+
+class TokenCache(object):
+    """Thread safe token store with per-key single-flight fetching.
+
+    Keys are tuples such as (address, port, user); their parts are compared as
+    strings, so ``("localhost", 61613, "system")`` and
+    ``("localhost", "61613", "system")`` share a token.
+
+    :param default_ttl: seconds a token without an expiry claim is reused.
+    :param path: file to persist tokens to, None to keep them in memory only.
+    """
+
+    def __init__(self, default_ttl: float = 3600, path: Optional[str] = None):
+        self.default_ttl = default_ttl
+        self.path = path
+        self._lock = threading.Lock()
+        self._tokens: dict[str, tuple[str, float]] = {}
+        self._fetch_locks: dict[str, threading.Lock] = {}
+        if path:
+            self._tokens.update(self._read())
+
+    @staticmethod
+    def _key(key: Hashable) -> str:
+        return "|".join(str(part) for part in key) if isinstance(key, tuple) else str(key)
+
+    def _read(self) -> dict[str, tuple[str, float]]:
+        if not self.path:
+            return {}
+        try:
+            with open(self.path) as fp:
+                return {key: (token, expires) for key, (token, expires) in json.load(fp).items()}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, TypeError) as e:
+            _log.warning("Ignoring unreadable token cache {}: {}".format(self.path, e))
+            return {}
+
+    def _write(self, removed: Optional[str] = None):
+        if not self.path:
+            return
+        # Merge with the file so processes sharing it keep each other's tokens.
+        stored = self._read()
+        stored.update(self._tokens)
+        if removed is not None and removed not in self._tokens:
+            stored.pop(removed, None)
+        now = time.time()
+        stored = {key: entry for key, entry in stored.items() if entry[1] > now}
+        tmp = "{}.{}.tmp".format(self.path, os.getpid())
+        try:
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as fp:
+                json.dump(stored, fp)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            _log.warning("Could not write token cache {}: {}".format(self.path, e))
+
+    def get(self, key: Hashable) -> Optional[str]:
+        """Return the cached token for key, or None if absent or about to expire."""
+        key = self._key(key)
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry is None and self.path:
+                # Another process may have stored a token since we last looked.
+                entry = self._read().get(key)
+                if entry is not None:
+                    self._tokens[key] = entry
+            if entry is None:
+                return None
+            token, expires = entry
+            if expires - _EXPIRY_MARGIN <= time.time():
+                del self._tokens[key]
+                return None
+            return token
+
+    def put(self, key: Hashable, token: str, expires: Optional[float] = None):
+        """Store token for key, expiring at the epoch time expires (see :func:`token_expiry`)."""
+        if expires is None:
+            expires = token_expiry(token, self.default_ttl)
+        with self._lock:
+            self._tokens[self._key(key)] = (token, expires)
+            if self.path:
+                self._write()
+
+    def invalidate(self, key: Hashable):
+        """Forget the token for key, e.g. after the broker rejected it."""
+        key = self._key(key)
+        with self._lock:
+            self._tokens.pop(key, None)
+            if self.path:
+                self._write(removed=key)
+
+    def clear(self):
+        """Forget every token held in memory."""
+        with self._lock:
+            self._tokens.clear()
+
+    def get_or_fetch(self, key: Hashable, fetch: Callable[[], Optional[str]]) -> Optional[str]:
+        """Return the cached token for key, calling fetch to obtain one when missing.
+
+        Only one thread fetches a given key at a time; the others wait for it
+        and reuse its token.  A None result from fetch is not cached.
+        """
+        token = self.get(key)
+        if token is not None:
+            return token
+        with self._lock:
+            fetch_lock = self._fetch_locks.setdefault(self._key(key), threading.Lock())
+        with fetch_lock:
+            token = self.get(key)
+            if token is None:
+                token = fetch()
+                if token:
+                    self.put(key, token)
+            return token
+
+
+token_cache = TokenCache(path=os.environ.get(TOKEN_CACHE_ENV) or None)
@@ -0,0 +1,165 @@
+"""Match concrete stomp destinations against ActiveMQ wildcard subscriptions.
+
+ActiveMQ destinations are ``.`` separated paths such as
+``/topic/goss.gridappsd.field.feeder1``.  A subscription may use ``*`` to
+match exactly one path element and ``>`` as the final element to match one
+or more remaining elements, e.g. ``/topic/goss.gridappsd.field.*`` or
+``/queue/goss.gridappsd.process.request.>``.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Any
+
+WILDCARD_ONE = "*"
+WILDCARD_REST = ">"
+
+
+def is_wildcard(destination: str) -> bool:
+    """Return True if destination contains an ActiveMQ wildcard element."""
+    _, name = _split(destination)
+    return any(part in (WILDCARD_ONE, WILDCARD_REST) for part in name.split("."))
+
+
+def normalize_destination(topic: str) -> str:
+    """Return topic as a full destination; names without a ``/topic/`` or ``/temp-queue/`` prefix are queues."""
+    if not topic.startswith("/topic/") and not topic.startswith("/temp-queue/"):
+        topic = "/queue/{topic}".format(topic=topic)
+    return topic
+
+
+def _split(destination: str) -> tuple[str, str]:
+    """Split ``/topic/a.b.c`` into its ``/topic/`` prefix and ``a.b.c`` path."""
+    index = destination.rfind("/") + 1
+    return destination[:index], destination[index:]
+
+
+class _Node(object):
+    __slots__ = ("children", "values")
+
+    def __init__(self) -> None:
+        self.children: dict[str, _Node] = {}
+        self.values: list[Any] = []
+
+
+class TopicMatcher(object):
+    """A trie of destination patterns with a cache of resolved destinations.
+
+    Patterns are stored one trie per destination prefix (``/topic/``,
+    ``/queue/``, ...), keyed by path element.  Resolving a destination walks
+    the trie once, which is O(depth) apart from the ``*`` and ``>`` branches,
+    and the result is cached until a pattern that matches it is added or
+    removed.
+
+    :param cache_size: maximum number of resolved destinations kept.
+    """
+
+    def __init__(self, cache_size: int = 10000):
+        self._roots: dict[str, _Node] = {}
+        self._cache: dict[str, list[Any]] = {}
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def add(self, pattern: str, value: Any):
+        """Associate value with pattern."""
+        prefix, name = _split(pattern)
+        with self._lock:
+            node = self._roots.setdefault(prefix, _Node())
+            for part in name.split("."):
+                node = node.children.setdefault(part, _Node())
+            node.values.append(value)
+            self._invalidate(pattern)
+
+    def remove(self, pattern: str, value: Any):
+        """Remove value from pattern, pruning nodes left empty."""
+        prefix, name = _split(pattern)
+        with self._lock:
+            root = self._roots.get(prefix)
+            if root is None:
+                return
+            path = [root]
+            for part in name.split("."):
+                child = path[-1].children.get(part)
+                if child is None:
+                    return
+                path.append(child)
+            try:
+                path[-1].values.remove(value)
+            except ValueError:
+                return
+            parts = name.split(".")
+            for depth in range(len(parts), 0, -1):
+                node = path[depth]
+                if node.values or node.children:
+                    break
+                del path[depth - 1].children[parts[depth - 1]]
+            if not root.children:
+                del self._roots[prefix]
+            self._invalidate(pattern)
+
+    def _invalidate(self, pattern: str):
+        if is_wildcard(pattern):
+            self._cache = {}
+        else:
+            # A literal pattern only matches the destination it spells, so
+            # short-lived ones such as reply queues leave the rest cached.
+            self._cache.pop(pattern, None)
+
+    def match(self, destination: str) -> list[Any]:
+        """Return the values of every pattern that matches destination."""
+        cache = self._cache
+        matched = cache.get(destination)
+        if matched is not None:
+            return matched
+
+        with self._lock:
+            prefix, name = _split(destination)
+            matched = []
+            root = self._roots.get(prefix)
+            if root is not None:
+                self._collect(root, name.split("."), 0, matched)
+            if len(self._cache) >= self._cache_size:
+                self._cache = {}
+            self._cache[destination] = matched
+        return matched
+
+    def _collect(self, node: _Node, parts: list[str], index: int, matched: list[Any]):
+        if index == len(parts):
+            matched.extend(node.values)
+            return
+        rest = node.children.get(WILDCARD_REST)
+        if rest is not None:
+            matched.extend(rest.values)
+        for key in (parts[index], WILDCARD_ONE):
+            child = node.children.get(key)
+            if child is not None:
+                self._collect(child, parts, index + 1, matched)
+
+
+class TopicMap(object):
+    """A setting chosen per topic, where topics may be ActiveMQ wildcard patterns.
+
+    Topics are normalized with :func:`normalize_destination` on both sides,
+    the way :class:`~gridappsd.goss.CallbackRouter` normalizes subscriptions.
+    """
+
+    def __init__(self) -> None:
+        self._matcher = TopicMatcher()
+        self._values: dict[str, Any] = {}
+
+    def set(self, topic: str, value: Any):
+        """Use value for topic, or remove the setting for topic when value is None."""
+        topic = normalize_destination(topic)
+        if topic in self._values:
+            self._matcher.remove(topic, self._values.pop(topic))
+        if value is not None:
+            self._values[topic] = value
+            self._matcher.add(topic, value)
+
+    def get(self, destination: str) -> Any:
+        """Return the value for destination, None if no topic matches it."""
+        if not self._values:
+            return None
+        values = self._matcher.match(normalize_destination(destination))
+        return values[0] if values else None
@@ -0,0 +1,216 @@
+"""Request/response tracing across GOSS hops.
+
+With tracing enabled, :class:`~gridappsd.goss.GOSS` records a span for every
+:meth:`~gridappsd.goss.GOSS.get_response` request, and
+:class:`~gridappsd.goss.CallbackRouter` records one for every traced message
+it dispatches.  The trace and span ids travel in a W3C ``traceparent`` STOMP
+header, so a request that passes through several processes, e.g. a field
+agent asking its context manager, which asks the OT platform, produces one
+trace:
+
+.. code-block:: text
+
+    request  goss.gridappsd.field.request.feeder1     (field agent)
+      dispatch goss.gridappsd.field.request.feeder1   (context manager)
+        request  goss.gridappsd.process.request.field (context manager -> OT platform)
+        send     /temp-queue/response.x               (reply to the agent)
+
+The request's duration minus its dispatch span is the time spent in the
+broker and on the wire; the dispatch span minus its child requests is the
+context manager's own time.  A span started while a callback runs is a child
+of that callback's dispatch span.
+
+Spans go to an exporter.  :func:`enable` uses an :class:`InMemoryExporter`
+unless given another :class:`SpanExporter`.  Tracing is off by default and
+then costs a single check per message.
+"""
+
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Optional
+
+_log = logging.getLogger(__name__)
+
+TRACEPARENT_HEADER = "traceparent"
+
+# Span kinds, as in OpenTelemetry.
+CLIENT = "client"
+PRODUCER = "producer"
+CONSUMER = "consumer"
+
+_current = threading.local()
+
+
+class Span(object):
+    """A timed operation within a trace.
+
+    :param name: what was done, e.g. ``"request"`` or ``"dispatch"``.
+    :param kind: :data:`CLIENT`, :data:`PRODUCER` or :data:`CONSUMER`.
+    :param destination: the STOMP destination involved.
+    :param trace_id: 32 hex digit id shared by every span of the trace.
+    :param parent_id: span id of the parent, None for the root span.
+    """
+
+    __slots__ = ("name", "kind", "destination", "trace_id", "span_id", "parent_id", "start", "end", "attributes")
+
+    def __init__(
+        self,
+        name: str,
+        kind: str,
+        destination: str,
+        trace_id: Optional[str] = None,
+        parent_id: Optional[str] = None,
+    ):
+        self.name = name
+        self.kind = kind
+        self.destination = destination
+        self.trace_id = trace_id or "{:032x}".format(random.getrandbits(128))
+        self.span_id = "{:016x}".format(random.getrandbits(64))
+        self.parent_id = parent_id
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.attributes: dict[str, Any] = {}
+
+    @property
+    def duration(self) -> Optional[float]:
+        """Seconds from start to end, None while the span is open."""
+        return None if self.end is None else self.end - self.start
+
+    @property
+    def traceparent(self) -> str:
+        """The ``traceparent`` header value that makes this span the parent on the receiving side."""
+        return "00-{}-{}-01".format(self.trace_id, self.span_id)
+
+    def child(self, name: str, kind: str, destination: str) -> Span:
+        return Span(name, kind, destination, self.trace_id, self.span_id)
+
+    def finish(self, **attributes):
+        """End the span, add attributes to it and hand it to the exporter."""
+        self.end = time.time()
+        self.attributes.update(attributes)
+        exporter = _exporter
+        if exporter is not None:
+            try:
+                exporter.export(self)
+            except Exception:
+                _log.exception("Span exporter {} failed".format(exporter))
+
+    def as_dict(self) -> dict[str, Any]:
+        return dict(
+            name=self.name,
+            kind=self.kind,
+            destination=self.destination,
+            trace_id=self.trace_id,
+            span_id=self.span_id,
+            parent_id=self.parent_id,
+            start=self.start,
+            end=self.end,
+            duration=self.duration,
+            attributes=dict(self.attributes),
+        )
+
+    def __repr__(self):
+        return "Span({} {} {} trace={} span={} parent={} duration={})".format(
+            self.kind, self.name, self.destination, self.trace_id, self.span_id, self.parent_id, self.duration
+        )
+
+
+class SpanExporter(object):
+    """Receives every finished span."""
+
+    def export(self, span: Span):
+        raise NotImplementedError()
+
+
+class InMemoryExporter(SpanExporter):
+    """Keeps the most recent finished spans in memory.
+
+    :param max_spans: number of spans kept; older ones are discarded.
+    """
+
+    def __init__(self, max_spans: int = 10000):
+        self._spans: deque[Span] = deque(maxlen=max_spans)
+
+    def export(self, span: Span):
+        self._spans.append(span)
+
+    def spans(self) -> list[Span]:
+        """Return the kept spans, oldest first."""
+        return list(self._spans)
+
+    def trace(self, trace_id: str) -> list[Span]:
+        """Return the spans of one trace in the order they started."""
+        return sorted((span for span in list(self._spans) if span.trace_id == trace_id), key=lambda span: span.start)
+
+    def clear(self):
+        self._spans.clear()
+
+
+_exporter: Optional[SpanExporter] = None
+
+
+def enable(exporter: Optional[SpanExporter] = None) -> SpanExporter:
+    """Start tracing, sending spans to exporter, by default a new :class:`InMemoryExporter`.
+
+    :return: the exporter in use.
+    """
+    global _exporter
+    _exporter = exporter if exporter is not None else InMemoryExporter()
+    return _exporter
+
+
+def disable():
+    """Stop tracing."""
+    global _exporter
+    _exporter = None
+
+
+def is_enabled() -> bool:
+    return _exporter is not None
+
+
+def get_exporter() -> Optional[SpanExporter]:
+    return _exporter
+
+
+def current_span() -> Optional[Span]:
+    """Return the span of the message being dispatched on this thread, if it is traced."""
+    return getattr(_current, "span", None)
+
+
+def set_current_span(span: Optional[Span]) -> Optional[Span]:
+    """Make span the parent of spans started on this thread; return the previous one."""
+    previous = getattr(_current, "span", None)
+    _current.span = span
+    return previous
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[tuple[str, str]]:
+    """Return (trace_id, parent span id) from a ``traceparent`` header value, None if it is not valid."""
+    if not value:
+        return None
+    parts = value.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+def start_span(name: str, kind: str, destination: str) -> Span:
+    """Start a span that is a child of the current span, or a new trace when there is none."""
+    parent = current_span()
+    if parent is not None:
+        return parent.child(name, kind, destination)
+    return Span(name, kind, destination)
+
+
+def start_consumer_span(headers: dict[str, Any]) -> Optional[Span]:
+    """Start a dispatch span for a received message that carries a traceparent header."""
+    context = parse_traceparent(headers.get(TRACEPARENT_HEADER))
+    if context is None:
+        return None
+    return Span("dispatch", CONSUMER, headers.get("destination", ""), context[0], context[1])
@@ -0,0 +1,13 @@
+"""Helpers shared by the test modules."""
+
+import time
+
+
+def wait_for(condition, timeout=2.0):
+    """Poll condition until it is true; return False if timeout seconds pass first."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
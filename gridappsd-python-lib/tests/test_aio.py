@@ -0,0 +1,323 @@
+import asyncio
+
+import pytest
+
+from gridappsd import json_extension as json
+from gridappsd import topics as t
+from gridappsd import aio
+from gridappsd.aio import AsyncGridAPPSD
+from gridappsd.goss import TOKEN_TOPIC, TimeoutError
+from gridappsd.stomp_frame import Frame, FrameParser, encode_frame
+from gridappsd.token_cache import TokenCache, token_key
+
+
+class _Broker:
+    """Just enough of a STOMP broker for the client: exact-match routing plus responders."""
+
+    def __init__(self, echo_correlation_id=True):
+        self.echo_correlation_id = echo_correlation_id
+        self.responders = {TOKEN_TOPIC: lambda headers, body: "the-token"}
+        self.subscriptions = {}
+        self.sent = []
+        self.logins = []
+        self.rejected_logins = set()
+        self._writers = []
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._client, "127.0.0.1", 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        for writer in self._writers:
+            writer.close()
+        self._server.close()
+        await self._server.wait_closed()
+
+    def deliver(self, destination, body, headers=None):
+        for (writer, sub_id), dest in list(self.subscriptions.items()):
+            if dest == destination:
+                frame_headers = dict(headers or {})
+                frame_headers.update({"destination": destination, "subscription": sub_id})
+                writer.write(encode_frame(Frame("MESSAGE", frame_headers, body.encode("utf-8"))))
+
+    async def _client(self, reader, writer):
+        self._writers.append(writer)
+        parser = FrameParser()
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            for frame in parser.feed(data):
+                self._handle(writer, frame)
+            await writer.drain()
+
+    def _handle(self, writer, frame):
+        headers = frame.headers
+        if frame.command == "CONNECT":
+            self.logins.append(headers.get("login"))
+            if headers.get("login") in self.rejected_logins:
+                writer.write(encode_frame(Frame("ERROR", {"message": "Authentication failed"})))
+            else:
+                writer.write(encode_frame(Frame("CONNECTED", {"version": "1.2", "heart-beat": "0,0"})))
+        elif frame.command == "SUBSCRIBE":
+            self.subscriptions[(writer, headers["id"])] = headers["destination"]
+        elif frame.command == "UNSUBSCRIBE":
+            self.subscriptions.pop((writer, headers["id"]), None)
+        elif frame.command == "DISCONNECT":
+            writer.write(encode_frame(Frame("RECEIPT", {"receipt-id": headers["receipt"]})))
+        elif frame.command == "SEND":
+            destination = headers["destination"]
+            self.sent.append(frame)
+            responder = self.responders.get(destination)
+            if responder is not None and "reply-to" in headers:
+                reply_to = headers["reply-to"]
+                if destination == TOKEN_TOPIC:
+                    reply_to = "/queue/" + reply_to
+                reply_headers = {}
+                if self.echo_correlation_id and "correlation-id" in headers:
+                    reply_headers["correlation-id"] = headers["correlation-id"]
+                self.deliver(reply_to, responder(headers, frame.body.decode("utf-8")), reply_headers)
+            else:
+                self.deliver(destination, frame.body.decode("utf-8"))
+
+
+def _run(coro_fn, **broker_kwargs):
+    async def main():
+        broker = _Broker(**broker_kwargs)
+        port = await broker.start()
+        try:
+            await asyncio.wait_for(coro_fn(broker, port), 10)
+        finally:
+            await broker.stop()
+
+    asyncio.run(main())
+
+
+def _sparql_page(headers, body):
+    limit, offset = map(int, json.loads(body)["queryString"].split()[-3::2])
+    rows = [{"i": {"type": "literal", "value": str(i)}} for i in range(offset, min(offset + limit, 10))]
+    return json.dumps({"data": {"head": {"vars": ["i"]}, "results": {"bindings": rows}}})
+
+
+def _client(port, **kwargs):
+    return AsyncGridAPPSD(username="system", password="manager", address=("127.0.0.1", port), **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def _local_broker_env(monkeypatch):
+    # conftest points GRIDAPPSD_ADDRESS/PORT at the docker platform.
+    monkeypatch.delenv("GRIDAPPSD_ADDRESS", raising=False)
+    monkeypatch.delenv("GRIDAPPSD_PORT", raising=False)
+
+
+class TestAsyncGridAPPSD:
+    def test_connects_with_token(self):
+        async def scenario(broker, port):
+            async with _client(port) as gapps:
+                assert gapps.connected
+            assert not gapps.connected
+            # The token connection uses the password, the session uses the token.
+            assert broker.logins == ["system", "the-token"]
+
+        _run(scenario)
+
+    def test_connects_with_password(self):
+        async def scenario(broker, port):
+            async with _client(port, use_auth_token=False):
+                pass
+            assert broker.logins == ["system"]
+
+        _run(scenario)
+
+    def test_rejected_cached_token_is_fetched_again(self, monkeypatch):
+        cache = TokenCache()
+        monkeypatch.setattr(aio, "token_cache", cache)
+
+        async def scenario(broker, port):
+            broker.rejected_logins.add("expired-token")
+            cache.put(token_key("127.0.0.1", port, "system", "manager"), "expired-token")
+            async with _client(port) as gapps:
+                assert gapps.connected
+            assert broker.logins == ["expired-token", "system", "the-token"]
+            assert cache.get(token_key("127.0.0.1", port, "system", "manager")) == "the-token"
+
+        _run(scenario)
+
+    def test_token_is_not_reused_with_another_password(self, monkeypatch):
+        monkeypatch.setattr(aio, "token_cache", TokenCache())
+        # conftest sets GRIDAPPSD_USER/PASSWORD, which would overrule the passwords.
+        monkeypatch.delenv("GRIDAPPSD_USER", raising=False)
+        monkeypatch.delenv("GRIDAPPSD_PASSWORD", raising=False)
+
+        async def scenario(broker, port):
+            async with _client(port):
+                pass
+            async with AsyncGridAPPSD(username="system", password="wrong", address=("127.0.0.1", port)):
+                pass
+            assert broker.logins == ["system", "the-token", "system", "the-token"]
+
+        _run(scenario)
+
+    def test_get_response_concurrent(self):
+        async def scenario(broker, port):
+            broker.responders["goss.gridappsd.echo"] = lambda headers, body: json.dumps({"data": json.loads(body)["n"]})
+            async with _client(port) as gapps:
+                results = await asyncio.gather(
+                    *(gapps.get_response("goss.gridappsd.echo", {"n": i}) for i in range(50))
+                )
+                assert [r["data"] for r in results] == list(range(50))
+                assert not gapps._pending_responses
+                sent = [f for f in broker.sent if f.headers["destination"] == "goss.gridappsd.echo"]
+                # Every request has its own reply queue, unsubscribed once answered.
+                assert len({f.headers["reply-to"] for f in sent}) == 50
+                assert not gapps._conn._handlers
+                assert sent[0].headers["GOSS_SUBJECT"] == "the-token"
+
+        _run(scenario)
+
+    def test_get_response_shared_reply_queue(self):
+        async def scenario(broker, port):
+            broker.responders["goss.gridappsd.echo"] = lambda headers, body: json.dumps({"data": json.loads(body)["n"]})
+            async with _client(port, shared_reply_queue=True) as gapps:
+                results = await asyncio.gather(
+                    *(gapps.get_response("goss.gridappsd.echo", {"n": i}) for i in range(50))
+                )
+                assert [r["data"] for r in results] == list(range(50))
+                assert not gapps._pending_responses
+                sent = [f for f in broker.sent if f.headers["destination"] == "goss.gridappsd.echo"]
+                assert len({f.headers["reply-to"] for f in sent}) == 1
+
+        _run(scenario)
+
+    def test_get_responses(self):
+        async def scenario(broker, port):
+            broker.responders["goss.gridappsd.echo"] = lambda headers, body: body
+            async with _client(port) as gapps:
+                requests = [("goss.gridappsd.echo", {"i": i}) for i in range(20)]
+                results = await gapps.get_responses(requests, max_in_flight=5)
+                assert [r["i"] for r in results] == list(range(20))
+
+                requests.append(("goss.gridappsd.nobody", {}))
+                results = await gapps.get_responses(requests, timeout=0.1, return_exceptions=True)
+                assert isinstance(results[-1], TimeoutError)
+
+                completed = [index async for index, _ in gapps.iter_responses(requests[-3:], timeout=0.1)]
+                assert sorted(completed) == [0, 1, 2]
+                assert not gapps._pending_responses
+
+                for max_in_flight in (0, -1):
+                    with pytest.raises(ValueError, match="max_in_flight"):
+                        await gapps.get_responses(requests, max_in_flight=max_in_flight)
+                    with pytest.raises(ValueError, match="max_in_flight"):
+                        [item async for item in gapps.iter_responses(requests, max_in_flight=max_in_flight)]
+
+        _run(scenario)
+
+    def test_get_response_without_correlation_id(self):
+        async def scenario(broker, port):
+            broker.responders["goss.gridappsd.echo"] = lambda headers, body: '{"data": 1}'
+            async with _client(port) as gapps:
+                assert await gapps.get_response("goss.gridappsd.echo", {}) == {"data": 1}
+
+        _run(scenario, echo_correlation_id=False)
+
+    def test_fan_out_without_correlation_id(self):
+        async def scenario(broker, port):
+            broker.responders["goss.gridappsd.echo"] = lambda headers, body: body
+            broker.responders[t.REQUEST_DATA + ".powergridmodel"] = _sparql_page
+            async with _client(port, shared_reply_queue=True) as gapps:
+                requests = [("goss.gridappsd.echo", {"i": i}) for i in range(10)]
+                assert [r["i"] for r in await gapps.get_responses(requests)] == list(range(10))
+                rows = [row async for row in gapps.query_data_iter("SELECT ?i", page_size=3, prefetch=2)]
+                assert [row["i"]["value"] for row in rows] == [str(i) for i in range(10)]
+
+        _run(scenario, echo_correlation_id=False)
+
+    def test_lost_connection_fails_requests_at_once(self):
+        for shared_reply_queue in (False, True):
+
+            async def scenario(broker, port):
+                async with _client(port, shared_reply_queue=shared_reply_queue) as gapps:
+                    request = asyncio.ensure_future(gapps.get_response("goss.gridappsd.nobody", {}, timeout=3))
+                    await asyncio.sleep(0.2)
+                    for writer in broker._writers:
+                        writer.close()
+                    started = asyncio.get_running_loop().time()
+                    with pytest.raises(ConnectionError):
+                        await request
+                    assert asyncio.get_running_loop().time() - started < 1
+
+            _run(scenario)
+
+    def test_shared_reply_queue_discards_uncorrelated_replies(self):
+        async def scenario(broker, port):
+            broker.responders["goss.gridappsd.echo"] = lambda headers, body: '{"data": 1}'
+            async with _client(port, shared_reply_queue=True) as gapps:
+                with pytest.raises(TimeoutError):
+                    await gapps.get_response("goss.gridappsd.echo", {}, timeout=0.1)
+
+        _run(scenario, echo_correlation_id=False)
+
+    def test_get_response_timeout(self):
+        async def scenario(broker, port):
+            async with _client(port) as gapps:
+                with pytest.raises(TimeoutError):
+                    await gapps.get_response("goss.gridappsd.nobody", {}, timeout=0.1)
+                assert not gapps._pending_responses
+
+        _run(scenario)
+
+    def test_query_methods_are_awaitable(self):
+        async def scenario(broker, port):
+            broker.responders["goss.gridappsd.process.request.data.powergridmodel"] = lambda headers, body: json.dumps(
+                {"data": {"models": [json.loads(body)["requestType"]]}}
+            )
+            async with _client(port) as gapps:
+                assert await gapps.query_model_info() == {"data": {"models": ["QUERY_MODEL_INFO"]}}
+
+        _run(scenario)
+
+    def test_subscribe(self):
+        async def scenario(broker, port):
+            async with _client(port) as gapps:
+                async with gapps.subscribe("/topic/sim.output") as sub:
+                    await gapps.send("/topic/sim.output", {"a": 1})
+                    await gapps.send("/topic/sim.output", "plain")
+                    received = []
+                    async for headers, message in sub:
+                        received.append(message)
+                        if len(received) == 2:
+                            break
+                    assert received == [{"a": 1}, "plain"]
+                    assert headers["destination"] == "/topic/sim.output"
+                # Let the broker read the UNSUBSCRIBE frame.
+                await asyncio.sleep(0.05)
+                assert "/topic/sim.output" not in broker.subscriptions.values()
+
+        _run(scenario)
+
+    def test_closing_a_full_subscription(self):
+        async def scenario(broker, port):
+            async with _client(port) as gapps:
+                sub = await gapps.subscribe("/topic/sim.output", maxsize=2).start()
+                for i in range(3):
+                    await gapps.send("/topic/sim.output", {"i": i})
+                await asyncio.sleep(0.05)
+                await sub.close()
+                assert [message["i"] async for _, message in sub] == [0, 1]
+                assert [item async for item in sub] == []
+
+        _run(scenario)
+
+    def test_connection_lost_ends_subscriptions(self):
+        async def scenario(broker, port):
+            gapps = _client(port)
+            sub = await gapps.subscribe("/topic/sim.output").start()
+            for writer in broker._writers:
+                writer.close()
+            received = [item async for item in sub]
+            assert received == []
+            assert not gapps.connected
+            await gapps.disconnect()
+
+        _run(scenario)
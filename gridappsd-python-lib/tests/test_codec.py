@@ -0,0 +1,100 @@
+import dataclasses
+
+import pytest
+
+from gridappsd import codec, json_extension
+from gridappsd.goss import _serialize_message
+from gridappsd.message import MessageEnvelope
+
+MESSAGE = {
+    "key1": {
+        "key2": complex(3.369, 4.213),
+        "key3": {"key4": complex(-5.147, -6.258), "key5": {"real": -9.654, "imag": 8.321}},
+        "key6": {"real": 7.894, "imag": -8.542, "garbage": True},
+        "key7": [complex(1, 2), {"real": "not", "imag": "numbers"}, 1, "a", None],
+    },
+}
+
+DECODED = {
+    "key1": {
+        "key2": complex(3.369, 4.213),
+        "key3": {"key4": complex(-5.147, -6.258), "key5": complex(-9.654, 8.321)},
+        "key6": {"real": 7.894, "imag": -8.542, "garbage": True},
+        "key7": [complex(1, 2), {"real": "not", "imag": "numbers"}, 1, "a", None],
+    },
+}
+
+
+@dataclasses.dataclass
+class _Point:
+    x: int
+    y: complex
+
+
+@pytest.fixture
+def restore_codec():
+    previous = codec.get_codec()
+    yield
+    codec.set_codec(previous)
+
+
+@pytest.mark.parametrize("name", codec.available_codecs())
+def test_round_trip(name):
+    instance = codec.create_codec(name)
+
+    assert instance.loads(instance.dumps(MESSAGE)) == DECODED
+    assert instance.loads(instance.dumps(MESSAGE).encode("utf-8")) == DECODED
+    assert instance.loads(instance.dumps(_Point(1, complex(0, 1)))) == {"x": 1, "y": complex(0, 1)}
+
+
+@pytest.mark.parametrize("name", codec.available_codecs())
+def test_codecs_agree_with_json_extension(name):
+    encoded = json_extension.dumps(MESSAGE)
+
+    assert codec.create_codec(name).loads(encoded) == json_extension.loads(encoded)
+
+
+@pytest.mark.parametrize("name", codec.available_codecs())
+def test_invalid_json_raises_value_error(name):
+    with pytest.raises(ValueError):
+        codec.create_codec(name).loads("not json")
+
+
+def test_stdlib_output_is_unchanged():
+    assert codec.StdlibCodec().dumps(MESSAGE) == json_extension.dumps(MESSAGE)
+
+
+def test_restore_complex():
+    assert codec.restore_complex({"a": [{"real": 1, "imag": 0}], "b": {"real": 1}}) == {
+        "a": [complex(1, 0)],
+        "b": {"real": 1},
+    }
+    assert codec.restore_complex({"real": 2, "imag": 3}) == complex(2, 3)
+
+
+def test_create_codec():
+    assert codec.create_codec("auto").name in codec.available_codecs()
+    with pytest.raises(ValueError):
+        codec.create_codec("yaml")
+
+
+def test_set_codec_is_used_on_the_message_path(restore_codec):
+    class Recording(codec.StdlibCodec):
+        calls = 0
+
+        def loads(self, data):
+            Recording.calls += 1
+            return super().loads(data)
+
+    previous = codec.set_codec(Recording())
+
+    assert previous is not codec.get_codec()
+    assert MessageEnvelope({}, '{"a": {"real": 1, "imag": 2}}').body == {"a": complex(1, 2)}
+    assert Recording.calls == 1
+    assert _serialize_message({"a": 1}) == '{"a": 1}'
+
+
+def test_unusable_environment_codec_falls_back(monkeypatch):
+    monkeypatch.setenv(codec.JSON_CODEC_ENV, "no-such-codec")
+
+    assert codec._codec_from_environment().name == "stdlib"
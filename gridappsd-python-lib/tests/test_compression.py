@@ -0,0 +1,59 @@
+"""Unit tests for gridappsd.compression."""
+
+import pytest
+
+from gridappsd import compression
+from gridappsd.compression import CompressionPolicy, compress_body, decompress_body
+
+
+class TestAlgorithms:
+    @pytest.mark.parametrize("algorithm", ["zlib", "zstd"])
+    def test_round_trip(self, algorithm):
+        if algorithm not in compression.available_algorithms():
+            pytest.skip("{} is not installed".format(algorithm))
+        data = b'{"mRID": "_0a1b2c3d"}' * 1000
+
+        compressed = compression.compress(algorithm, data)
+
+        assert len(compressed) < len(data) / 10
+        assert compression.decompress(algorithm, compressed) == data
+
+    def test_unknown_algorithm(self):
+        with pytest.raises(ValueError):
+            compression.compress("lz4", b"data")
+        with pytest.raises(ValueError):
+            CompressionPolicy().set("/topic/a", "lz4")
+
+    def test_negotiate(self):
+        assert "zlib" in compression.accept_encoding().split(",")
+        assert compression.negotiate("lz4, zlib") == "zlib"
+        assert compression.negotiate("lz4") is None
+        assert compression.negotiate(None) is None
+
+
+class TestBodies:
+    def test_small_bodies_are_untouched(self):
+        headers = {}
+        body = '{"a": 1}'
+
+        assert compress_body(body, headers, "zlib", 1024) is body
+        assert headers == {}
+
+    def test_large_text_is_compressed_and_restored(self):
+        headers = {}
+        body = '{"a": "' + "x" * 2000 + '"}'
+
+        compressed = compress_body(body, headers, "zlib", 1024)
+
+        assert headers == {"content-encoding": "zlib"}
+        assert len(compressed) < len(body)
+        assert decompress_body(headers, compressed) == body.encode("utf-8")
+
+    def test_no_algorithm_means_no_compression(self):
+        body = "x" * 2000
+
+        assert compress_body(body, {}, None, 0) is body
+
+    def test_uncompressed_and_corrupt_bodies_pass_through(self):
+        assert decompress_body({}, b"plain") == b"plain"
+        assert decompress_body({"content-encoding": "zlib"}, b"garbage") == b"garbage"
@@ -0,0 +1,125 @@
+"""Unit tests for gridappsd.dispatch_queue."""
+
+import threading
+import time
+
+import pytest
+
+from gridappsd.dispatch_queue import DispatchQueue, OverflowPolicy
+
+
+def _drain(queue):
+    items = []
+    while len(queue):
+        items.append(queue.get())
+    return items
+
+
+def test_unbounded_queue_is_fifo():
+    queue = DispatchQueue()
+    for i in range(5):
+        queue.put("/topic/a", i)
+
+    assert _drain(queue) == [0, 1, 2, 3, 4]
+
+
+def test_drop_newest_discards_arriving_message():
+    queue = DispatchQueue(maxsize=2)
+
+    assert queue.put("/topic/a", 1, OverflowPolicy.DROP_NEWEST)
+    assert queue.put("/topic/a", 2, OverflowPolicy.DROP_NEWEST)
+    assert not queue.put("/topic/a", 3, OverflowPolicy.DROP_NEWEST)
+
+    assert _drain(queue) == [1, 2]
+    assert queue.stats()["dropped"] == {"/topic/a": 1}
+
+
+def test_drop_oldest_discards_waiting_message():
+    queue = DispatchQueue(maxsize=2)
+    queue.put("/topic/a", 1, OverflowPolicy.DROP_OLDEST)
+    queue.put("/topic/b", 2, OverflowPolicy.DROP_OLDEST)
+    queue.put("/topic/b", 3, OverflowPolicy.DROP_OLDEST)
+
+    assert _drain(queue) == [2, 3]
+    assert queue.stats()["dropped"] == {"/topic/a": 1}
+
+
+def test_latest_keeps_one_message_per_destination():
+    queue = DispatchQueue()
+    queue.put("/topic/a", 1, OverflowPolicy.LATEST)
+    queue.put("/topic/b", 2, OverflowPolicy.LATEST)
+    queue.put("/topic/a", 3, OverflowPolicy.LATEST)
+
+    # /topic/a keeps its original position but delivers the newest message.
+    assert _drain(queue) == [3, 2]
+    assert queue.stats()["dropped_total"] == 1
+
+
+def test_block_waits_for_room():
+    queue = DispatchQueue(maxsize=1)
+    queue.put("/topic/a", 1)
+    queued = threading.Event()
+
+    def producer():
+        queue.put("/topic/a", 2, OverflowPolicy.BLOCK)
+        queued.set()
+
+    threading.Thread(target=producer, daemon=True).start()
+    assert not queued.wait(0.1)
+
+    assert queue.get() == 1
+    assert queued.wait(1)
+    assert queue.get() == 2
+
+
+def test_get_times_out_on_empty_queue():
+    queue = DispatchQueue()
+
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        queue.get(timeout=0.05)
+    assert time.perf_counter() - start < 1
+
+
+def test_stats_report_depth_and_high_water_mark():
+    queue = DispatchQueue(maxsize=10)
+    for i in range(4):
+        queue.put("/topic/a", i)
+    queue.get()
+
+    stats = queue.stats()
+    assert stats["depth"] == 3
+    assert stats["high_water_mark"] == 4
+    assert stats["maxsize"] == 10
+    assert stats["dropped_total"] == 0
+
+
+def test_negative_maxsize_is_rejected():
+    with pytest.raises(ValueError):
+        DispatchQueue(maxsize=-1)
+
+
+def test_join_waits_for_task_done():
+    queue = DispatchQueue()
+    queue.put("/topic/a", 1)
+    queue.put("/topic/b", 2)
+    queue.get()
+    queue.task_done()
+
+    assert not queue.join(timeout=0.01)
+
+    queue.get()
+    threading.Timer(0.05, queue.task_done).start()
+    assert queue.join(timeout=2)
+
+
+def test_dropped_messages_need_no_task_done():
+    queue = DispatchQueue(maxsize=1)
+    queue.put("/topic/a", 1, OverflowPolicy.DROP_OLDEST)
+    queue.put("/topic/a", 2, OverflowPolicy.DROP_OLDEST)
+    queue.put("/topic/b", 3, OverflowPolicy.LATEST)
+    queue.put("/topic/b", 4, OverflowPolicy.LATEST)
+
+    assert queue.get() == 4
+    queue.task_done()
+    assert queue.join(timeout=0)
@@ -6,9 +6,25 @@ with attempt_connection=False where a GOSS/GridAPPSD instance is needed
 at all.
 """
 
+import threading
+import time
+
 import pytest
 
-from gridappsd.goss import _serialize_message, _unpack_stomp_args
+from gridappsd import json_extension as json
+from gridappsd.dispatch_queue import OverflowPolicy
+from gridappsd.goss import (
+    GOSS,
+    CallbackRouter,
+    TimeoutError,
+    _connection_pool,
+    _serialize_message,
+    _unpack_stomp_args,
+)
+from gridappsd.message import MessageEnvelope
+from stomp.exception import ConnectFailedException, NotConnectedException
+
+from helpers import wait_for
 
 
 class _FakeFrame:
@@ -126,3 +142,1246 @@ class TestSerializeMessage:
         result = _serialize_message(payload)
 
         assert result is payload
+
+
+class _FakeConnection:
+    """Stand in for a connected stomp Connection12.
+
+    Records every frame sent and, when a responder is given, answers any
+    send carrying a reply-to header by delivering the responder's return
+    value to the registered listeners on a separate thread, the way
+    stomp's receiver thread would.
+    """
+
+    def __init__(self, responder=None, delay=0.0, echo_correlation_id=True):
+        self.sent = []
+        self.subscriptions = []
+        self.listeners = {}
+        self._responder = responder
+        self._delay = delay
+        self._echo_correlation_id = echo_correlation_id
+
+    def is_connected(self):
+        return True
+
+    def get_listener(self, name):
+        return self.listeners.get(name)
+
+    def set_listener(self, name, listener):
+        self.listeners[name] = listener
+
+    def subscribe(self, destination, id, ack="auto", headers=None):
+        self.subscriptions.append((destination, id))
+
+    def unsubscribe(self, id):
+        self.subscriptions = [s for s in self.subscriptions if s[1] != id]
+
+    def send(self, body, destination, headers=None, **kwargs):
+        headers = dict(headers or {})
+        self.sent.append((destination, body, headers))
+        if self._responder is not None and "reply-to" in headers:
+            threading.Timer(self._delay, self._reply, args=(destination, body, headers)).start()
+
+    def _reply(self, destination, body, headers):
+        reply = self._responder(destination, body, headers)
+        if reply is None:
+            return
+        reply_headers = {"destination": headers["reply-to"]}
+        if self._echo_correlation_id and "correlation-id" in headers:
+            reply_headers["correlation-id"] = headers["correlation-id"]
+        for listener in list(self.listeners.values()):
+            listener.on_message(reply_headers, reply)
+
+    def disconnect(self):
+        pass
+
+
+def _make_goss(conn, **kwargs):
+    goss = GOSS(username="u", password="p", attempt_connection=False, use_auth_token=False, **kwargs)
+    goss._conn = conn
+    return goss
+
+
+class TestGetResponse:
+    def test_returns_as_soon_as_reply_arrives(self):
+        conn = _FakeConnection(responder=lambda dest, body, hdrs: '{"answer": 42}', delay=0.01)
+        goss = _make_goss(conn)
+
+        start = time.perf_counter()
+        response = goss.get_response("goss.gridappsd.test", {"resultFormat": "JSON"}, timeout=5)
+        elapsed = time.perf_counter() - start
+
+        assert response == {"answer": 42}
+        # The old implementation polled once per second.
+        assert elapsed < 0.5
+
+    def test_fractional_timeout_raises_promptly(self):
+        conn = _FakeConnection()
+        goss = _make_goss(conn)
+
+        start = time.perf_counter()
+        with pytest.raises(TimeoutError):
+            goss.get_response("goss.gridappsd.test", {"resultFormat": "JSON"}, timeout=0.2)
+        elapsed = time.perf_counter() - start
+
+        assert 0.15 <= elapsed < 1.0
+
+    def test_request_carries_reply_to_header(self):
+        conn = _FakeConnection(responder=lambda dest, body, hdrs: "{}")
+        goss = _make_goss(conn)
+
+        goss.get_response("goss.gridappsd.test", {"resultFormat": "JSON"}, timeout=1)
+
+        destination, body, headers = conn.sent[0]
+        assert destination == "goss.gridappsd.test"
+        assert json.loads(body) == {"resultFormat": "JSON"}
+        assert headers["reply-to"].startswith("/temp-queue/")
+
+
+class TestSharedReplyQueue:
+    def test_many_requests_use_one_subscription(self):
+        conn = _FakeConnection(responder=lambda dest, body, hdrs: body)
+        goss = _make_goss(conn, shared_reply_queue=True)
+
+        for i in range(25):
+            assert goss.get_response("goss.gridappsd.test", {"resultFormat": "JSON", "i": i}, timeout=1)["i"] == i
+
+        assert len(conn.subscriptions) == 1
+        assert len(goss._router_callback._topics_callback_map) == 1
+        assert goss._pending_responses == {}
+
+    def test_concurrent_requests_get_their_own_reply(self):
+        conn = _FakeConnection(responder=lambda dest, body, hdrs: body, delay=0.05)
+        goss = _make_goss(conn, shared_reply_queue=True)
+        results = {}
+
+        def request(i):
+            results[i] = goss.get_response("goss.gridappsd.test", {"resultFormat": "JSON", "i": i}, timeout=2)
+
+        threads = [threading.Thread(target=request, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert {i: r["i"] for i, r in results.items()} == {i: i for i in range(20)}
+        correlation_ids = {headers["correlation-id"] for _, _, headers in conn.sent}
+        assert len(correlation_ids) == 20
+
+    def test_reply_without_correlation_id_is_discarded(self):
+        conn = _FakeConnection(responder=lambda dest, body, hdrs: '{"ok": true}', echo_correlation_id=False)
+        goss = _make_goss(conn, shared_reply_queue=True)
+
+        with pytest.raises(TimeoutError):
+            goss.get_response("goss.gridappsd.test", {"resultFormat": "JSON"}, timeout=0.2)
+
+    def test_late_reply_is_discarded(self):
+        conn = _FakeConnection(responder=lambda dest, body, hdrs: "{}", delay=0.3)
+        goss = _make_goss(conn, shared_reply_queue=True)
+
+        with pytest.raises(TimeoutError):
+            goss.get_response("goss.gridappsd.test", {"resultFormat": "JSON"}, timeout=0.05)
+        time.sleep(0.4)
+
+        assert goss._pending_responses == {}
+
+    def test_per_request_reply_queue_is_unsubscribed(self):
+        conn = _FakeConnection(responder=lambda dest, body, hdrs: "{}")
+        goss = _make_goss(conn)
+
+        for _ in range(5):
+            goss.get_response("goss.gridappsd.test", {"resultFormat": "JSON"}, timeout=1)
+
+        assert conn.subscriptions == []
+        assert len(goss._router_callback._topics_callback_map) == 0
+        assert len({headers["reply-to"] for _, _, headers in conn.sent}) == 5
+
+    def test_uncorrelated_replies_reach_only_their_request(self):
+        answers = iter(['{"answer_for": "A"}', '{"answer_for": "B"}'])
+        conn = _FakeConnection(responder=lambda dest, body, hdrs: next(answers), delay=0.3, echo_correlation_id=False)
+        goss = _make_goss(conn)
+
+        with pytest.raises(TimeoutError):
+            goss.get_response("goss.gridappsd.test", {"resultFormat": "JSON"}, timeout=0.05)
+        response = goss.get_response("goss.gridappsd.test", {"resultFormat": "JSON"}, timeout=1)
+
+        assert response == {"answer_for": "B"}
+
+    def test_reply_sent_from_callback_echoes_correlation_id(self):
+        conn = _FakeConnection()
+        goss = _make_goss(conn)
+        replied = threading.Event()
+
+        def on_request(headers, message):
+            goss.send(headers["reply-to"], {"pong": True})
+            replied.set()
+
+        goss.subscribe("goss.gridappsd.ping", on_request)
+        goss._router_callback.on_message(
+            {"destination": "/queue/goss.gridappsd.ping", "reply-to": "/temp-queue/r", "correlation-id": "abc"}, "{}"
+        )
+
+        assert replied.wait(1)
+        destination, _, headers = conn.sent[-1]
+        assert destination == "/temp-queue/r"
+        assert headers["correlation-id"] == "abc"
+
+
+class TestCallbackRouterDispatch:
+    def test_dispatch_is_not_rate_limited(self):
+        router = CallbackRouter()
+        count = 2000
+        done = threading.Event()
+        received = []
+
+        def on_message(headers, message):
+            received.append(message)
+            if len(received) == count:
+                done.set()
+
+        router.add_callback("/topic/goss.gridappsd.bench", on_message)
+        start = time.perf_counter()
+        for i in range(count):
+            router.on_message({"destination": "/topic/goss.gridappsd.bench"}, '{"i": %d}' % i)
+
+        # The previous 10 ms sleep per message made this take 20 seconds.
+        assert done.wait(5)
+        assert time.perf_counter() - start < 2
+
+    def test_worker_pool_keeps_per_topic_order(self):
+        router = CallbackRouter(workers=4)
+        topics = ["/topic/goss.gridappsd.t{}".format(i) for i in range(6)]
+        seen = {topic: [] for topic in topics}
+        done = threading.Event()
+        total = [0]
+        lock = threading.Lock()
+
+        def on_message(headers, message):
+            seen[headers["destination"]].append(message["i"])
+            with lock:
+                total[0] += 1
+                if total[0] == 600:
+                    done.set()
+
+        for topic in topics:
+            router.add_callback(topic, on_message)
+        for i in range(100):
+            for topic in topics:
+                router.on_message({"destination": topic}, '{"i": %d}' % i)
+
+        assert done.wait(5)
+        for topic in topics:
+            assert seen[topic] == list(range(100))
+
+    def test_failing_callback_does_not_stop_dispatch(self):
+        router = CallbackRouter()
+        delivered = threading.Event()
+
+        def broken(headers, message):
+            raise RuntimeError("boom")
+
+        router.add_callback("/topic/goss.gridappsd.a", broken)
+        router.add_callback("/topic/goss.gridappsd.a", lambda headers, message: delivered.set())
+        router.on_message({"destination": "/topic/goss.gridappsd.a"}, "{}")
+        router.on_message({"destination": "/topic/goss.gridappsd.a"}, "{}")
+
+        assert delivered.wait(1)
+
+    def test_requires_at_least_one_worker(self):
+        with pytest.raises(ValueError):
+            CallbackRouter(workers=0)
+
+
+class TestCallbackRouterWildcards:
+    def _collect(self, router, topic):
+        received = []
+        event = threading.Event()
+
+        def on_message(headers, message):
+            received.append(headers["destination"])
+            event.set()
+
+        router.add_callback(topic, on_message)
+        return received, event
+
+    def test_wildcard_subscription_receives_concrete_destinations(self):
+        router = CallbackRouter()
+        received, event = self._collect(router, "/topic/goss.gridappsd.field.*")
+
+        router.on_message({"destination": "/topic/goss.gridappsd.field.feeder1"}, "{}")
+
+        assert event.wait(1)
+        assert received == ["/topic/goss.gridappsd.field.feeder1"]
+
+    def test_queue_wildcard_uses_queue_prefix(self):
+        router = CallbackRouter()
+        received, event = self._collect(router, "goss.gridappsd.process.request.>")
+
+        router.on_message({"destination": "/queue/goss.gridappsd.process.request.data.log"}, "{}")
+
+        assert event.wait(1)
+        assert received == ["/queue/goss.gridappsd.process.request.data.log"]
+
+    def test_overlapping_subscriptions_deliver_once_per_callback(self):
+        router = CallbackRouter()
+        calls = []
+        done = threading.Event()
+
+        def exact(headers, message):
+            calls.append("exact")
+
+        def wildcard(headers, message):
+            calls.append("wildcard")
+            if len(calls) == 2:
+                done.set()
+
+        router.add_callback("/topic/a.b", exact, "1")
+        router.add_callback("/topic/a.*", wildcard, "2")
+        # The broker delivers one copy of the message per subscription.
+        router.on_message({"destination": "/topic/a.b", "subscription": "1"}, "{}")
+        router.on_message({"destination": "/topic/a.b", "subscription": "2"}, "{}")
+
+        assert done.wait(1)
+        assert sorted(calls) == ["exact", "wildcard"]
+
+    def test_frames_for_removed_subscriptions_are_dropped(self):
+        router = CallbackRouter()
+        calls = []
+
+        def first(headers, message):
+            calls.append("first")
+
+        def second(headers, message):
+            calls.append("second")
+
+        router.add_callback("/topic/a", first, "1")
+        router.add_callback("/topic/a", second, "2")
+        router.remove_callback("/topic/a", first)
+        # Still in flight when subscription 1 was removed.
+        router.on_message({"destination": "/topic/a", "subscription": "1"}, "{}")
+        router.on_message({"destination": "/topic/a", "subscription": "2"}, "{}")
+        # Frames without an id, e.g. from Replayer, go to every match.
+        router.on_message({"destination": "/topic/a"}, "{}")
+
+        assert router.join(1)
+        assert calls == ["second", "second"]
+
+    def test_removed_callback_no_longer_matches(self):
+        router = CallbackRouter()
+
+        def on_message(headers, message):
+            pass
+
+        router.add_callback("/topic/a.*", on_message)
+        router.remove_callback("/topic/a.*", on_message)
+
+        assert router.resolve("/topic/a.b") == []
+
+
+class TestCallbackRouterEnvelopes:
+    def test_body_is_decoded_once_for_all_callbacks(self):
+        router = CallbackRouter()
+        bodies = []
+        done = threading.Event()
+
+        def first(headers, message):
+            bodies.append(message)
+
+        def second(headers, message):
+            bodies.append(message)
+            done.set()
+
+        router.add_callback("/topic/a", first)
+        router.add_callback("/topic/a", second)
+        router.on_message({"destination": "/topic/a"}, '{"x": 1}')
+
+        assert done.wait(1)
+        assert bodies[0] == {"x": 1}
+        assert bodies[0] is bodies[1]
+
+    def test_raw_callback_receives_untouched_envelope(self):
+        router = CallbackRouter()
+        received = []
+        done = threading.Event()
+
+        def recorder(headers, envelope):
+            received.append(envelope)
+            done.set()
+
+        router.add_callback("/topic/a", recorder, raw=True)
+        raw = '{"x": 1}'
+        router.on_message({"destination": "/topic/a"}, raw)
+
+        assert done.wait(1)
+        assert isinstance(received[0], MessageEnvelope)
+        assert received[0].raw is raw
+        assert not received[0].decoded
+
+    def test_envelope_is_forwarded_as_its_raw_body(self):
+        envelope = MessageEnvelope({"destination": "/topic/a"}, '{"x":   1}')
+
+        assert _serialize_message(envelope) == '{"x":   1}'
+
+
+class TestCallbackRouterOverflow:
+    def _blocked_router(self, **kwargs):
+        """Return a router whose single worker is stuck in a callback until released."""
+        router = CallbackRouter(**kwargs)
+        release = threading.Event()
+        started = threading.Event()
+
+        def blocker(headers, message):
+            started.set()
+            release.wait(5)
+
+        router.add_callback("/topic/block", blocker)
+        router.on_message({"destination": "/topic/block"}, "{}")
+        assert started.wait(1)
+        return router, release
+
+    def test_per_topic_conflation(self):
+        router, release = self._blocked_router()
+        received = []
+        done = threading.Event()
+
+        def on_measurement(headers, message):
+            received.append(message["i"])
+            done.set()
+
+        router.add_callback("/topic/goss.gridappsd.simulation.output.1", on_measurement)
+        router.set_overflow_policy("/topic/goss.gridappsd.simulation.output.*", OverflowPolicy.LATEST)
+        for i in range(10):
+            router.on_message({"destination": "/topic/goss.gridappsd.simulation.output.1"}, '{"i": %d}' % i)
+        release.set()
+
+        assert done.wait(1)
+        assert received == [9]
+        assert router.stats()["dropped"] == {"/topic/goss.gridappsd.simulation.output.1": 9}
+
+    def test_max_depth_with_drop_newest(self):
+        router, release = self._blocked_router(max_queue_depth=3, overflow_policy=OverflowPolicy.DROP_NEWEST)
+        router.add_callback("/topic/a", lambda headers, message: None)
+        for i in range(10):
+            router.on_message({"destination": "/topic/a"}, "{}")
+
+        stats = router.stats()
+        assert stats["depth"] == 3
+        assert stats["dropped_total"] == 7
+        release.set()
+
+    def test_policy_lookup_falls_back_to_default(self):
+        router = CallbackRouter(overflow_policy="drop_oldest")
+        router.set_overflow_policy("/topic/a", "latest")
+
+        assert router.overflow_policy_for("/topic/a") is OverflowPolicy.LATEST
+        assert router.overflow_policy_for("/topic/b") is OverflowPolicy.DROP_OLDEST
+
+        router.set_overflow_policy("/topic/a", None)
+        assert router.overflow_policy_for("/topic/a") is OverflowPolicy.DROP_OLDEST
+
+    def test_replies_bypass_the_full_queue(self):
+        router, release = self._blocked_router(max_queue_depth=1, overflow_policy=OverflowPolicy.DROP_NEWEST)
+        router.add_callback("/topic/a", lambda headers, message: None)
+        replies = []
+        router.add_callback("/temp-queue/response.abc", lambda headers, message: replies.append(message))
+        for i in range(3):
+            router.on_message({"destination": "/topic/a"}, "{}")
+        router.on_message({"destination": "/temp-queue/response.abc"}, '{"answer": 42}')
+
+        assert replies == [{"answer": 42}]
+        assert router.stats()["dropped"] == {"/topic/a": 2}
+        release.set()
+
+
+def _make_shared_goss(conn, username, count, **kwargs):
+    clients = [
+        GOSS(
+            username=username,
+            password="p",
+            attempt_connection=False,
+            use_auth_token=False,
+            share_connection=True,
+            **kwargs,
+        )
+        for _ in range(count)
+    ]
+    clients[0]._shared._conn = conn
+    return clients
+
+
+class TestSharedConnection:
+    @pytest.fixture(autouse=True)
+    def _credentials_from_arguments(self, monkeypatch):
+        # conftest sets GRIDAPPSD_USER/PASSWORD, which would overrule the test users.
+        monkeypatch.delenv("GRIDAPPSD_USER", raising=False)
+        monkeypatch.delenv("GRIDAPPSD_PASSWORD", raising=False)
+
+    def test_views_share_one_connection_and_router(self):
+        conn = _FakeConnection()
+        first, second = _make_shared_goss(conn, "shared-router", 2)
+
+        assert first._shared is second._shared
+        assert first._router_callback is second._router_callback
+        first.connect()
+        second.connect()
+        assert first._conn is conn and second._conn is conn
+        first.disconnect()
+        second.disconnect()
+
+    def test_callback_can_wait_for_a_reply_on_another_view(self):
+        conn = _FakeConnection(responder=lambda dest, body, hdrs: '{"ok": true}', delay=0.01)
+        first, second = _make_shared_goss(conn, "shared-nested", 2)
+        answers = []
+        answered = threading.Event()
+
+        def on_request(headers, message):
+            answers.append(second.get_response("goss.gridappsd.test", {}, timeout=1))
+            answered.set()
+
+        first.subscribe("/topic/request", on_request)
+        for listener in list(conn.listeners.values()):
+            listener.on_message({"destination": "/topic/request"}, "{}")
+
+        assert answered.wait(2)
+        assert answers == [{"ok": True}]
+        first.disconnect()
+        second.disconnect()
+
+    def test_different_users_do_not_share(self):
+        (first,) = _make_shared_goss(_FakeConnection(), "shared-user-a", 1)
+        (second,) = _make_shared_goss(_FakeConnection(), "shared-user-b", 1)
+
+        assert first._shared is not second._shared
+        first.disconnect()
+        second.disconnect()
+
+    def test_views_get_their_own_messages(self):
+        conn = _FakeConnection()
+        first, second = _make_shared_goss(conn, "shared-subscriptions", 2)
+        received = {"first": [], "second": []}
+        done = threading.Event()
+
+        def on_first(headers, message):
+            received["first"].append(message)
+
+        def on_second(headers, message):
+            received["second"].append(message)
+            done.set()
+
+        first.subscribe("/topic/area.1", on_first)
+        second_id = second.subscribe("/topic/area.>", on_second)
+        for destination, subscription_id in conn.subscriptions:
+            first._router_callback.on_message(
+                {"destination": "/topic/area.1", "subscription": subscription_id}, '{"v": 1}'
+            )
+
+        assert done.wait(1)
+        time.sleep(0.05)
+        assert received == {"first": [{"v": 1}], "second": [{"v": 1}]}
+        assert len(conn.subscriptions) == 2
+
+        second.unsubscribe(second_id)
+        assert first._router_callback.resolve("/topic/area.1") == [on_first]
+        first.disconnect()
+        second.disconnect()
+
+    def test_requests_from_views_share_the_reply_queue(self):
+        conn = _FakeConnection(responder=lambda dest, body, hdrs: body, delay=0.01)
+        views = _make_shared_goss(conn, "shared-replies", 3, shared_reply_queue=True)
+
+        for i, view in enumerate(views):
+            assert view.get_response("goss.gridappsd.test", {"resultFormat": "JSON", "i": i}, timeout=1)["i"] == i
+
+        assert len({headers["reply-to"] for _, _, headers in conn.sent}) == 1
+        assert len(conn.subscriptions) == 1
+        for view in views:
+            view.disconnect()
+
+    def test_disconnect_releases_only_the_view(self):
+        conn = _FakeConnection()
+        first, second = _make_shared_goss(conn, "shared-release", 2)
+        pool_size = len(_connection_pool)
+        first.subscribe("/topic/a", lambda headers, message: None)
+        second.subscribe("/topic/b", lambda headers, message: None)
+
+        first.disconnect()
+        assert [destination for destination, _ in conn.subscriptions] == ["/topic/b"]
+        assert len(_connection_pool) == pool_size
+
+        second.disconnect()
+        assert conn.subscriptions == []
+        assert len(_connection_pool) == pool_size - 1
+
+
+class _FakeStompConnection(_FakeConnection):
+    """Stand in for stomp's Connection class that answers token requests."""
+
+    logins: list = []
+    token_requests = 0
+
+    def __init__(self, hosts, heartbeats=None, **kwargs):
+        super().__init__()
+        self._connected = False
+
+    def connect(self, username, passcode, wait=False):
+        _FakeStompConnection.logins.append(username)
+        self._connected = True
+
+    def is_connected(self):
+        return self._connected
+
+    def disconnect(self):
+        self._connected = False
+
+    def send(self, body, destination, headers=None, **kwargs):
+        super().send(body, destination, headers, **kwargs)
+        if destination == "/topic/pnnl.goss.token.topic":
+            _FakeStompConnection.token_requests += 1
+            for listener in list(self.listeners.values()):
+                listener.on_message({"destination": "/queue/" + headers["reply-to"]}, "the-token")
+
+
+class TestTokenCaching:
+    def test_token_is_fetched_once_per_address_and_user(self, monkeypatch):
+        from gridappsd import goss as goss_module
+        from gridappsd.token_cache import TokenCache
+
+        monkeypatch.setattr(goss_module, "Connection", _FakeStompConnection)
+        monkeypatch.setattr(goss_module, "token_cache", TokenCache())
+        monkeypatch.setattr(_FakeStompConnection, "logins", [])
+        monkeypatch.setattr(_FakeStompConnection, "token_requests", 0)
+        monkeypatch.delenv("GRIDAPPSD_USER", raising=False)
+        monkeypatch.delenv("GRIDAPPSD_PASSWORD", raising=False)
+
+        start = time.perf_counter()
+        clients = [GOSS(username="u", password="p", stomp_port=61699) for _ in range(3)]
+        elapsed = time.perf_counter() - start
+
+        assert all(client.connected for client in clients)
+        assert _FakeStompConnection.token_requests == 1
+        # One password login for the token, then every client uses the token.
+        assert _FakeStompConnection.logins == ["u", "the-token", "the-token", "the-token"]
+        # The old implementation slept a second waiting for the token.
+        assert elapsed < 0.5
+
+    def test_other_password_does_not_reuse_the_token(self, monkeypatch):
+        from gridappsd import goss as goss_module
+        from gridappsd.token_cache import TokenCache
+
+        monkeypatch.setattr(goss_module, "Connection", _FakeStompConnection)
+        monkeypatch.setattr(goss_module, "token_cache", TokenCache())
+        monkeypatch.setattr(_FakeStompConnection, "logins", [])
+        monkeypatch.setattr(_FakeStompConnection, "token_requests", 0)
+        monkeypatch.delenv("GRIDAPPSD_USER", raising=False)
+        monkeypatch.delenv("GRIDAPPSD_PASSWORD", raising=False)
+
+        GOSS(username="u", password="p", stomp_port=61698)
+        GOSS(username="u", password="wrong", stomp_port=61698)
+
+        assert _FakeStompConnection.token_requests == 2
+        assert _FakeStompConnection.logins == ["u", "the-token", "u", "the-token"]
+
+    def test_rejected_cached_token_is_fetched_again(self, monkeypatch):
+        from gridappsd import goss as goss_module
+        from gridappsd.loopback import LoopbackBroker
+        from gridappsd.token_cache import TokenCache, token_key
+
+        cache = TokenCache()
+        monkeypatch.setattr(goss_module, "token_cache", cache)
+        monkeypatch.delenv("GRIDAPPSD_USER", raising=False)
+        monkeypatch.delenv("GRIDAPPSD_PASSWORD", raising=False)
+        with LoopbackBroker(users={"system": "manager"}) as broker:
+            for name, value in broker.environment().items():
+                monkeypatch.setenv(name, value)
+            key = token_key(broker.host, broker.port, "system", "manager")
+            cache.put(key, "expired-token")
+
+            goss = GOSS(username="system", password="manager")
+            try:
+                assert goss.connected
+                assert cache.get(key) not in (None, "expired-token")
+            finally:
+                goss.disconnect()
+
+    def test_rejected_password_raises(self, monkeypatch):
+        from gridappsd.loopback import LoopbackBroker
+
+        monkeypatch.delenv("GRIDAPPSD_USER", raising=False)
+        monkeypatch.delenv("GRIDAPPSD_PASSWORD", raising=False)
+        with LoopbackBroker(users={"system": "manager"}) as broker:
+            for name, value in broker.environment().items():
+                monkeypatch.setenv(name, value)
+            with pytest.raises(ConnectFailedException):
+                GOSS(username="system", password="wrong", use_auth_token=False)
+
+
+class _DroppableConnection(_FakeStompConnection):
+    """A fake stomp connection that can be dropped, and refuses the first fail_connects connects."""
+
+    instances: list = []
+    fail_connects = 0
+
+    def __init__(self, hosts, heartbeats=None, **kwargs):
+        super().__init__(hosts, heartbeats)
+        _DroppableConnection.instances.append(self)
+
+    def connect(self, username, passcode, wait=False):
+        if _DroppableConnection.fail_connects > 0:
+            _DroppableConnection.fail_connects -= 1
+            return
+        super().connect(username, passcode, wait)
+
+    def send(self, body, destination, headers=None, **kwargs):
+        if not self._connected:
+            raise NotConnectedException()
+        super().send(body, destination, headers, **kwargs)
+
+    def drop(self):
+        self._connected = False
+        for listener in list(self.listeners.values()):
+            if hasattr(listener, "on_disconnected"):
+                listener.on_disconnected()
+
+
+class TestReconnect:
+    @pytest.fixture(autouse=True)
+    def _fake_stomp(self, monkeypatch):
+        from gridappsd import goss as goss_module
+
+        monkeypatch.setattr(goss_module, "Connection", _DroppableConnection)
+        monkeypatch.setattr(_DroppableConnection, "instances", [])
+        monkeypatch.setattr(_DroppableConnection, "fail_connects", 0)
+        monkeypatch.setattr(_FakeStompConnection, "logins", [])
+
+    def _make(self, **kwargs):
+        return GOSS(
+            username="u",
+            password="p",
+            use_auth_token=False,
+            reconnect_initial_delay=0.01,
+            reconnect_max_delay=0.02,
+            **kwargs,
+        )
+
+    def test_subscriptions_are_replayed_after_reconnect(self):
+        goss = self._make(auto_reconnect=True)
+        conn_id = goss.subscribe("/topic/a", lambda headers, message: None)
+        first = goss._conn
+
+        first.drop()
+
+        assert wait_for(lambda: goss._conn is not first and goss.connected)
+        # The reconnect thread re-subscribes after the connection is up.
+        new_conn = goss._conn
+        assert wait_for(lambda: len(new_conn.subscriptions) == 1)
+        assert new_conn.subscriptions == [("/topic/a", conn_id)]
+        assert goss._conn.get_listener("gridappsd") is goss._router_callback
+        assert wait_for(lambda: goss._reconnect_thread is None)
+
+    def test_lazy_reconnect_replays_subscriptions(self):
+        goss = self._make()
+        conn_id = goss.subscribe("/topic/a", lambda headers, message: None)
+        first = goss._conn
+        first.drop()
+
+        goss.send("/topic/b", {"x": 1})
+
+        assert goss._conn is not first
+        assert goss._conn.subscriptions == [("/topic/a", conn_id)]
+        assert goss._conn.sent[0][0] == "/topic/b"
+
+    def test_shared_views_are_replayed(self, monkeypatch):
+        monkeypatch.delenv("GRIDAPPSD_USER", raising=False)
+        monkeypatch.delenv("GRIDAPPSD_PASSWORD", raising=False)
+        views = [
+            GOSS(
+                username="replayed",
+                password="p",
+                use_auth_token=False,
+                share_connection=True,
+                auto_reconnect=True,
+                reconnect_initial_delay=0.01,
+                reconnect_max_delay=0.02,
+            )
+            for _ in range(2)
+        ]
+        ids = [
+            view.subscribe("/topic/area.{}".format(i), lambda headers, message: None) for i, view in enumerate(views)
+        ]
+        conn = views[0]._conn
+
+        conn.drop()
+
+        assert wait_for(lambda: views[0]._shared._conn is not conn and views[0]._shared.connected, timeout=5)
+        new_conn = views[0]._shared._conn
+        # The reconnect thread re-subscribes after the connection is up.
+        assert wait_for(lambda: len(new_conn.subscriptions) == 2)
+        assert sorted(new_conn.subscriptions) == [("/topic/area.0", ids[0]), ("/topic/area.1", ids[1])]
+        for view in views:
+            view.disconnect()
+
+    def test_reply_queue_is_not_replayed(self):
+        goss = self._make()
+        goss._get_reply_queue()
+        first = goss._conn
+        first.drop()
+
+        goss._make_connection()
+
+        assert goss._conn.subscriptions == []
+        assert goss._subscriptions == {}
+
+    def test_sends_are_buffered_during_outage(self):
+        goss = self._make(auto_reconnect=True, outage_buffer_size=2)
+        first = goss._conn
+        _DroppableConnection.fail_connects = 3
+        first.drop()
+
+        for i in range(3):
+            goss.send("/topic/out", {"i": i})
+        assert goss.get_outage_stats()["dropped"] == 1
+
+        assert wait_for(lambda: goss.get_outage_stats()["reconnecting"] is False)
+        assert [json.loads(body)["i"] for _, body, _ in goss._conn.sent] == [1, 2]
+        assert goss.get_outage_stats()["buffered"] == 0
+
+    def test_send_on_lost_connection_starts_reconnect(self):
+        goss = self._make(auto_reconnect=True, outage_buffer_size=10)
+        first = goss._conn
+
+        def send_on_dead_socket(*args, **kwargs):
+            # stomp only notices the drop when the write fails.
+            first._connected = False
+            raise NotConnectedException()
+
+        first.send = send_on_dead_socket
+
+        goss.send("/topic/out", {"i": 0})
+
+        assert wait_for(lambda: goss._conn is not first and goss.get_outage_stats()["reconnecting"] is False)
+        assert [json.loads(body)["i"] for _, body, _ in goss._conn.sent] == [0]
+
+    def test_disconnect_does_not_reconnect(self):
+        goss = self._make(auto_reconnect=True)
+        first = goss._conn
+
+        goss.disconnect()
+        first.drop()
+
+        time.sleep(0.05)
+        assert goss._reconnect_thread is None
+        assert len(_DroppableConnection.instances) == 1
+
+
+class TestGetResponses:
+    def test_results_in_request_order_with_pipelining(self):
+        def responder(dest, body, hdrs):
+            request = json.loads(body)
+            # Later requests answer first.
+            time.sleep(0.1 - request["i"] * 0.004)
+            return body
+
+        conn = _FakeConnection(responder=responder)
+        goss = _make_goss(conn)
+        requests = [("goss.gridappsd.test", {"resultFormat": "JSON", "i": i}) for i in range(20)]
+
+        start = time.perf_counter()
+        results = goss.get_responses(requests, timeout=2)
+        elapsed = time.perf_counter() - start
+
+        assert [r["i"] for r in results] == list(range(20))
+        # Serially this takes about 1.2 seconds.
+        assert elapsed < 0.6
+        assert goss._pending_responses == {}
+
+    def test_max_in_flight(self):
+        conn = _FakeConnection(responder=lambda dest, body, hdrs: body, delay=0.01)
+        goss = _make_goss(conn)
+        outstanding = []
+        send = conn.send
+
+        def counting_send(body, destination, headers=None, **kwargs):
+            outstanding.append(len(goss._pending_responses))
+            send(body, destination, headers, **kwargs)
+
+        conn.send = counting_send
+        requests = [("goss.gridappsd.test", {"resultFormat": "JSON", "i": i}) for i in range(30)]
+
+        results = goss.get_responses(requests, timeout=2, max_in_flight=4)
+
+        assert [r["i"] for r in results] == list(range(30))
+        assert max(outstanding) == 4
+
+    def test_iter_responses_yields_as_completed(self):
+        def responder(dest, body, hdrs):
+            time.sleep(0.05 * (3 - json.loads(body)["i"]))
+            return body
+
+        goss = _make_goss(_FakeConnection(responder=responder))
+        requests = [("goss.gridappsd.test", {"resultFormat": "JSON", "i": i}) for i in range(4)]
+
+        indexes = [index for index, response in goss.iter_responses(requests, timeout=2)]
+
+        assert indexes == [3, 2, 1, 0]
+
+    def test_timeouts_per_request(self):
+        def responder(dest, body, hdrs):
+            return None if json.loads(body)["i"] % 2 else body
+
+        goss = _make_goss(_FakeConnection(responder=responder))
+        requests = [("goss.gridappsd.test", {"resultFormat": "JSON", "i": i}) for i in range(4)]
+
+        start = time.perf_counter()
+        results = goss.get_responses(requests, timeout=0.2, return_exceptions=True)
+        elapsed = time.perf_counter() - start
+
+        assert results[0] == {"resultFormat": "JSON", "i": 0}
+        assert isinstance(results[1], TimeoutError)
+        assert results[2] == {"resultFormat": "JSON", "i": 2}
+        assert isinstance(results[3], TimeoutError)
+        assert elapsed < 0.5
+        with pytest.raises(TimeoutError):
+            goss.get_responses(requests, timeout=0.1)
+        assert goss._pending_responses == {}
+
+    def test_fan_out_does_not_need_correlation_ids(self):
+        from gridappsd import GridAPPSD
+
+        def responder(dest, body, hdrs):
+            request = json.loads(body)
+            time.sleep(0.01 * (len(request["objectId"]) % 3))
+            return json.dumps({"data": [request["objectId"]]})
+
+        conn = _FakeConnection(responder=responder, echo_correlation_id=False)
+        gapps = GridAPPSD(
+            username="u", password="p", attempt_connection=False, use_auth_token=False, shared_reply_queue=True
+        )
+        gapps._conn = conn
+        object_ids = ["o" * i for i in range(1, 10)]
+
+        assert gapps.query_objects(object_ids) == [{"data": [object_id]} for object_id in object_ids]
+        assert len({headers["reply-to"] for _, _, headers in conn.sent}) == len(object_ids)
+
+    def test_send_errors_are_reported_per_request(self):
+        goss = _make_goss(_FakeConnection(responder=lambda dest, body, hdrs: body))
+
+        results = goss.get_responses(
+            [("goss.gridappsd.test", {"i": 0}), ("goss.gridappsd.test", "not json")],
+            timeout=1,
+            return_exceptions=True,
+        )
+
+        assert results[0] == {"i": 0}
+        assert isinstance(results[1], ValueError)
+
+    def test_batch_queries(self):
+        from gridappsd import GridAPPSD
+
+        def responder(dest, body, hdrs):
+            request = json.loads(body)
+            return json.dumps({"data": [request["objectId"]]})
+
+        conn = _FakeConnection(responder=responder)
+        gapps = GridAPPSD(username="u", password="p", attempt_connection=False, use_auth_token=False)
+        gapps._conn = conn
+
+        assert gapps.query_objects(["a", "b", "c"]) == [{"data": ["a"]}, {"data": ["b"]}, {"data": ["c"]}]
+        assert gapps.query_object_dictionaries("model", ["x", "y"]) == [{"data": ["x"]}, {"data": ["y"]}]
+        sent = [json.loads(body) for _, body, _ in conn.sent]
+        assert sent[-1] == {
+            "requestType": "QUERY_OBJECT_DICT",
+            "resultFormat": "JSON",
+            "modelId": "model",
+            "objectId": "y",
+        }
+        with pytest.raises(ValueError):
+            gapps.query_objects(["a", ""])
+
+
+class TestPayloadEncoding:
+    content_type = "application/x-test-binary"
+
+    @pytest.fixture(autouse=True)
+    def test_encoding(self):
+        import zlib
+
+        from gridappsd import payload_encoding
+
+        payload_encoding.register_encoding(
+            self.content_type,
+            lambda obj: zlib.compress(json.dumps(obj).encode("utf-8")),
+            lambda data: json.loads(zlib.decompress(data).decode("utf-8")),
+        )
+        yield
+        payload_encoding.unregister_encoding(self.content_type)
+
+    def test_send_encodes_selected_topics(self):
+        conn = _FakeConnection()
+        goss = _make_goss(conn)
+        goss.set_payload_encoding("/topic/goss.gridappsd.field.>", self.content_type)
+
+        goss.send("/topic/goss.gridappsd.field.feeder1", {"v": 1})
+        goss.send("/topic/goss.gridappsd.field.feeder1", '{"v": 2}')
+        goss.send("/topic/goss.gridappsd.other", {"v": 3})
+
+        (_, body, headers), (_, text, text_headers), (_, other, other_headers) = conn.sent
+        assert isinstance(body, bytes) and headers["content-type"] == self.content_type
+        assert text == '{"v": 2}' and "content-type" not in text_headers
+        assert json.loads(other) == {"v": 3} and "content-type" not in other_headers
+
+    def test_router_decodes_binary_and_text_frames(self):
+        from gridappsd import payload_encoding
+
+        router = CallbackRouter()
+        received = []
+        done = threading.Event()
+
+        def callback(headers, message):
+            received.append(message)
+            if len(received) == 2:
+                done.set()
+
+        router.add_callback("/topic/a", callback)
+        data = payload_encoding.encode(self.content_type, {"v": complex(1, 2)})
+        router.on_message({"destination": "/topic/a", "content-type": self.content_type}, data)
+        router.on_message({"destination": "/topic/a"}, b'{"v": 2}')
+
+        assert done.wait(1)
+        assert received == [{"v": complex(1, 2)}, {"v": 2}]
+
+    def test_get_response_encodes_request_and_decodes_reply(self):
+        from gridappsd import payload_encoding
+
+        conn = _FakeConnection(responder=lambda dest, body, hdrs: body)
+        goss = _make_goss(conn)
+        goss.set_payload_encoding("goss.gridappsd.test", self.content_type)
+        listener = goss._router_callback
+
+        # The fake broker does not copy the content-type header onto replies.
+        def on_message(headers, message):
+            CallbackRouter.on_message(listener, dict(headers, **{"content-type": self.content_type}), message)
+
+        listener.on_message = on_message
+
+        assert goss.get_response("goss.gridappsd.test", {"q": 1}, timeout=1) == {"q": 1}
+        _, body, headers = conn.sent[0]
+        assert headers["content-type"] == self.content_type
+        assert payload_encoding.decode(self.content_type, body) == {"q": 1}
+
+    def test_reply_uses_encoding_of_request(self):
+        from gridappsd import payload_encoding
+
+        conn = _FakeConnection()
+        goss = _make_goss(conn)
+        replied = threading.Event()
+
+        def responder(headers, message):
+            goss.send(headers["reply-to"], {"answer": message["q"]})
+            replied.set()
+
+        goss.subscribe("goss.gridappsd.service", responder)
+        conn.listeners["gridappsd"].on_message(
+            {
+                "destination": "/queue/goss.gridappsd.service",
+                "reply-to": "/temp-queue/response.x",
+                "correlation-id": "c1",
+                "content-type": self.content_type,
+            },
+            payload_encoding.encode(self.content_type, {"q": 42}),
+        )
+
+        assert replied.wait(1)
+        _, body, headers = conn.sent[-1]
+        assert headers["content-type"] == self.content_type
+        assert headers["correlation-id"] == "c1"
+        assert payload_encoding.decode(self.content_type, body) == {"answer": 42}
+
+
+class TestCompression:
+    def test_send_compresses_large_bodies_on_selected_topics(self):
+        import zlib
+
+        conn = _FakeConnection()
+        goss = _make_goss(conn)
+        goss.compression_threshold = 100
+        goss.set_compression("/topic/goss.gridappsd.field.>", "zlib")
+        large = {"mrids": ["_{:08d}".format(i) for i in range(100)]}
+
+        goss.send("/topic/goss.gridappsd.field.feeder1", large)
+        goss.send("/topic/goss.gridappsd.field.feeder1", {"small": 1})
+        goss.send("/topic/goss.gridappsd.other", large)
+
+        (_, body, headers), (_, small, small_headers), (_, other, other_headers) = conn.sent
+        assert headers["content-encoding"] == "zlib"
+        assert json.loads(zlib.decompress(body).decode("utf-8")) == large
+        assert small == '{"small": 1}' and "content-encoding" not in small_headers
+        assert json.loads(other) == large and "content-encoding" not in other_headers
+
+    def test_router_decompresses(self):
+        import zlib
+
+        router = CallbackRouter()
+        received = []
+        done = threading.Event()
+
+        def callback(headers, message):
+            received.append(message)
+            done.set()
+
+        router.add_callback("/topic/a", callback)
+        router.on_message({"destination": "/topic/a", "content-encoding": "zlib"}, zlib.compress(b'{"x": 1}'))
+
+        assert done.wait(1)
+        assert received == [{"x": 1}]
+
+    def test_large_replies_are_compressed_when_accepted(self):
+        conn = _FakeConnection(responder=lambda dest, body, hdrs: None)
+        goss = _make_goss(conn)
+        goss.compression_threshold = 100
+        replied = threading.Event()
+
+        def responder(headers, message):
+            goss.send(headers["reply-to"], {"context": "x" * 1000})
+            replied.set()
+
+        goss.subscribe("goss.gridappsd.service", responder)
+        goss._send_request("goss.gridappsd.other", {"q": 1})
+        request_headers = conn.sent[0][2]
+        assert "zlib" in request_headers["accept-encoding"].split(",")
+
+        conn.listeners["gridappsd"].on_message(
+            {
+                "destination": "/queue/goss.gridappsd.service",
+                "reply-to": "/temp-queue/response.x",
+                "accept-encoding": request_headers["accept-encoding"],
+            },
+            b'{"q": 1}',
+        )
+
+        assert replied.wait(1)
+        reply_headers = conn.sent[-1][2]
+        assert reply_headers["content-encoding"] in request_headers["accept-encoding"].split(",")
+
+
+class TestMetrics:
+    def test_send_and_receive_are_counted(self):
+        conn = _FakeConnection()
+        goss = _make_goss(conn)
+        done = threading.Event()
+        goss.subscribe("/topic/a", lambda headers, message: done.set())
+
+        goss.send("/topic/a", {"x": 1})
+        conn.listeners["gridappsd"].on_message({"destination": "/topic/a"}, b'{"x": 1}')
+
+        assert done.wait(1)
+        assert wait_for(lambda: "callback_seconds" in goss.get_metrics())
+        metrics = goss.get_metrics()
+        assert metrics["messages_sent_total"] == {"/topic/a": 1}
+        assert metrics["bytes_sent_total"] == {"/topic/a": len('{"x": 1}')}
+        assert metrics["messages_received_total"] == {"/topic/a": 1}
+        for name in ("queue_wait_seconds", "decode_seconds", "callback_seconds"):
+            assert metrics[name]["/topic/a"]["count"] == 1
+        assert metrics["dispatch"]["depth"] == 0
+        assert 'gridappsd_messages_sent_total{destination="/topic/a"} 1' in goss.metrics_text()
+
+    def test_request_latency_and_timeouts(self):
+        conn = _FakeConnection(responder=lambda dest, body, hdrs: None if "slow" in dest else "{}")
+        goss = _make_goss(conn)
+
+        goss.get_response("goss.gridappsd.fast", {}, timeout=1)
+        with pytest.raises(TimeoutError):
+            goss.get_response("goss.gridappsd.slow", {}, timeout=0.05)
+
+        metrics = goss.get_metrics()
+        assert metrics["request_seconds"]["goss.gridappsd.fast"]["count"] == 1
+        assert metrics["request_timeouts_total"] == {"goss.gridappsd.slow": 1}
+        # Replies on the reply queue are counted under one label.
+        assert list(metrics["messages_received_total"]) == ["/temp-queue/response.*"]
+
+    def test_collection_can_be_turned_off(self):
+        goss = GOSS(username="u", password="p", attempt_connection=False, use_auth_token=False, collect_metrics=False)
+        goss._conn = _FakeConnection()
+
+        goss.send("/topic/a", "x")
+
+        assert goss.metrics is None
+        assert list(goss.get_metrics()) == ["dispatch"]
+        assert "gridappsd_dispatch_queue_depth 0" in goss.metrics_text()
+
+
+class _Broker:
+    """Delivers frames sent on any of its connections to the routers subscribed to their destination."""
+
+    def __init__(self):
+        self.connections = []
+
+    def connect(self):
+        conn = _LoopbackConnection(self)
+        self.connections.append(conn)
+        return conn
+
+
+class _LoopbackConnection(_FakeConnection):
+    def __init__(self, broker):
+        super().__init__()
+        self._broker = broker
+
+    def send(self, body, destination, headers=None, **kwargs):
+        super().send(body, destination, headers, **kwargs)
+        frame_headers = dict(headers or {}, destination=CallbackRouter._normalize_topic(destination))
+        for conn in self._broker.connections:
+            router = conn.listeners.get("gridappsd")
+            if router is not None and router.resolve(frame_headers["destination"]):
+                threading.Timer(0, router.on_message, args=(frame_headers, body)).start()
+
+
+class TestTracing:
+    @pytest.fixture(autouse=True)
+    def exporter(self):
+        from gridappsd import tracing
+
+        yield tracing.enable()
+        tracing.disable()
+
+    def test_untraced_sends_carry_no_header(self):
+        conn = _FakeConnection()
+        goss = _make_goss(conn)
+
+        goss.send("/topic/a", {"x": 1})
+
+        assert "traceparent" not in conn.sent[0][2]
+
+    def test_request_through_a_context_manager_is_one_trace(self, exporter):
+        broker = _Broker()
+        agent, cm_bus, cm_ot, ot = [_make_goss(broker.connect()) for _ in range(4)]
+        ot.subscribe("goss.gridappsd.ot", lambda headers, message: ot.send(headers["reply-to"], {"ot": True}))
+
+        def context_manager(headers, message):
+            cm_bus.send(headers["reply-to"], cm_ot.get_response("goss.gridappsd.ot", message, timeout=2))
+
+        cm_bus.subscribe("goss.gridappsd.cm", context_manager)
+
+        assert agent.get_response("goss.gridappsd.cm", {"q": 1}, timeout=2) == {"ot": True}
+        assert wait_for(lambda: len(exporter.spans()) == 8)
+
+        spans = exporter.spans()
+        (root,) = [span for span in spans if span.parent_id is None]
+        assert {span.trace_id for span in spans} == {root.trace_id}
+        by_id = {span.span_id: span for span in spans}
+
+        def path(span):
+            names = []
+            while span is not None:
+                names.append((span.name, span.destination))
+                span = by_id.get(span.parent_id)
+            return names[::-1]
+
+        ot_request = next(span for span in spans if span.name == "request" and span.parent_id is not None)
+        assert path(ot_request) == [
+            ("request", "goss.gridappsd.cm"),
+            ("dispatch", "/queue/goss.gridappsd.cm"),
+            ("request", "goss.gridappsd.ot"),
+        ]
+        cm_dispatch = by_id[ot_request.parent_id]
+        assert cm_dispatch.duration >= ot_request.duration
+        assert root.duration >= cm_dispatch.duration
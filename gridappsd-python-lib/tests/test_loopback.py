@@ -0,0 +1,117 @@
+import asyncio
+import socket
+
+import pytest
+
+from gridappsd import GOSS, GridAPPSD
+from gridappsd.aio import AsyncGridAPPSD
+from gridappsd.loopback import LoopbackBroker
+from gridappsd.stomp_frame import Frame, FrameParser, encode_frame
+
+from helpers import wait_for
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    with LoopbackBroker(users={"system": "manager"}) as broker:
+        for name, value in broker.environment().items():
+            monkeypatch.setenv(name, value)
+        monkeypatch.setenv("GRIDAPPSD_USER", "system")
+        monkeypatch.setenv("GRIDAPPSD_PASSWORD", "manager")
+        yield broker
+
+
+@pytest.fixture
+def clients():
+    created = []
+
+    def make(**kwargs):
+        client = GOSS(**kwargs)
+        created.append(client)
+        return client
+
+    yield make
+    for client in created:
+        client.disconnect()
+
+
+def _raw_session(broker, *frames):
+    """Send frames over a plain socket and return the frames the broker answers with."""
+    with socket.create_connection(broker.address, timeout=2) as sock:
+        sock.sendall(b"".join(encode_frame(frame) for frame in frames))
+        parser = FrameParser()
+        received = []
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                return received
+            received.extend(parser.feed(data))
+
+
+class TestLoopbackBroker:
+    def test_token_handshake_and_request(self, broker, clients):
+        broker.add_responder("goss.gridappsd.echo", lambda headers, message: {"echo": message})
+        goss = clients()
+
+        assert goss.connected
+        assert goss.get_response("goss.gridappsd.echo", {"a": 1}, timeout=2) == {"echo": {"a": 1}}
+
+    def test_wrong_password_is_refused(self, broker):
+        received = _raw_session(broker, Frame("CONNECT", {"login": "system", "passcode": "wrong"}))
+
+        assert [frame.command for frame in received] == ["ERROR"]
+
+    def test_topics_reach_every_subscriber(self, broker, clients):
+        received = []
+        for name in ("a", "b"):
+            clients().subscribe(
+                "/topic/goss.gridappsd.field.*", lambda headers, message, name=name: received.append(name)
+            )
+
+        clients().send("/topic/goss.gridappsd.field.feeder1", {"x": 1})
+
+        assert wait_for(lambda: sorted(received) == ["a", "b"])
+
+    def test_queues_take_turns(self, broker, clients):
+        received = []
+        for name in ("a", "b"):
+            clients().subscribe("goss.gridappsd.work", lambda headers, message, name=name: received.append(name))
+
+        sender = clients()
+        for i in range(4):
+            sender.send("goss.gridappsd.work", {"i": i})
+
+        assert wait_for(lambda: len(received) == 4)
+        assert sorted(received) == ["a", "a", "b", "b"]
+
+    def test_queues_hold_messages_until_subscribed(self, broker, clients):
+        clients().send("goss.gridappsd.held", {"i": 1})
+        received = []
+
+        clients().subscribe("goss.gridappsd.>", lambda headers, message: received.append(message))
+
+        assert wait_for(lambda: received == [{"i": 1}])
+
+    def test_gridappsd_runs_against_the_broker(self, broker):
+        broker.add_responder("goss.gridappsd.process.request.status.platform", lambda headers, message: {"ok": True})
+        gapps = GridAPPSD()
+        try:
+            assert gapps.get_response("goss.gridappsd.process.request.status.platform", {}, timeout=2) == {"ok": True}
+        finally:
+            gapps.disconnect()
+
+    def test_serves_asyncio_clients(self, monkeypatch):
+        monkeypatch.delenv("GRIDAPPSD_ADDRESS", raising=False)
+        monkeypatch.delenv("GRIDAPPSD_PORT", raising=False)
+
+        async def main():
+            broker = LoopbackBroker()
+            await broker.open()
+            broker.add_responder("goss.gridappsd.echo", lambda headers, message: message)
+            try:
+                async with AsyncGridAPPSD(username="system", password="manager", address=broker.address) as gapps:
+                    return await gapps.get_response("goss.gridappsd.echo", {"a": 1}, timeout=2)
+            finally:
+                await broker.close()
+
+        assert asyncio.run(main()) == {"a": 1}
@@ -0,0 +1,45 @@
+"""Unit tests for gridappsd.message.MessageEnvelope."""
+
+from unittest import mock
+
+from gridappsd import json_extension as json
+from gridappsd.message import MessageEnvelope
+
+
+def test_body_is_decoded_lazily_and_only_once():
+    envelope = MessageEnvelope({"destination": "/topic/a"}, '{"value": {"real": 1.0, "imag": 2.0}}')
+
+    with mock.patch("gridappsd.message.codec.loads", wraps=json.loads) as loads:
+        assert not envelope.decoded
+        assert envelope.body == {"value": complex(1.0, 2.0)}
+        assert envelope.body is envelope.body
+
+    loads.assert_called_once()
+    assert envelope.decoded
+
+
+def test_raw_is_left_untouched():
+    raw = '{"a": 1}'
+    envelope = MessageEnvelope({"destination": "/topic/a"}, raw)
+
+    envelope.body
+
+    assert envelope.raw is raw
+
+
+def test_non_json_body_passes_through():
+    envelope = MessageEnvelope({"destination": "/topic/a"}, "plain text")
+
+    assert envelope.body == "plain text"
+
+
+def test_already_decoded_body_passes_through():
+    body = {"a": 1}
+    envelope = MessageEnvelope({"destination": "/topic/a"}, body)
+
+    assert envelope.body is body
+
+
+def test_destination_comes_from_headers():
+    assert MessageEnvelope({"destination": "/topic/a"}, "").destination == "/topic/a"
+    assert MessageEnvelope({}, "").destination is None
@@ -0,0 +1,89 @@
+"""Unit tests for gridappsd.metrics."""
+
+import threading
+import urllib.request
+
+from gridappsd.metrics import Histogram, MessageMetrics, start_http_server
+
+
+class TestHistogram:
+    def test_cumulative_buckets(self):
+        histogram = Histogram((0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value)
+
+        assert histogram.cumulative() == [(0.1, 2), (1, 3), (float("inf"), 4)]
+        assert histogram.count == 4
+        assert histogram.sum == 3.65
+
+
+class TestMessageMetrics:
+    def test_counts_and_sizes(self):
+        metrics = MessageMetrics()
+        metrics.count_sent("/topic/a", "12345")
+        metrics.count_sent("/topic/a", b"123")
+        metrics.count_received("/topic/b", "1")
+        metrics.inc("request_timeouts_total", "/queue/c")
+
+        snapshot = metrics.snapshot()
+
+        assert snapshot["messages_sent_total"] == {"/topic/a": 2}
+        assert snapshot["bytes_sent_total"] == {"/topic/a": 8}
+        assert snapshot["messages_received_total"] == {"/topic/b": 1}
+        assert snapshot["request_timeouts_total"] == {"/queue/c": 1}
+
+    def test_threads_are_merged(self):
+        metrics = MessageMetrics()
+
+        def record():
+            for _ in range(100):
+                metrics.observe_dispatch("/topic/a", 0.001, 0.002, 0.003)
+                metrics.count_received("/topic/a", "x")
+
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        snapshot = metrics.snapshot()
+        assert snapshot["messages_received_total"]["/topic/a"] == 400
+        for name in ("queue_wait_seconds", "decode_seconds", "callback_seconds"):
+            assert snapshot[name]["/topic/a"]["count"] == 400
+
+    def test_reset(self):
+        metrics = MessageMetrics()
+        metrics.count_sent("/topic/a", "x")
+        metrics.observe("request_seconds", "/queue/b", 0.1)
+
+        metrics.reset()
+
+        assert metrics.snapshot() == {}
+
+    def test_prometheus_text(self):
+        metrics = MessageMetrics(buckets=(0.5,))
+        metrics.count_received('/topic/"a"', "abc")
+        metrics.observe("request_seconds", "/queue/b", 0.25)
+
+        text = metrics.prometheus_text({"dispatch_queue_depth": 3})
+
+        assert "gridappsd_dispatch_queue_depth 3\n" in text
+        assert "# TYPE gridappsd_messages_received_total counter" in text
+        assert 'gridappsd_bytes_received_total{destination="/topic/\\"a\\""} 3' in text
+        assert "# TYPE gridappsd_request_seconds histogram" in text
+        assert 'gridappsd_request_seconds_bucket{destination="/queue/b",le="0.5"} 1' in text
+        assert 'gridappsd_request_seconds_bucket{destination="/queue/b",le="+Inf"} 1' in text
+        assert 'gridappsd_request_seconds_count{destination="/queue/b"} 1' in text
+
+
+class TestHttpServer:
+    def test_serves_metrics(self):
+        server = start_http_server(lambda: "gridappsd_up 1\n", port=0)
+        try:
+            url = "http://127.0.0.1:{}/metrics".format(server.server_port)
+            with urllib.request.urlopen(url, timeout=5) as response:
+                assert response.read() == b"gridappsd_up 1\n"
+                assert response.headers["Content-Type"].startswith("text/plain")
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,135 @@
+import multiprocessing
+
+import pytest
+
+from gridappsd import GridAPPSD
+from gridappsd import topics as t
+from gridappsd.loopback import LoopbackBroker
+from gridappsd.model_snapshot import ModelSnapshot
+from gridappsd.query_cache import QueryCache
+
+CIM = "http://iec.ch/TC57/CIM100#"
+FEEDER = "_feeder"
+
+
+class _Platform:
+    """A responder serving object types and object dictionaries of one feeder."""
+
+    def __init__(self):
+        self.objects = {
+            CIM + "LoadBreakSwitch": [
+                {"id": "_sw1", "name": "sw1", "fdrid": FEEDER, "open": "false"},
+                {"id": "_sw2", "name": "sw2", "fdrid": FEEDER, "open": "true"},
+            ],
+            CIM + "ACLineSegment": [{"id": "_line1", "name": "line1", "fdrid": FEEDER, "length": 10.0}],
+        }
+        self.requests = []
+
+    def __call__(self, headers, message):
+        self.requests.append(message["requestType"])
+        if message["requestType"] == "QUERY_OBJECT_TYPES":
+            return {"data": list(self.objects)}
+        return {"data": self.objects.get(message["objectType"], [])}
+
+
+@pytest.fixture
+def platform(monkeypatch):
+    with LoopbackBroker() as broker:
+        for name, value in broker.environment().items():
+            monkeypatch.setenv(name, value)
+        monkeypatch.setenv("GRIDAPPSD_USER", "system")
+        monkeypatch.setenv("GRIDAPPSD_PASSWORD", "manager")
+        platform = _Platform()
+        broker.add_responder(t.REQUEST_POWERGRID_DATA, platform)
+        yield platform
+
+
+@pytest.fixture
+def gapps(platform):
+    gapps = GridAPPSD()
+    yield gapps
+    gapps.disconnect()
+
+
+def _count_switches(path, queue):
+    with ModelSnapshot(path) as snapshot:
+        queue.put(len(snapshot.find(object_type="LoadBreakSwitch")))
+
+
+class TestModelSnapshot:
+    def test_build_and_look_up(self, platform, gapps, tmp_path):
+        path = tmp_path / "feeder.sqlite"
+        ModelSnapshot.build(gapps, FEEDER, path).close()
+        requests = len(platform.requests)
+
+        with ModelSnapshot(path) as snapshot:
+            assert snapshot.model_id == FEEDER
+            assert len(snapshot) == 3
+            assert "_sw1" in snapshot
+            assert snapshot.get("_line1") == {"id": "_line1", "name": "line1", "fdrid": FEEDER, "length": 10.0}
+            assert snapshot.get("_unknown") is None
+            assert [obj["id"] for obj in snapshot.find(object_type=CIM + "LoadBreakSwitch")] == ["_sw1", "_sw2"]
+            assert [obj["id"] for obj in snapshot.find(name="sw2")] == ["_sw2"]
+            assert len(snapshot.find(container=FEEDER)) == 3
+            assert snapshot.object_types() == {"ACLineSegment": 1, "LoadBreakSwitch": 2}
+
+        assert len(platform.requests) == requests
+
+    def test_refresh_stores_only_changes(self, platform, gapps, tmp_path):
+        snapshot = ModelSnapshot.build(gapps, FEEDER, tmp_path / "feeder.sqlite")
+        switches = platform.objects[CIM + "LoadBreakSwitch"]
+        switches[1] = dict(switches[1], open="false")
+        del switches[0]
+        switches.append({"id": "_sw3", "name": "sw3", "fdrid": FEEDER})
+
+        counts = snapshot.refresh(gapps, object_types=[CIM + "LoadBreakSwitch"])
+
+        assert counts == dict(added=1, updated=1, removed=1, unchanged=0)
+        assert snapshot.get("_sw2")["open"] == "false"
+        assert "_sw1" not in snapshot
+        assert "_line1" in snapshot
+        snapshot.close()
+
+    def test_refresh_bypasses_the_query_cache(self, platform, gapps, tmp_path):
+        gapps.query_cache = QueryCache()
+        snapshot = ModelSnapshot.build(gapps, FEEDER, tmp_path / "feeder.sqlite")
+        platform.objects[CIM + "Breaker"] = [{"id": "_br1", "name": "br1", "fdrid": FEEDER}]
+
+        counts = snapshot.refresh(gapps)
+
+        assert counts["added"] == 1
+        assert "_br1" in snapshot
+        assert platform.requests.count("QUERY_OBJECT_TYPES") == 2
+        snapshot.close()
+
+    def test_read_only_snapshots(self, gapps, tmp_path):
+        path = tmp_path / "feeder.sqlite"
+        ModelSnapshot.build(gapps, FEEDER, path).close()
+
+        with ModelSnapshot(path) as snapshot:
+            with pytest.raises(ValueError):
+                snapshot.refresh(gapps)
+        with pytest.raises(FileNotFoundError):
+            ModelSnapshot(tmp_path / "missing.sqlite")
+
+    def test_shared_between_processes(self, gapps, tmp_path):
+        path = tmp_path / "feeder.sqlite"
+        ModelSnapshot.build(gapps, FEEDER, path).close()
+        context = multiprocessing.get_context("spawn")
+        queue = context.Queue()
+
+        readers = [context.Process(target=_count_switches, args=(path, queue)) for _ in range(2)]
+        for reader in readers:
+            reader.start()
+        counts = [queue.get(timeout=30) for _ in readers]
+        for reader in readers:
+            reader.join(10)
+
+        assert counts == [2, 2]
+
+    def test_build_refuses_another_model(self, gapps, tmp_path):
+        path = tmp_path / "feeder.sqlite"
+        ModelSnapshot.build(gapps, FEEDER, path).close()
+
+        with pytest.raises(ValueError):
+            ModelSnapshot.build(gapps, "_other", path)
@@ -0,0 +1,100 @@
+"""Unit tests for gridappsd.payload_encoding."""
+
+import zlib
+
+import pytest
+
+from gridappsd import json_extension as json
+from gridappsd import payload_encoding
+from gridappsd.message import MessageEnvelope
+from gridappsd.payload_encoding import EncodingPolicy, text_body
+
+# Compressed JSON stands in for the optional binary packages, which may not be installed.
+TEST_ENCODING = "application/x-test-binary"
+
+
+@pytest.fixture(autouse=True)
+def test_encoding():
+    payload_encoding.register_encoding(
+        TEST_ENCODING,
+        lambda obj: zlib.compress(json.dumps(obj).encode("utf-8")),
+        lambda data: json.loads(zlib.decompress(data).decode("utf-8")),
+    )
+    yield
+    payload_encoding.unregister_encoding(TEST_ENCODING)
+
+
+class TestRegistry:
+    def test_round_trip(self):
+        data = payload_encoding.encode(TEST_ENCODING, {"v": complex(1, 2)})
+
+        assert isinstance(data, bytes)
+        assert payload_encoding.decode(TEST_ENCODING, data) == {"v": complex(1, 2)}
+
+    def test_unknown_content_type(self):
+        assert not payload_encoding.is_binary("application/json")
+        assert not payload_encoding.is_binary(None)
+        with pytest.raises(ValueError):
+            payload_encoding.get_encoding("application/json")
+
+    def test_builtins_are_binary_even_when_not_installed(self):
+        assert payload_encoding.is_binary(payload_encoding.MSGPACK)
+        assert payload_encoding.is_binary(payload_encoding.CBOR)
+        assert TEST_ENCODING in payload_encoding.available_encodings()
+
+    @pytest.mark.parametrize(
+        "content_type, package", [("application/msgpack", "msgpack"), ("application/cbor", "cbor2")]
+    )
+    def test_builtin_round_trip(self, content_type, package):
+        pytest.importorskip(package)
+        message = {"measurements": {"_abc": {"value": complex(1.5, -2.0), "flags": [1, 2]}}, "timestamp": 1}
+
+        assert payload_encoding.decode(content_type, payload_encoding.encode(content_type, message)) == message
+
+
+class TestTextBody:
+    def test_bytes_become_text(self):
+        assert text_body({}, b'{"a": 1}') == '{"a": 1}'
+
+    def test_binary_bodies_stay_bytes(self):
+        data = payload_encoding.encode(TEST_ENCODING, {"a": 1})
+
+        assert text_body({"content-type": TEST_ENCODING}, data) is data
+
+    def test_invalid_utf8_stays_bytes(self):
+        assert text_body({}, b"\xff\xfe") == b"\xff\xfe"
+
+
+class TestEncodingPolicy:
+    def test_topics_are_normalized_and_may_be_wildcards(self):
+        policy = EncodingPolicy()
+        policy.set("/topic/goss.gridappsd.field.>", TEST_ENCODING)
+        policy.set("goss.gridappsd.process.request.data", TEST_ENCODING)
+
+        assert policy.content_type_for("/topic/goss.gridappsd.field.feeder1") == TEST_ENCODING
+        assert policy.content_type_for("goss.gridappsd.process.request.data") == TEST_ENCODING
+        assert policy.content_type_for("/topic/goss.gridappsd.other") is None
+
+    def test_none_restores_json(self):
+        policy = EncodingPolicy()
+        policy.set("/topic/a", TEST_ENCODING)
+        policy.set("/topic/a", None)
+
+        assert policy.content_type_for("/topic/a") is None
+
+    def test_unknown_content_type_is_rejected(self):
+        with pytest.raises(ValueError):
+            EncodingPolicy().set("/topic/a", "application/unknown")
+
+
+class TestEnvelope:
+    def test_binary_body_is_decoded_by_content_type(self):
+        data = payload_encoding.encode(TEST_ENCODING, {"value": complex(1, 2)})
+        envelope = MessageEnvelope({"destination": "/topic/a", "content-type": TEST_ENCODING}, data)
+
+        assert envelope.body == {"value": complex(1, 2)}
+
+    def test_undecodable_body_passes_through(self):
+        envelope = MessageEnvelope({"destination": "/topic/a", "content-type": TEST_ENCODING}, b"garbage")
+
+        assert envelope.body == b"garbage"
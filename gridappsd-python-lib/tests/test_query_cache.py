@@ -0,0 +1,151 @@
+import asyncio
+import time
+
+import pytest
+
+from gridappsd import GridAPPSD
+from gridappsd import topics as t
+from gridappsd.aio import AsyncGridAPPSD
+from gridappsd.loopback import LoopbackBroker
+from gridappsd.query_cache import QueryCache
+
+TOPIC = t.REQUEST_POWERGRID_DATA
+
+
+def _payload(request_type="QUERY_MODEL_INFO", **kwargs):
+    return dict(requestType=request_type, resultFormat="JSON", **kwargs)
+
+
+class TestQueryCache:
+    def test_key_ignores_payload_order_and_encoding(self):
+        payload = _payload("QUERY_OBJECT_TYPES", modelId="m1")
+        reordered = dict(reversed(list(payload.items())))
+
+        assert QueryCache.key(TOPIC, payload) == QueryCache.key(TOPIC, reordered)
+        assert QueryCache.key(TOPIC, payload) == QueryCache.key(
+            TOPIC, '{"modelId": "m1", "requestType": "QUERY_OBJECT_TYPES", "resultFormat": "JSON"}'
+        )
+        assert QueryCache.key(TOPIC, payload) != QueryCache.key(TOPIC, _payload("QUERY_OBJECT_TYPES", modelId="m2"))
+
+    def test_least_recently_used_is_evicted_by_size(self):
+        cache = QueryCache(max_bytes=100)
+        for name in ("a", "b", "c"):
+            cache.put(TOPIC, _payload(modelId=name), {"data": name * 30})
+        cache.get(TOPIC, _payload(modelId="b"))
+        cache.put(TOPIC, _payload(modelId="d"), {"data": "d" * 30})
+
+        assert cache.get(TOPIC, _payload(modelId="b")) == {"data": "b" * 30}
+        assert cache.get(TOPIC, _payload(modelId="a")) is None
+        stats = cache.stats()
+        assert stats["bytes"] <= 100
+        assert stats["evictions"] == 2
+
+    def test_entries_expire(self, monkeypatch):
+        cache = QueryCache(ttl=10, ttls={"QUERY": 1})
+        cache.put(TOPIC, _payload(), {"data": 1})
+        cache.put(TOPIC, _payload("QUERY", queryString="select"), {"data": 2})
+
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now + 5)
+
+        assert cache.get(TOPIC, _payload()) == {"data": 1}
+        assert cache.get(TOPIC, _payload("QUERY", queryString="select")) is None
+
+    def test_errors_are_not_cached(self):
+        cache = QueryCache()
+        cache.put(TOPIC, _payload(), {"error": {"message": "Blazegraph unavailable"}})
+        cache.put(TOPIC, _payload(modelId="m1"), None)
+
+        assert cache.stats()["entries"] == 0
+
+    def test_invalidate_by_model(self, tmp_path):
+        cache = QueryCache(directory=tmp_path)
+        cache.put(TOPIC, _payload("QUERY_OBJECT_DICT", modelId="m1", objectType="Breaker"), {"data": 1})
+        cache.put(TOPIC, _payload("QUERY_OBJECT_DICT", modelId="m2", objectType="Breaker"), {"data": 2})
+        cache.put(TOPIC, _payload(), {"data": 3})
+
+        assert cache.invalidate(model_id="m1") == 1
+        assert cache.get(TOPIC, _payload("QUERY_OBJECT_DICT", modelId="m1", objectType="Breaker")) is None
+        assert len(list(tmp_path.glob("*.json"))) == 2
+
+        cache.clear()
+        assert cache.stats()["entries"] == 0
+        assert list(tmp_path.glob("*.json")) == []
+
+    def test_disk_tier_survives_restarts(self, tmp_path):
+        QueryCache(directory=tmp_path).put(TOPIC, _payload(), {"data": {"models": [{"modelId": "m1"}]}})
+
+        cache = QueryCache(directory=tmp_path)
+
+        assert cache.get(TOPIC, _payload()) == {"data": {"models": [{"modelId": "m1"}]}}
+        assert cache.get(TOPIC, _payload()) == {"data": {"models": [{"modelId": "m1"}]}}
+        assert cache.stats()["disk_hits"] == 1
+        assert cache.stats()["hits"] == 1
+
+    def test_disk_tier_is_trimmed(self, tmp_path):
+        cache = QueryCache(directory=tmp_path, max_disk_bytes=300)
+        for i in range(10):
+            cache.put(TOPIC, _payload(modelId=str(i)), {"data": "x" * 50})
+
+        assert sum(path.stat().st_size for path in tmp_path.glob("*.json")) <= 300
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    with LoopbackBroker() as broker:
+        for name, value in broker.environment().items():
+            monkeypatch.setenv(name, value)
+        monkeypatch.setenv("GRIDAPPSD_USER", "system")
+        monkeypatch.setenv("GRIDAPPSD_PASSWORD", "manager")
+        yield broker
+
+
+def _count_requests(broker):
+    requests = []
+
+    def respond(headers, message):
+        requests.append(message["requestType"])
+        return {"data": message["requestType"]}
+
+    broker.add_responder(TOPIC, respond)
+    broker.add_responder(t.REQUEST_DATA + ".powergridmodel", respond)
+    return requests
+
+
+class TestCachedQueries:
+    def test_repeated_queries_are_answered_from_the_cache(self, broker):
+        requests = _count_requests(broker)
+        gapps = GridAPPSD(query_cache=QueryCache())
+        try:
+            for _ in range(3):
+                assert gapps.query_model_info() == {"data": "QUERY_MODEL_INFO"}
+                assert gapps.query_object_dictionary("m1", object_type="Breaker") == {"data": "QUERY_OBJECT_DICT"}
+                assert gapps.query_data("select ?s where {}") == {"data": "QUERY"}
+            assert gapps.query_model("m1") == {"data": "QUERY_MODEL"}
+            assert gapps.query_model("m1") == {"data": "QUERY_MODEL"}
+        finally:
+            gapps.disconnect()
+
+        assert sorted(requests) == ["QUERY", "QUERY_MODEL", "QUERY_MODEL", "QUERY_MODEL_INFO", "QUERY_OBJECT_DICT"]
+
+    def test_without_a_cache_every_query_is_sent(self, broker):
+        requests = _count_requests(broker)
+        gapps = GridAPPSD()
+        try:
+            assert gapps.query_cache is None
+            gapps.query_model_info()
+            gapps.query_model_info()
+        finally:
+            gapps.disconnect()
+
+        assert requests == ["QUERY_MODEL_INFO", "QUERY_MODEL_INFO"]
+
+    def test_asyncio_client_uses_the_cache(self, broker):
+        requests = _count_requests(broker)
+
+        async def main():
+            async with AsyncGridAPPSD(query_cache=QueryCache()) as gapps:
+                return [await gapps.query_object_types("m1") for _ in range(2)]
+
+        assert asyncio.run(main()) == [{"data": "QUERY_OBJECT_TYPES"}] * 2
+        assert requests == ["QUERY_OBJECT_TYPES"]
@@ -0,0 +1,166 @@
+import array
+import asyncio
+import math
+import re
+
+import pytest
+
+from gridappsd import GridAPPSD
+from gridappsd import topics as t
+from gridappsd.aio import AsyncGridAPPSD
+from gridappsd.columns import to_columns
+from gridappsd.houses import Houses
+from gridappsd.loopback import LoopbackBroker
+
+from helpers import wait_for
+
+QUERY = "SELECT ?name WHERE { ?s c:IdentifiedObject.name ?name } ORDER BY ?name"
+
+
+class _Blazegraph:
+    """A responder serving the LIMIT/OFFSET window of a fixed result set."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+        self.error = None
+
+    def __call__(self, headers, message):
+        query = message["queryString"]
+        self.queries.append(query)
+        if self.error is not None:
+            return {"error": {"message": self.error}}
+        match = re.search(r"LIMIT (\d+) OFFSET (\d+)$", query)
+        rows = self.rows
+        if match:
+            limit, offset = int(match.group(1)), int(match.group(2))
+            rows = rows[offset : offset + limit]
+        return {"data": {"head": {"vars": ["name"]}, "results": {"bindings": rows}}}
+
+
+def _rows(count):
+    return [{"name": {"type": "literal", "value": "node{:05d}".format(i)}} for i in range(count)]
+
+
+@pytest.fixture
+def blazegraph(monkeypatch):
+    with LoopbackBroker() as broker:
+        for name, value in broker.environment().items():
+            monkeypatch.setenv(name, value)
+        monkeypatch.setenv("GRIDAPPSD_USER", "system")
+        monkeypatch.setenv("GRIDAPPSD_PASSWORD", "manager")
+        responder = _Blazegraph(_rows(2500))
+        broker.add_responder(t.REQUEST_DATA + ".powergridmodel", responder)
+        yield responder
+
+
+@pytest.fixture
+def gapps(blazegraph):
+    gapps = GridAPPSD()
+    yield gapps
+    gapps.disconnect()
+
+
+class TestQueryDataIter:
+    def test_yields_every_row_in_order(self, blazegraph, gapps):
+        rows = list(gapps.query_data_iter(QUERY, page_size=1000))
+
+        assert rows == blazegraph.rows
+        assert [query.rpartition("\n")[2] for query in blazegraph.queries][:3] == [
+            "LIMIT 1000 OFFSET 0",
+            "LIMIT 1000 OFFSET 1000",
+            "LIMIT 1000 OFFSET 2000",
+        ]
+
+    def test_next_page_is_prefetched(self, blazegraph, gapps):
+        rows = gapps.query_data_iter(QUERY, page_size=1000)
+
+        assert next(rows) == blazegraph.rows[0]
+        assert wait_for(lambda: len(blazegraph.queries) == 2)
+        rows.close()
+
+    def test_a_full_last_page_ends_with_an_empty_one(self, blazegraph, gapps):
+        assert len(list(gapps.query_data_iter(QUERY, page_size=500, prefetch=0))) == 2500
+        assert len(blazegraph.queries) == 6
+
+    def test_rejects_queries_with_limit(self, gapps):
+        with pytest.raises(ValueError):
+            gapps.query_data_iter(QUERY + " LIMIT 10")
+
+    def test_error_responses_raise(self, blazegraph, gapps):
+        blazegraph.error = "Query syntax error"
+
+        with pytest.raises(ValueError):
+            list(gapps.query_data_iter(QUERY))
+
+    def test_asyncio_client_pages(self, blazegraph):
+        async def main():
+            async with AsyncGridAPPSD() as gapps:
+                return [row async for row in gapps.query_data_iter(QUERY, page_size=300, prefetch=2)]
+
+        assert asyncio.run(main()) == blazegraph.rows
+
+
+def _typed_result():
+    xsd = "http://www.w3.org/2001/XMLSchema#"
+    rows = [
+        {
+            "name": {"type": "literal", "value": "sw1"},
+            "ratedS": {"type": "literal", "value": "1.5"},
+            "count": {"type": "literal", "datatype": xsd + "integer", "value": "3"},
+            "open": {"type": "literal", "datatype": xsd + "boolean", "value": "true"},
+        },
+        {
+            "name": {"type": "literal", "value": "sw2"},
+            "count": {"type": "literal", "datatype": xsd + "integer", "value": "4"},
+            "open": {"type": "literal", "datatype": xsd + "boolean", "value": "false"},
+        },
+    ]
+    return {"data": {"head": {"vars": ["name", "ratedS", "count", "open"]}, "results": {"bindings": rows}}}
+
+
+class TestColumns:
+    def test_columns_without_numpy(self):
+        columns = to_columns(_typed_result(), dtypes={"ratedS": float}, use_numpy=False)
+
+        assert list(columns) == ["name", "ratedS", "count", "open"]
+        assert columns["name"].values == ["sw1", "sw2"]
+        assert columns["count"].values == array.array("q", [3, 4])
+        assert columns["open"].values == array.array("b", [1, 0])
+        assert columns["ratedS"].values[0] == 1.5
+        assert math.isnan(columns["ratedS"].values[1])
+        assert list(columns["ratedS"].mask) == [0, 1]
+        assert columns["ratedS"].to_list() == [1.5, None]
+
+    def test_columns_with_numpy(self):
+        numpy = pytest.importorskip("numpy")
+
+        columns = to_columns(_typed_result(), dtypes={"ratedS": "float"}, use_numpy=True)
+
+        assert columns["count"].values.dtype == numpy.int64
+        assert columns["ratedS"].values[~columns["ratedS"].mask].sum() == 1.5
+        assert columns["name"].to_list() == ["sw1", "sw2"]
+
+    def test_unconvertible_values_raise(self):
+        with pytest.raises(ValueError, match="name"):
+            to_columns(_typed_result(), dtypes={"name": int}, use_numpy=False)
+
+    def test_query_data_columns(self, blazegraph, gapps):
+        columns = gapps.query_data_columns(QUERY)
+
+        assert columns["name"].to_list() == [row["name"]["value"] for row in blazegraph.rows]
+
+    def test_houses_are_built_from_columns(self, blazegraph, gapps):
+        Houses.instance = None
+        blazegraph.rows = [
+            {"name": {"value": "house1"}, "id": {"value": "_1"}, "floorArea": {"value": "2000"}},
+            {"name": {"value": "house2"}, "id": {"value": "_2"}, "coolingSetpoint": {"value": "72"}},
+        ]
+        try:
+            houses = Houses(gapps).get_houses_for_feeder("_feeder")
+        finally:
+            Houses.instance = None
+
+        assert houses["house1"].floorArea == "2000"
+        assert houses["house1"].coolingSetpoint is None
+        assert houses["house2"].coolingSetpoint == "72"
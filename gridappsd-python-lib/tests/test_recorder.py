@@ -0,0 +1,140 @@
+import threading
+import time
+
+from gridappsd import GOSS
+from gridappsd.loopback import LoopbackBroker
+from gridappsd.message import MessageEnvelope
+from gridappsd.recorder import MAGIC, Recorder, SegmentWriter, read_messages
+
+
+class _FakeGapps:
+    def __init__(self):
+        self.callbacks = {}
+
+    def subscribe(self, topic, callback, raw=False):
+        assert raw
+        subscription = str(len(self.callbacks))
+        self.callbacks[subscription] = callback
+        return subscription
+
+    def unsubscribe(self, subscription):
+        del self.callbacks[subscription]
+
+    def deliver(self, destination, body, **headers):
+        headers["destination"] = destination
+        for callback in list(self.callbacks.values()):
+            callback(headers, MessageEnvelope(headers, body))
+
+
+def _write(directory, count, segment_bytes=1024 * 1024, start=1000.0):
+    writer = SegmentWriter(directory, segment_bytes=segment_bytes, index_interval=1.0)
+    for i in range(count):
+        writer.append(start + i * 0.5, {"destination": "/topic/a", "i": str(i)}, "body {}".format(i).encode())
+    writer.close()
+
+
+class TestRecording:
+    def test_round_trip(self, tmp_path):
+        _write(tmp_path, 3)
+
+        messages = list(read_messages(tmp_path))
+
+        assert [(m.timestamp, m.headers["i"], m.body) for m in messages] == [
+            (1000.0, "0", b"body 0"),
+            (1000.5, "1", b"body 1"),
+            (1001.0, "2", b"body 2"),
+        ]
+        assert messages[0].envelope().body == "body 0"
+
+    def test_segments_roll_over_and_start_seeks(self, tmp_path):
+        _write(tmp_path, 200, segment_bytes=1024)
+
+        assert len(list(tmp_path.glob("*.log"))) > 3
+        assert [m.headers["i"] for m in read_messages(tmp_path)] == [str(i) for i in range(200)]
+        assert [m.timestamp for m in read_messages(tmp_path, start=1050.0, end=1051.0)] == [1050.0, 1050.5, 1051.0]
+
+    def test_recording_continues_in_a_new_segment(self, tmp_path):
+        _write(tmp_path, 2)
+        _write(tmp_path, 2, start=2000.0)
+
+        assert sorted(path.name for path in tmp_path.glob("*.log")) == ["segment-000000.log", "segment-000001.log"]
+        assert [m.timestamp for m in read_messages(tmp_path)] == [1000.0, 1000.5, 2000.0, 2000.5]
+
+    def test_torn_record_ends_the_segment(self, tmp_path):
+        _write(tmp_path, 3)
+        log = tmp_path / "segment-000000.log"
+        log.write_bytes(log.read_bytes()[:-3])
+
+        assert [m.headers["i"] for m in read_messages(tmp_path)] == ["0", "1"]
+
+    def test_corrupt_record_ends_the_segment(self, tmp_path, caplog):
+        _write(tmp_path, 3)
+        log = tmp_path / "segment-000000.log"
+        data = bytearray(log.read_bytes())
+        data[-1] ^= 0xFF
+        log.write_bytes(bytes(data))
+
+        assert [m.headers["i"] for m in read_messages(tmp_path)] == ["0", "1"]
+        assert "Corrupt record" in caplog.text
+        assert data.startswith(MAGIC)
+
+
+class TestRecorder:
+    def test_records_raw_bodies(self, tmp_path):
+        gapps = _FakeGapps()
+        with Recorder(gapps, tmp_path, ["/topic/goss.gridappsd.>"]) as recorder:
+            gapps.deliver("/topic/goss.gridappsd.a", '{"x": 1}')
+            gapps.deliver("/topic/goss.gridappsd.b", b"\x00binary", **{"content-type": "application/msgpack"})
+            gapps.deliver("/topic/goss.gridappsd.c", "text", **{"content-encoding": "zlib"})
+
+        assert gapps.callbacks == {}
+        assert recorder.stats()["recorded"] == 3
+        messages = list(read_messages(tmp_path))
+        assert [m.body for m in messages] == [b'{"x": 1}', b"\x00binary", b"text"]
+        assert messages[1].envelope().raw == b"\x00binary"
+        assert "content-encoding" not in messages[2].headers
+
+    def test_full_buffer_drops_instead_of_blocking(self, tmp_path):
+        gapps = _FakeGapps()
+        recorder = Recorder(gapps, tmp_path, ["/topic/a"], max_buffer_bytes=3 * 300)
+        release = threading.Event()
+        append = recorder._writer.append
+        recorder._writer.append = lambda *args: (release.wait(), append(*args))
+        recorder.start()
+
+        start = time.perf_counter()
+        for _ in range(10):
+            gapps.deliver("/topic/a", "x" * 10)
+        elapsed = time.perf_counter() - start
+        release.set()
+        recorder.stop()
+
+        assert elapsed < 0.5
+        stats = recorder.stats()
+        assert stats["dropped"] > 0
+        assert stats["recorded"] + stats["dropped"] == 10
+        assert stats["buffered_bytes"] == 0
+
+    def test_records_through_a_broker(self, tmp_path, monkeypatch):
+        with LoopbackBroker() as broker:
+            for name, value in broker.environment().items():
+                monkeypatch.setenv(name, value)
+            monkeypatch.setenv("GRIDAPPSD_USER", "system")
+            monkeypatch.setenv("GRIDAPPSD_PASSWORD", "manager")
+            sender, listener = GOSS(), GOSS()
+            try:
+                recorder = Recorder(listener, tmp_path, ["/topic/goss.gridappsd.simulation.output.*"]).start()
+                time.sleep(0.1)
+                for i in range(100):
+                    sender.send("/topic/goss.gridappsd.simulation.output.123", {"i": i})
+                deadline = time.monotonic() + 5
+                while recorder.stats()["recorded"] < 100 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                recorder.stop()
+            finally:
+                sender.disconnect()
+                listener.disconnect()
+
+        messages = list(read_messages(tmp_path))
+        assert [m.envelope().body for m in messages] == [{"i": i} for i in range(100)]
+        assert messages[0].destination == "/topic/goss.gridappsd.simulation.output.123"
@@ -0,0 +1,81 @@
+import time
+
+import pytest
+
+from gridappsd.goss import CallbackRouter
+from gridappsd.recorder import SegmentWriter
+from gridappsd.replay import MAX_SPEED, Replayer, replace_element
+
+OUTPUT = "/topic/goss.gridappsd.simulation.output.123"
+LOG = "/topic/goss.gridappsd.simulation.log.123"
+
+
+@pytest.fixture
+def recording(tmp_path):
+    writer = SegmentWriter(tmp_path)
+    for i in range(5):
+        writer.append(1000.0 + i * 0.1, {"destination": OUTPUT, "subscription": "42"}, '{{"i": {}}}'.format(i).encode())
+    writer.append(1000.45, {"destination": LOG}, b'{"logMessage": "x"}')
+    writer.close()
+    return tmp_path
+
+
+class _Sender:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, topic, message):
+        self.sent.append((topic, message.raw))
+
+
+def test_replace_element():
+    remap = replace_element("123", "456")
+
+    assert remap(OUTPUT) == "/topic/goss.gridappsd.simulation.output.456"
+    assert remap("goss.gridappsd.123.x") == "goss.gridappsd.456.x"
+    assert remap("/queue/a.1234") == "/queue/a.1234"
+
+
+def test_replays_into_a_router_at_recorded_pace(recording):
+    router = CallbackRouter()
+    received = []
+    router.add_callback(
+        "/topic/goss.gridappsd.simulation.output.456", lambda headers, message: received.append(message)
+    )
+
+    stats = Replayer(recording, router, speed=1.0, remap=replace_element("123", "456")).run()
+
+    assert received == [{"i": i} for i in range(5)]
+    assert stats["replayed"] == 6
+    assert 0.4 <= stats["elapsed"] < 1.5
+
+
+def test_max_speed_and_skipped_destinations(recording):
+    sender = _Sender()
+
+    stats = Replayer(recording, sender, speed=MAX_SPEED, remap={LOG: None}).run()
+
+    assert sender.sent == [(OUTPUT, '{{"i": {}}}'.format(i)) for i in range(5)]
+    assert stats["skipped"] == 1
+    assert stats["elapsed"] < 0.4
+
+
+def test_faster_speed_shortens_the_replay(recording):
+    stats = Replayer(recording, _Sender(), speed=10).run()
+
+    assert 0.04 <= stats["elapsed"] < 0.3
+
+
+def test_stop_interrupts_a_replay(recording):
+    replayer = Replayer(recording, _Sender(), speed=0.01).start()
+    time.sleep(0.05)
+
+    replayer.stop()
+
+    assert replayer.wait(0)
+    assert replayer.stats()["replayed"] == 1
+
+
+def test_speed_must_be_positive(recording):
+    with pytest.raises(ValueError):
+        Replayer(recording, _Sender(), speed=0)
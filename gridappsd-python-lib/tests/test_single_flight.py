@@ -0,0 +1,154 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from gridappsd import GridAPPSD
+from gridappsd import topics as t
+from gridappsd.aio import AsyncGridAPPSD
+from gridappsd.goss import TimeoutError
+from gridappsd.loopback import LoopbackBroker
+from gridappsd.single_flight import SingleFlight, in_flight, request_key
+
+from helpers import wait_for
+
+
+class _Gate:
+    """A call that blocks until released, counting how often it ran."""
+
+    def __init__(self, result=None, error=None):
+        self.calls = 0
+        self.released = threading.Event()
+        self.result = result
+        self.error = error
+
+    def __call__(self, *args):
+        self.calls += 1
+        self.released.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def _concurrently(flight, count, key, fn, timeout=None):
+    """Call flight.do from count threads once one of them is in flight; return the futures."""
+    pool = ThreadPoolExecutor(count)
+    futures = [pool.submit(flight.do, key, fn, timeout)]
+    assert wait_for(lambda: flight.stats()["in_flight"] == 1)
+    futures += [pool.submit(flight.do, key, fn, timeout) for _ in range(count - 1)]
+    assert wait_for(lambda: flight.stats()["shared"] == count - 1)
+    pool.shutdown(wait=False)
+    return futures
+
+
+class TestSingleFlight:
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight()
+        gate = _Gate(result={"data": 1})
+
+        futures = _concurrently(flight, 8, "model", gate)
+        gate.released.set()
+
+        assert [future.result(2) for future in futures] == [{"data": 1}] * 8
+        assert gate.calls == 1
+        assert flight.stats() == dict(calls=1, shared=7, in_flight=0)
+
+    def test_errors_reach_every_caller(self):
+        flight = SingleFlight()
+        gate = _Gate(error=TimeoutError("no reply"))
+
+        futures = _concurrently(flight, 3, "model", gate)
+        gate.released.set()
+
+        for future in futures:
+            with pytest.raises(TimeoutError):
+                future.result(2)
+        assert gate.calls == 1
+
+    def test_waiting_callers_time_out(self):
+        flight = SingleFlight()
+        gate = _Gate(result=1)
+
+        futures = _concurrently(flight, 2, "model", gate, timeout=0.05)
+
+        with pytest.raises(TimeoutError):
+            futures[1].result(2)
+        gate.released.set()
+        assert futures[0].result(2) == 1
+
+    def test_calls_after_completion_run_again(self):
+        flight = SingleFlight()
+        calls = []
+
+        for _ in range(2):
+            flight.do("model", lambda: calls.append(1))
+
+        assert len(calls) == 2
+
+    def test_request_key_ignores_key_order_and_encoding(self):
+        assert request_key("a", {"x": 1, "y": 2}) == request_key("a", '{"y": 2, "x": 1}')
+        assert request_key("a", {"x": 1}) != request_key("b", {"x": 1})
+        assert request_key("a", "not json") == request_key("a", b"not json")
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    with LoopbackBroker() as broker:
+        for name, value in broker.environment().items():
+            monkeypatch.setenv(name, value)
+        monkeypatch.setenv("GRIDAPPSD_USER", "system")
+        monkeypatch.setenv("GRIDAPPSD_PASSWORD", "manager")
+        yield broker
+
+
+class TestSharedResponses:
+    def test_clients_of_one_broker_share_identical_queries(self, broker):
+        clients = [GridAPPSD() for _ in range(4)]
+        gate = _Gate(result={"data": "model"})
+        for client in clients:
+            client.get_response = gate
+        shared = in_flight.stats()["shared"]
+        try:
+            with ThreadPoolExecutor(8) as pool:
+                futures = [pool.submit(clients[i % 4].query_model, "m1") for i in range(8)]
+                assert wait_for(lambda: in_flight.stats()["shared"] == shared + 7)
+                gate.released.set()
+                assert [future.result(2) for future in futures] == [{"data": "model"}] * 8
+        finally:
+            for client in clients:
+                client.disconnect()
+
+        assert gate.calls == 1
+
+    def test_different_queries_are_not_shared(self, broker):
+        requests = []
+        broker.add_responder(t.REQUEST_POWERGRID_DATA, lambda headers, message: requests.append(message) or {})
+        gapps = GridAPPSD()
+        try:
+            gapps.query_model("m1")
+            gapps.query_model("m2")
+            gapps.query_model("m1")
+        finally:
+            gapps.disconnect()
+
+        assert [request["modelId"] for request in requests] == ["m1", "m2", "m1"]
+
+    def test_asyncio_client_shares_identical_queries(self, broker):
+        requests = []
+
+        def respond(headers, message):
+            requests.append(message)
+            return {"data": message["objectType"]}
+
+        broker.add_responder(t.REQUEST_POWERGRID_DATA, respond)
+
+        async def main():
+            async with AsyncGridAPPSD() as gapps:
+                return await asyncio.gather(
+                    *(gapps.query_object_dictionary("m1", object_type="Breaker") for _ in range(5)),
+                    gapps.query_object_dictionary("m1", object_type="Switch"),
+                )
+
+        assert asyncio.run(main()) == [{"data": "Breaker"}] * 5 + [{"data": "Switch"}]
+        assert sorted(request["objectType"] for request in requests) == ["Breaker", "Switch"]
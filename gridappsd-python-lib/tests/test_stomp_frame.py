@@ -0,0 +1,43 @@
+from gridappsd.stomp_frame import Frame, FrameParser, encode_frame
+
+
+class TestEncodeFrame:
+    def test_adds_content_length(self):
+        data = encode_frame(Frame("SEND", {"destination": "/topic/a"}, b"hello"))
+        assert data == b"SEND\ndestination:/topic/a\ncontent-length:5\n\nhello\x00"
+
+    def test_escapes_headers(self):
+        data = encode_frame(Frame("SEND", {"key": "a:b\nc"}))
+        assert b"key:a\\cb\\nc\n" in data
+
+    def test_connect_is_not_escaped(self):
+        data = encode_frame(Frame("CONNECT", {"login": "a:b"}))
+        assert b"login:a:b\n" in data
+
+
+class TestFrameParser:
+    def test_round_trip(self):
+        frame = Frame("MESSAGE", {"destination": "/queue/x", "odd": "a:b\\c"}, b'{"a": 1}')
+        parsed = FrameParser().feed(encode_frame(frame))
+        assert len(parsed) == 1
+        assert parsed[0].command == "MESSAGE"
+        assert parsed[0].headers["odd"] == "a:b\\c"
+        assert parsed[0].body == b'{"a": 1}'
+
+    def test_partial_feeds_and_heartbeats(self):
+        data = b"\n\r\n" + encode_frame(Frame("SEND", {"destination": "/topic/a"}, b"one")) + b"\n"
+        data += encode_frame(Frame("SEND", {"destination": "/topic/b"}, b"two"))
+        parser = FrameParser()
+        frames = []
+        for i in range(len(data)):
+            frames.extend(parser.feed(data[i : i + 1]))
+        assert [f.body for f in frames] == [b"one", b"two"]
+
+    def test_body_with_nul_uses_content_length(self):
+        parsed = FrameParser().feed(encode_frame(Frame("SEND", {}, b"a\x00b")))
+        assert parsed[0].body == b"a\x00b"
+
+    def test_body_without_content_length(self):
+        parsed = FrameParser().feed(b"MESSAGE\r\ndestination:/topic/a\r\n\r\nbody\x00")
+        assert parsed[0].headers == {"destination": "/topic/a"}
+        assert parsed[0].body == b"body"
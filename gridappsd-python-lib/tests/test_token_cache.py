@@ -0,0 +1,101 @@
+import base64
+import os
+import stat
+import threading
+import time
+
+from gridappsd import json_extension as json
+from gridappsd.token_cache import TokenCache, token_expiry, token_key
+
+
+def _jwt(claims):
+    payload = base64.urlsafe_b64encode(json.dumps(claims).encode()).rstrip(b"=").decode()
+    return "e30." + payload + ".sig"
+
+
+class TestTokenExpiry:
+    def test_uses_jwt_exp_claim(self):
+        assert token_expiry(_jwt({"sub": "system", "exp": 1234567890}), 60) == 1234567890
+
+    def test_falls_back_to_default_ttl(self):
+        before = time.time()
+        assert before + 60 <= token_expiry("opaque-token", 60) <= time.time() + 60
+        assert token_expiry(_jwt({"sub": "system"}), 60) >= before + 60
+        assert token_expiry("a.!!!.c", 60) >= before + 60
+
+
+class TestTokenCache:
+    def test_get_put_and_key_normalization(self):
+        cache = TokenCache()
+        cache.put(("localhost", 61613, "system"), "tok")
+
+        assert cache.get(("localhost", "61613", "system")) == "tok"
+        assert cache.get(("localhost", "61613", "other")) is None
+
+    def test_key_holds_a_password_digest(self):
+        key = token_key("localhost", 61613, "system", "manager")
+
+        assert key == token_key("localhost", "61613", "system", "manager")
+        assert key != token_key("localhost", 61613, "system", "wrong")
+        assert "manager" not in TokenCache._key(key)
+
+    def test_expired_tokens_are_not_returned(self):
+        cache = TokenCache()
+        cache.put("key", "old", expires=time.time() + 1)
+        assert cache.get("key") is None
+
+        cache.put("key", "jwt", expires=None)
+        assert cache.get("key") == "jwt"
+
+    def test_invalidate(self):
+        cache = TokenCache()
+        cache.put("key", "tok")
+        cache.invalidate("key")
+        assert cache.get("key") is None
+
+    def test_get_or_fetch_fetches_once(self):
+        cache = TokenCache()
+        calls = []
+        release = threading.Event()
+
+        def fetch():
+            calls.append(1)
+            release.wait(1)
+            return "tok"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_fetch("key", fetch))) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert calls == [1]
+        assert results == ["tok"] * 10
+
+    def test_failed_fetch_is_not_cached(self):
+        cache = TokenCache()
+        assert cache.get_or_fetch("key", lambda: None) is None
+        assert cache.get_or_fetch("key", lambda: "tok") == "tok"
+
+    def test_persistence(self, tmp_path):
+        path = str(tmp_path / "tokens.json")
+        cache = TokenCache(path=path)
+        cache.put(("localhost", 61613, "system"), "tok")
+        cache.put(("localhost", 61613, "stale"), "old", expires=time.time() - 1)
+
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+        other = TokenCache(path=path)
+        assert other.get(("localhost", "61613", "system")) == "tok"
+        assert other.get(("localhost", "61613", "stale")) is None
+
+        other.invalidate(("localhost", 61613, "system"))
+        assert TokenCache(path=path).get(("localhost", 61613, "system")) is None
+
+    def test_sees_tokens_persisted_by_other_processes(self, tmp_path):
+        path = str(tmp_path / "tokens.json")
+        cache = TokenCache(path=path)
+        TokenCache(path=path).put("key", "tok")
+
+        assert cache.get("key") == "tok"
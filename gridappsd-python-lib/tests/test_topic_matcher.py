@@ -0,0 +1,84 @@
+"""Unit tests for gridappsd.topic_matcher."""
+
+import pytest
+
+from gridappsd.topic_matcher import TopicMatcher, is_wildcard
+
+
+@pytest.mark.parametrize(
+    "pattern,destination,matches",
+    [
+        ("/topic/goss.gridappsd.field", "/topic/goss.gridappsd.field", True),
+        ("/topic/goss.gridappsd.field.*", "/topic/goss.gridappsd.field.feeder1", True),
+        ("/topic/goss.gridappsd.field.*", "/topic/goss.gridappsd.field.feeder1.output", False),
+        ("/topic/goss.gridappsd.field.*", "/topic/goss.gridappsd.field", False),
+        ("/topic/goss.gridappsd.*.output", "/topic/goss.gridappsd.field.output", True),
+        ("/queue/goss.gridappsd.process.request.>", "/queue/goss.gridappsd.process.request.data.log", True),
+        ("/queue/goss.gridappsd.process.request.>", "/queue/goss.gridappsd.process.request.field", True),
+        ("/queue/goss.gridappsd.process.request.>", "/queue/goss.gridappsd.process.request", False),
+        ("/queue/goss.gridappsd.process.request.>", "/topic/goss.gridappsd.process.request.field", False),
+    ],
+)
+def test_match(pattern, destination, matches):
+    matcher = TopicMatcher()
+    matcher.add(pattern, "value")
+
+    assert (matcher.match(destination) == ["value"]) is matches
+
+
+def test_match_collects_every_matching_pattern():
+    matcher = TopicMatcher()
+    matcher.add("/topic/a.b", "exact")
+    matcher.add("/topic/a.*", "one")
+    matcher.add("/topic/a.>", "rest")
+
+    assert sorted(matcher.match("/topic/a.b")) == ["exact", "one", "rest"]
+
+
+def test_cache_is_invalidated_when_patterns_change():
+    matcher = TopicMatcher()
+    matcher.add("/topic/a.*", "one")
+    assert matcher.match("/topic/a.b") == ["one"]
+
+    matcher.add("/topic/a.b", "exact")
+    assert sorted(matcher.match("/topic/a.b")) == ["exact", "one"]
+
+    matcher.remove("/topic/a.*", "one")
+    assert matcher.match("/topic/a.b") == ["exact"]
+
+
+def test_literal_patterns_keep_other_destinations_cached():
+    matcher = TopicMatcher()
+    matcher.add("/topic/a.*", "one")
+    matched = matcher.match("/topic/a.b")
+
+    matcher.add("/temp-queue/response.x", "reply")
+    matcher.remove("/temp-queue/response.x", "reply")
+
+    assert matcher.match("/topic/a.b") is matched
+    assert matcher.match("/temp-queue/response.x") == []
+
+
+def test_remove_prunes_empty_nodes():
+    matcher = TopicMatcher()
+    matcher.add("/topic/a.b.c", "value")
+    matcher.remove("/topic/a.b.c", "value")
+
+    assert matcher._roots == {}
+    assert matcher.match("/topic/a.b.c") == []
+
+
+def test_remove_unknown_pattern_is_ignored():
+    matcher = TopicMatcher()
+    matcher.add("/topic/a.b", "value")
+
+    matcher.remove("/topic/a.c", "value")
+    matcher.remove("/topic/a.b", "other")
+
+    assert matcher.match("/topic/a.b") == ["value"]
+
+
+def test_is_wildcard():
+    assert is_wildcard("/topic/goss.gridappsd.field.*")
+    assert is_wildcard("goss.gridappsd.process.request.>")
+    assert not is_wildcard("/topic/goss.gridappsd.field")
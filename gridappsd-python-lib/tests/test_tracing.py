@@ -0,0 +1,74 @@
+"""Unit tests for gridappsd.tracing."""
+
+import pytest
+
+from gridappsd import tracing
+from gridappsd.tracing import InMemoryExporter, Span, SpanExporter
+
+
+@pytest.fixture(autouse=True)
+def tracing_disabled_afterwards():
+    yield
+    tracing.disable()
+    tracing.set_current_span(None)
+
+
+class TestSpan:
+    def test_traceparent_round_trip(self):
+        span = Span("request", tracing.CLIENT, "/queue/a")
+
+        assert tracing.parse_traceparent(span.traceparent) == (span.trace_id, span.span_id)
+
+    @pytest.mark.parametrize("value", [None, "", "garbage", "00-abc-def-01"])
+    def test_invalid_traceparent(self, value):
+        assert tracing.parse_traceparent(value) is None
+
+    def test_spans_nest_under_the_current_span(self):
+        root = tracing.start_span("request", tracing.CLIENT, "/queue/a")
+        tracing.set_current_span(root)
+
+        child = tracing.start_span("request", tracing.CLIENT, "/queue/b")
+
+        assert child.trace_id == root.trace_id
+        assert child.parent_id == root.span_id
+
+    def test_consumer_span_continues_the_sender_trace(self):
+        sender = Span("send", tracing.PRODUCER, "/topic/a")
+
+        span = tracing.start_consumer_span({"destination": "/topic/a", "traceparent": sender.traceparent})
+
+        assert (span.trace_id, span.parent_id) == (sender.trace_id, sender.span_id)
+        assert tracing.start_consumer_span({"destination": "/topic/a"}) is None
+
+
+class TestExporters:
+    def test_finished_spans_are_exported(self):
+        exporter = tracing.enable()
+        span = Span("request", tracing.CLIENT, "/queue/a")
+        other = Span("request", tracing.CLIENT, "/queue/b")
+
+        span.finish(timed_out=False)
+        other.finish()
+
+        assert isinstance(exporter, InMemoryExporter)
+        assert exporter.trace(span.trace_id) == [span]
+        assert span.duration >= 0
+        assert span.as_dict()["attributes"] == {"timed_out": False}
+
+    def test_failing_exporter_is_logged(self, caplog):
+        class Failing(SpanExporter):
+            def export(self, span):
+                raise RuntimeError("down")
+
+        tracing.enable(Failing())
+
+        Span("request", tracing.CLIENT, "/queue/a").finish()
+
+        assert "exporter" in caplog.text
+
+    def test_in_memory_exporter_is_bounded(self):
+        exporter = InMemoryExporter(max_spans=2)
+        for _ in range(3):
+            exporter.export(Span("send", tracing.PRODUCER, "/topic/a"))
+
+        assert len(exporter.spans()) == 2